@@ -1,41 +1,307 @@
-import os
-
-# Specify the Omero directory on the Windows PC
-omero_dir = 'C:/Users/storm/Desktop/Omero/'
-
-# Specify the directory where the Fileset are stored
-source_dir = '230214 CHO-MR Epitope'
-
-# Loop through all Fileset directories
-dest_dir = omero_dir+source_dir
-all_dirs = os.listdir(dest_dir)
-
-for d in all_dirs:
-
-    # There should really be only directories named 'Fileset*****')
-    # If there is something else (for example an image file already copied) ignore it
-    if d[0] != 'F':
-        continue
-    src_path = dest_dir + '/' + d
-
-    # Now list all the files in a 'Fileset****' directory
-    # There should be only one image file
-
-    all_files = os.listdir(src_path)
-    if len(all_files) == 0:
-        print(f"Directory {d} does not contain a file.")
-        continue
-    elif len(all_files) != 1:
-        print(f"Directory {d} does contain multiple files. Cannot be right, we stop.")
-        exit()
-
-    for f in all_files:
-        file_to_move = src_path + '/' + f
-        dest_file = dest_dir + '/' + f
-        print(f"The file to move is {file_to_move} to {dest_file}")
-        os.rename(file_to_move, dest_file)
-
-    # Then delete the 'Fileset****' directory
-    del_dir = dest_dir + '/' + d
-    print(f"The directory to delete is {del_dir}")
-    os.rmdir(del_dir)
+'''
+Flatten an Omero export: every image comes in its own 'Fileset*' directory, and all images are wanted in one
+directory. The single file of every Fileset directory is moved up (or to a destination directory) and the empty
+Fileset directory is removed.
+
+The Fileset directories are handled concurrently on a pool of threads, as on network storage the time is spent
+waiting for the file server, not computing. Nothing stops the run: a Fileset directory that is empty, holds more
+than one file or a subdirectory, or whose file already exists at the destination is left alone and reported.
+The problems are listed at the end and written to a report file in the destination directory.
+
+Every move is recorded in a journal in the destination directory. A run that was interrupted can simply be started
+again: the Fileset directories that are left are handled, and a Fileset directory that was emptied but not removed
+is recognised from the journal and removed.
+
+When the destination is on another device (i.e. another network share), a file can not be renamed and is copied.
+The copy is written under a temporary name, its checksum is compared with that of the original, and only then it
+gets its name and the original is deleted.
+
+Usage: python MoveOmeroFiles.py <omero directory> [--destination DIRECTORY] [--workers N] [--dry-run]
+
+With --dry-run nothing is changed, the moves that would be made and the problems are only listed.
+'''
+
+import argparse
+import csv
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+journal_filename = 'MoveOmeroFiles-journal.jsonl'
+report_filename = 'MoveOmeroFiles-report.csv'
+partial_suffix = '.partial'
+default_workers = 16
+copy_block_size = 4 * 1024 * 1024
+
+
+# The outcome of one Fileset directory. status is 'moved', 'copied', 'resumed' or 'problem'.
+Outcome = namedtuple('Outcome', ['fileset', 'file', 'status', 'problem'])
+
+
+class Journal:
+
+    """
+    An append only file with a line per event, so that an interrupted run knows what happened before.
+    A move is recorded as 'started' before and as 'done' after it is made.
+    """
+
+    def __init__(self, filename, dry_run=False):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.started = {}
+        self.done = set()
+
+        complete = True
+        if os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    complete = line.endswith('\n')
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # The last line may be incomplete when the run was interrupted
+                        continue
+                    if event['state'] == 'started':
+                        self.started[event['fileset']] = event['file']
+                    elif event['state'] == 'done':
+                        self.done.add(event['fileset'])
+        self.file = None if dry_run else open(filename, 'a')
+        if self.file is not None and not complete:
+            # End the incomplete line, so that it does not spoil the next one
+            self.file.write('\n')
+
+    def Record(self, fileset, file, state):
+        if self.file is None:
+            return
+        line = json.dumps({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'fileset': fileset, 'file': file,
+                           'state': state})
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def StartedFile(self, fileset):
+
+        """
+        :return: the file of a fileset whose move was started but not finished in an earlier run, or None
+        """
+
+        return self.started.get(fileset) if fileset not in self.done else None
+
+    def Close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def FindFilesets(omero_directory):
+
+    """
+    :param omero_directory:
+    :return: the sorted names of the 'Fileset*' directories. Anything else (i.e. an image already moved) is ignored.
+    """
+
+    with os.scandir(omero_directory) as entries:
+        return sorted(entry.name for entry in entries
+                      if entry.name.startswith('Fileset') and entry.is_dir(follow_symlinks=False))
+
+
+def FileChecksum(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(copy_block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def CopyVerified(source, destination):
+
+    """
+    Copy a file to another device. The copy is made under a temporary name and the checksum of what was written
+    is compared with the checksum of the original, calculated while copying.
+    :param source:
+    :param destination:
+    :return: None if the copy is good and has its final name, otherwise a description of the problem
+    """
+
+    partial = destination + partial_suffix
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f_in, open(partial, 'wb') as f_out:
+        for block in iter(lambda: f_in.read(copy_block_size), b''):
+            digest.update(block)
+            f_out.write(block)
+        f_out.flush()
+        os.fsync(f_out.fileno())
+    shutil.copystat(source, partial)
+
+    if FileChecksum(partial) != digest.hexdigest():
+        os.remove(partial)
+        return 'the checksum of the copy differs from the original'
+    os.replace(partial, destination)
+    return None
+
+
+def FlattenFileset(omero_directory, fileset, destination_directory, journal, claimed, claimed_lock, dry_run):
+
+    """
+    Move the file of a Fileset directory to the destination directory and remove the Fileset directory
+    :param omero_directory: the directory with the Fileset directories
+    :param fileset: the name of the Fileset directory
+    :param destination_directory: where the file goes
+    :param journal: the Journal
+    :param claimed: the set of file names taken in this run, so that two filesets with the same file name do not
+                    overwrite each other
+    :param claimed_lock: the lock that guards claimed
+    :param dry_run: if True, nothing is changed
+    :return: an Outcome
+    """
+
+    fileset_path = os.path.join(omero_directory, fileset)
+    try:
+        with os.scandir(fileset_path) as entries:
+            entries = list(entries)
+    except OSError as e:
+        return Outcome(fileset, '', 'problem', f'can not be read: {e.strerror}')
+
+    directories = [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+    files = [entry.name for entry in entries if not entry.is_dir(follow_symlinks=False)]
+
+    if directories:
+        return Outcome(fileset, ', '.join(files), 'problem', f'contains directories: {", ".join(directories)}')
+    if len(files) > 1:
+        return Outcome(fileset, ', '.join(files), 'problem', f'contains {len(files)} files')
+
+    if len(files) == 0:
+        # An earlier run that was interrupted may have moved the file but not removed the directory
+        file = journal.StartedFile(fileset)
+        if file is None or not os.path.exists(os.path.join(destination_directory, file)):
+            return Outcome(fileset, '', 'problem', 'does not contain a file')
+        if not dry_run:
+            os.rmdir(fileset_path)
+            journal.Record(fileset, file, 'done')
+        return Outcome(fileset, file, 'resumed', '')
+
+    file = files[0]
+    source = os.path.join(fileset_path, file)
+    destination = os.path.join(destination_directory, file)
+
+    # An earlier run that was interrupted may have copied the file to another device, but not removed the original.
+    # A partial copy is simply made again, CopyVerified overwrites it.
+    if journal.StartedFile(fileset) == file and os.path.exists(destination):
+        if FileChecksum(source) != FileChecksum(destination):
+            return Outcome(fileset, file, 'problem', f'{destination} already exists and differs')
+        if not dry_run:
+            os.remove(source)
+            os.rmdir(fileset_path)
+            journal.Record(fileset, file, 'done')
+        return Outcome(fileset, file, 'resumed', '')
+
+    with claimed_lock:
+        if file in claimed or os.path.exists(destination):
+            return Outcome(fileset, file, 'problem', f'{destination} already exists')
+        claimed.add(file)
+
+    if dry_run:
+        print(f'Would move {source} to {destination}')
+        return Outcome(fileset, file, 'moved', '')
+
+    journal.Record(fileset, file, 'started')
+    status = 'moved'
+    try:
+        os.rename(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            return Outcome(fileset, file, 'problem', f'could not be moved: {e.strerror}')
+        # Another device, the file has to be copied
+        problem = CopyVerified(source, destination)
+        if problem is not None:
+            return Outcome(fileset, file, 'problem', problem)
+        os.remove(source)
+        status = 'copied'
+
+    try:
+        os.rmdir(fileset_path)
+    except OSError as e:
+        return Outcome(fileset, file, 'problem', f'the file is moved, but the directory not removed: {e.strerror}')
+    journal.Record(fileset, file, 'done')
+    return Outcome(fileset, file, status, '')
+
+
+def WriteReport(report_file, problems):
+    with open(report_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['FILESET', 'FILE', 'PROBLEM'])
+        for outcome in problems:
+            writer.writerow([outcome.fileset, outcome.file, outcome.problem])
+
+
+def FlattenFilesets(omero_directory, destination_directory=None, workers=default_workers, dry_run=False):
+
+    """
+    Flatten all Fileset directories, see the description of the module
+    :param omero_directory: the directory with the Fileset directories
+    :param destination_directory: where the files go, by default the omero directory itself
+    :param workers: the number of threads
+    :param dry_run: if True, nothing is changed
+    :return: the list of Outcomes
+    """
+
+    start_time = time.perf_counter()
+    destination_directory = destination_directory or omero_directory
+    if not os.path.isdir(omero_directory):
+        print(f'{omero_directory} is not a directory')
+        sys.exit()
+    if not dry_run:
+        os.makedirs(destination_directory, exist_ok=True)
+
+    filesets = FindFilesets(omero_directory)
+    journal = Journal(os.path.join(destination_directory, journal_filename), dry_run)
+    claimed = set()
+    claimed_lock = threading.Lock()
+    print(f'Found {len(filesets)} Fileset directories in {omero_directory}')
+
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(FlattenFileset, omero_directory, fileset, destination_directory, journal,
+                                   claimed, claimed_lock, dry_run) for fileset in filesets]
+        for i, future in enumerate(futures):
+            try:
+                outcome = future.result()
+            except OSError as e:
+                outcome = Outcome(filesets[i], '', 'problem', f'{e.strerror}: {e.filename}')
+            outcomes.append(outcome)
+            if (i + 1) % 500 == 0:
+                print(f'{i + 1}/{len(filesets)} Fileset directories done')
+    journal.Close()
+
+    problems = [outcome for outcome in outcomes if outcome.status == 'problem']
+    counts = {status: sum(outcome.status == status for outcome in outcomes)
+              for status in ('moved', 'copied', 'resumed', 'problem')}
+    verb = 'Would move' if dry_run else 'Moved'
+    print(f'\n{verb} {counts["moved"] + counts["copied"]} files ({counts["copied"]} copied to another device), '
+          f'finished {counts["resumed"]} interrupted moves, {counts["problem"]} problems, '
+          f'in {time.perf_counter() - start_time:.1f} s')
+    for outcome in problems:
+        print(f'{outcome.fileset}: {outcome.problem}')
+    if problems and not dry_run:
+        report_file = os.path.join(destination_directory, report_filename)
+        WriteReport(report_file, problems)
+        print(f'The problems are written to {report_file}')
+    return outcomes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move the files out of the Fileset directories of an Omero export')
+    parser.add_argument('omero_directory', help='the directory with the Fileset directories')
+    parser.add_argument('--destination', default=None, metavar='DIRECTORY',
+                        help='where the files go (default: the omero directory)')
+    parser.add_argument('--workers', type=int, default=default_workers, help='number of threads')
+    parser.add_argument('--dry-run', action='store_true', help='only list what would be done')
+    args = parser.parse_args()
+    FlattenFilesets(args.omero_directory, args.destination, args.workers, args.dry_run)
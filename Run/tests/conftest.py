@@ -0,0 +1,34 @@
+'''
+The tests run on small synthetic recordings made with tmSyntheticData.py, and compare the fast paths with the
+plain pandas way of doing the same.
+'''
+
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tmSyntheticData import GenerateRecording
+
+
+@pytest.fixture(scope='session')
+def generated_recording(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('generated')
+    return GenerateRecording(str(directory), 2000, taus=[0.1, 1.0], min_spots=2, untracked_fraction=0.1, seed=1)
+
+
+@pytest.fixture
+def recording(generated_recording, tmp_path):
+
+    """
+    A copy of the synthetic recording without binary cache: (tracks file, spots file)
+    """
+
+    files = []
+    for file in generated_recording:
+        files.append(str(tmp_path / os.path.basename(file)))
+        shutil.copy(file, files[-1])
+    return tuple(files)
@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+from tmAnalyse import Main
+
+
+def test_density_command(recording, tmp_path, capsys):
+    output = tmp_path / 'density.json'
+    Main(['density', recording[0], '--output', str(output)])
+
+    written = json.loads(output.read_text())
+    assert written['command'] == 'density'
+    assert written['parameters']['tracks'] == recording[0]
+    assert written['results']
+    assert capsys.readouterr().out == ''
+
+
+def test_unreadable_tracks_file_fails(tmp_path):
+    output = tmp_path / 'density.json'
+    with pytest.raises(SystemExit) as failure:
+        Main(['density', str(tmp_path / 'nonexistent.csv'), '--output', str(output)])
+    assert failure.value.code == 1
+    assert not output.exists()
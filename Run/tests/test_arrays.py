@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tmUtility import ReadTracksData, ReadSpotsData, TrackFilter, BuildTrackIndex, FindSpotsForTracks
+from tmUtility import CompileDuration, CalculateDensityMap, CalculateBoundingRectangles, RestrictTracksLength
+from tmUtility import TrackArrays, SpotArrays, ReadTrackArrays, ReadSpotArrays
+
+
+FILTERS = {
+    'length': lambda: TrackFilter().Length(3, 10),
+    'time': lambda: TrackFilter().Time(10, 80),
+    'time percentage': lambda: TrackFilter().TimePercentage(1, 99),
+    'speed': lambda: TrackFilter().Speed(0.01, 1),
+    'combined': lambda: TrackFilter().Length(3).TimePercentage(1, 99).Speed(-1, 1),
+}
+
+
+@pytest.mark.parametrize('name', FILTERS)
+def test_cached_filtered_read_equals_csv_read(recording, name):
+    tracks_file, _ = recording
+    from_csv = ReadTracksData(tracks_file, use_cache=False, track_filter=FILTERS[name]())
+    ReadTracksData(tracks_file)
+    from_cache = ReadTracksData(tracks_file, track_filter=FILTERS[name]())
+    assert list(from_cache.columns) == list(from_csv.columns)
+    pd.testing.assert_frame_equal(from_cache, from_csv, check_index_type=False)
+
+
+def test_cached_restricted_read_keeps_all_columns(recording):
+    tracks_file, _ = recording
+    ReadTracksData(tracks_file)
+    restricted = ReadTracksData(tracks_file, min_spots=3, min_time=1, max_time=99)
+    expected = RestrictTracksLength(ReadTracksData(tracks_file, use_cache=False), 3)
+    assert list(restricted.columns) == list(expected.columns)
+
+
+@pytest.mark.parametrize('use_cache', [False, True])
+def test_arrays_equal_dataframes(recording, use_cache):
+    tracks_file, spots_file = recording
+    tracks = ReadTracksData(tracks_file)
+    spots = ReadSpotsData(spots_file)
+    track_arrays = ReadTrackArrays(tracks_file, use_cache)
+    spot_arrays = ReadSpotArrays(spots_file, use_cache)
+
+    for name in track_arrays.columns:
+        np.testing.assert_array_equal(track_arrays[name], tracks[name].to_numpy())
+    assert spot_arrays.NrSpots() == spots['TRACK_ID'].notna().sum()
+    pd.testing.assert_frame_equal(spot_arrays.ToDataFrame(), SpotArrays(spots).ToDataFrame())
+
+
+def test_analyses_accept_arrays(recording):
+    tracks_file, spots_file = recording
+    tracks = ReadTracksData(tracks_file)
+    spots = ReadSpotsData(spots_file)
+    track_arrays = TrackArrays(tracks)
+    spot_arrays = SpotArrays(spots)
+
+    pd.testing.assert_frame_equal(CompileDuration(track_arrays), CompileDuration(tracks), check_dtype=False)
+    np.testing.assert_array_equal(CalculateDensityMap(track_arrays, 5), CalculateDensityMap(tracks, 5))
+
+    selected = TrackFilter().Length(3).TimePercentage(1, 99)
+    np.testing.assert_array_equal(selected.Apply(track_arrays)['TRACK_ID'],
+                                  selected.Apply(tracks)['TRACK_ID'].to_numpy())
+
+    some_tracks = tracks.iloc[::7]
+    expected = FindSpotsForTracks(some_tracks, spots).sort_values(['TRACK_ID', 'FRAME'])
+    found = FindSpotsForTracks(TrackArrays(some_tracks), spot_arrays)
+    np.testing.assert_array_equal(found['TRACK_ID'], expected['TRACK_ID'].to_numpy())
+    np.testing.assert_array_equal(found['POSITION_X'], expected['POSITION_X'].to_numpy())
+
+    pd.testing.assert_frame_equal(CalculateBoundingRectangles(spot_arrays), CalculateBoundingRectangles(spots),
+                                  check_dtype=False, check_index_type=False)
+    pd.testing.assert_frame_equal(CalculateBoundingRectangles(BuildTrackIndex(spots)),
+                                  CalculateBoundingRectangles(spots), check_dtype=False, check_index_type=False)
+
+
+def MergedSpots(tracks, spots):
+
+    """
+    The spots of the tracks as FindSpotsForTracks finds them in a dataframe, ordered as the index orders them
+    """
+
+    merged = FindSpotsForTracks(tracks, spots)
+    return merged.sort_values(['TRACK_ID', 'FRAME'], kind='stable').reset_index(drop=True)
+
+
+def test_spot_arrays_equal_merge(recording):
+    tracks_file, spots_file = recording
+    tracks = ReadTracksData(tracks_file, min_spots=3)
+    spots = ReadSpotsData(spots_file)
+    spot_arrays = SpotArrays(spots)
+
+    found = FindSpotsForTracks(tracks, spot_arrays)
+    expected = MergedSpots(tracks, spots)
+    assert found.NrSpots() == len(expected)
+    for name in found.columns:
+        np.testing.assert_allclose(found[name], expected[name].to_numpy(dtype=np.float64), rtol=1e-6, err_msg=name)
+    assert len(spot_arrays.SpotsForTracks([np.nan, -1])) == 0
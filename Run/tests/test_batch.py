@@ -0,0 +1,41 @@
+import os
+import shutil
+
+import pandas as pd
+
+from tmBatchAnalysis import FindRecordings, AnalyseExperiment, summary_filename
+from tmResultStore import ResultStore
+
+
+def test_find_recordings_matches_names_without_case(tmp_path):
+    for name in ['Cell1_Tracks.csv', 'Cell1_Spots.csv', 'cell2-tracks.csv', 'notes.csv']:
+        (tmp_path / name).write_text('')
+    os.makedirs(tmp_path / 'day2' / 'tracks.csv.cache')
+    (tmp_path / 'day2' / 'tracks.csv').write_text('')
+    (tmp_path / 'day2' / 'SPOTS.CSV').write_text('')
+
+    assert FindRecordings(str(tmp_path)) == [
+        (str(tmp_path / 'Cell1_Tracks.csv'), str(tmp_path / 'Cell1_Spots.csv')),
+        (str(tmp_path / 'cell2-tracks.csv'), None),
+        (str(tmp_path / 'day2' / 'tracks.csv'), str(tmp_path / 'day2' / 'SPOTS.CSV'))]
+
+
+def test_batch_summary_with_a_failed_recording(generated_recording, tmp_path):
+    experiment = tmp_path / 'experiment'
+    for day in ['day1', 'day2']:
+        os.makedirs(experiment / day)
+        for file in generated_recording:
+            shutil.copy(file, experiment / day)
+    os.makedirs(experiment / 'broken')
+    (experiment / 'broken' / 'tracks.csv').write_text('A,B\n1,2\n')
+    store_directory = str(tmp_path / 'store')
+
+    summary = AnalyseExperiment(str(experiment), workers=2, store_directory=store_directory)
+    assert list(summary['STATUS']) == ['FAILED', 'OK', 'OK']
+    assert 'Unexpected column names' in summary['ERROR'].iloc[0]
+    assert summary['NR_TRACKS'].iloc[1] == summary['NR_TRACKS'].iloc[2] > 0
+    assert summary['TAU_MS'].iloc[1] == summary['TAU_MS'].iloc[2]
+
+    written = pd.read_csv(experiment / summary_filename)
+    assert list(written['STATUS']) == ['FAILED', 'OK', 'OK']
+    assert ResultStore(store_directory).Recordings(min_spots=3) == ['day1_tracks', 'day2_tracks']
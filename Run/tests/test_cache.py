@@ -0,0 +1,30 @@
+import os
+
+import pandas as pd
+import pytest
+
+from tmUtility import ReadTracksData, ReadSpotsData, CACHE_SUFFIX
+
+
+@pytest.mark.parametrize('istrack', [True, False])
+def test_cache_round_trip(recording, istrack):
+    csvfilename = recording[0] if istrack else recording[1]
+    Read = ReadTracksData if istrack else ReadSpotsData
+    from_csv = Read(csvfilename, use_cache=False)
+    assert not os.path.exists(csvfilename + CACHE_SUFFIX)
+
+    written = Read(csvfilename)
+    assert os.path.exists(csvfilename + CACHE_SUFFIX)
+    from_cache = Read(csvfilename)
+    pd.testing.assert_frame_equal(written, from_csv)
+    pd.testing.assert_frame_equal(from_cache, from_csv, check_index_type=False)
+
+
+def test_cache_is_not_used_after_the_csv_changes(recording):
+    tracks_file, _ = recording
+    ReadTracksData(tracks_file)
+    with open(tracks_file) as f:
+        lines = f.readlines()
+    with open(tracks_file, 'w') as f:
+        f.writelines(lines[:-10])
+    assert len(ReadTracksData(tracks_file)) == len(ReadTracksData(tracks_file, use_cache=False))
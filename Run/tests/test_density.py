@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import tmUtility
+from tmUtility import ReadTracksData, CalculateDensityMap, CalculateDensityCube, CalculateDensityMovie
+
+
+def DenseCube(tracks, magnification, time_bin):
+
+    """
+    The cube as it used to be made, as one dense array indexed [t][x][y]
+    """
+
+    x = np.floor(tracks['TRACK_X_LOCATION'].to_numpy(dtype=np.float64) * magnification).astype(np.int64)
+    y = np.floor(tracks['TRACK_Y_LOCATION'].to_numpy(dtype=np.float64) * magnification).astype(np.int64)
+    t = np.floor(tracks['TRACK_START'].to_numpy(dtype=np.float64) / time_bin).astype(np.int64)
+    nx = ny = 81 * magnification + 1
+    inside = (x >= 0) & (x < nx) & (y >= 0) & (y < ny) & (t >= 0)
+    cube = np.zeros((t[inside].max() + 1, nx, ny), dtype=np.int32)
+    np.add.at(cube, (t[inside], x[inside], y[inside]), 1)
+    return cube
+
+
+@pytest.mark.parametrize('window, step', [(10, 1), (10, 3), (5, 5), (4, 7)])
+def test_movie_equals_dense_windows(recording, window, step):
+    tracks = ReadTracksData(recording[0], min_spots=3)
+    dense = DenseCube(tracks, 2, 1.0)
+    cube = CalculateDensityCube(tracks, 2, time_bin=1.0)
+    assert (cube.Dense() == dense).all()
+    assert (cube.Counts(0, len(cube)) == CalculateDensityMap(tracks, 2)).all()
+
+    movie = CalculateDensityMovie(cube, window, step)
+    assert movie.dtype == np.uint16
+    assert len(movie) == (len(dense) - window) // step + 1
+    for i in range(len(movie)):
+        assert (movie[i] == dense[i * step:i * step + window].sum(axis=0)).all()
+
+
+def test_movie_to_file_equals_movie_in_memory(recording, tmp_path):
+    cube = CalculateDensityCube(ReadTracksData(recording[0]), 1, time_bin=0.5)
+    filename = str(tmp_path / 'movie.npy')
+    CalculateDensityMovie(cube, 8, 2, filename=filename)
+    assert (np.load(filename, mmap_mode='r') == CalculateDensityMovie(cube, 8, 2)).all()
+
+
+def test_tracks_before_zero_are_outside_the_time_range(recording, capsys):
+    tracks = ReadTracksData(recording[0])
+    tracks.loc[tracks.index[:5], 'TRACK_START'] = -1.0
+    cube = CalculateDensityCube(tracks, 1)
+    assert len(cube.squares) == len(tracks) - 5
+    output = capsys.readouterr().out
+    assert '5 tracks start before 0 s, outside the time range' in output
+    assert 'outside the 81 by 81 micrometer image' not in output
+
+
+def test_window_longer_than_recording_gives_no_maps(recording):
+    cube = CalculateDensityCube(ReadTracksData(recording[0]), 1)
+    assert len(CalculateDensityMovie(cube, len(cube) + 1)) == 0
+
+
+def test_movie_over_the_memory_limit_is_refused(recording, monkeypatch):
+    cube = CalculateDensityCube(ReadTracksData(recording[0]), 1, time_bin=0.1)
+    monkeypatch.setattr(tmUtility, 'density_movie_memory', 1024 ** 2)
+    with pytest.raises(SystemExit):
+        CalculateDensityMovie(cube, 1)
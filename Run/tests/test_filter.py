@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from tmUtility import ReadTracksData, TrackFilter, RestrictTracksLength, RestrictTracksTime
+
+
+@pytest.mark.parametrize('use_cache', [False, True])
+def test_pushdown_equals_restrict_functions(recording, use_cache):
+    tracks_file, _ = recording
+    tracks = ReadTracksData(tracks_file, use_cache=False)
+    if use_cache:
+        ReadTracksData(tracks_file)
+
+    expected = RestrictTracksTime(RestrictTracksLength(tracks, 3, 10), 10, 80)
+    pushed = ReadTracksData(tracks_file, use_cache=use_cache, track_filter=TrackFilter().Length(3, 10).Time(10, 80))
+    np.testing.assert_array_equal(pushed['TRACK_ID'].to_numpy(), expected['TRACK_ID'].to_numpy())
+
+    # min_time and max_time are a percentage of the latest TRACK_STOP of the tracks that are long enough
+    long_enough = RestrictTracksLength(tracks, 3)
+    last_stop = long_enough['TRACK_STOP'].max()
+    expected = RestrictTracksTime(long_enough, last_stop * 1 / 100, last_stop * 99 / 100)
+    restricted = ReadTracksData(tracks_file, min_spots=3, min_time=1, max_time=99, use_cache=use_cache)
+    np.testing.assert_array_equal(restricted['TRACK_ID'].to_numpy(), expected['TRACK_ID'].to_numpy())
+
+
+def test_filter_apply_equals_restrict_functions(recording):
+    tracks = ReadTracksData(recording[0], use_cache=False)
+    expected = RestrictTracksTime(RestrictTracksLength(tracks, -1, 8), 5, 90)
+    filtered = TrackFilter().Length(-1, 8).Time(5, 90).Apply(tracks)
+    np.testing.assert_array_equal(filtered.index.to_numpy(), expected.index.to_numpy())
+    assert TrackFilter().Apply(tracks) is tracks
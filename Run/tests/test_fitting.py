@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import scipy.optimize
+
+from tmUtility import ReadTracksData, CompileDuration
+from tmFitting import FitMonoExpBatch, BootstrapDuration, InitialGuess, MonoExpJacobian, StackHistograms, monoExp
+
+
+def test_batch_fit_equals_curve_fit(recording):
+    tracks = ReadTracksData(recording[0])
+    histograms = [CompileDuration(tracks.iloc[i::3]) for i in range(3)]
+    x, Y = StackHistograms(histograms)
+
+    batch = FitMonoExpBatch(x, Y)
+    for i, y in enumerate(Y):
+        (m, t, b), _ = scipy.optimize.curve_fit(monoExp, x, y, InitialGuess(x, y), jac=MonoExpJacobian)
+        np.testing.assert_allclose([batch.m[i], batch.t[i], batch.b[i]], [m, t, b], rtol=1e-4, atol=1e-6)
+
+
+def test_bootstrap_does_not_depend_on_the_number_of_workers(recording):
+    histogram = CompileDuration(ReadTracksData(recording[0], min_spots=3))
+    in_process = BootstrapDuration(histogram, 600, seed=7, chunk_size=250)
+    in_pool = BootstrapDuration(histogram, 600, seed=7, workers=2, chunk_size=250)
+    np.testing.assert_array_equal(in_process.taus, in_pool.taus)
+    assert len(in_process.taus) == 600
+    assert in_process.tau_low <= in_process.tau <= in_process.tau_high
+
+    other_seed = BootstrapDuration(histogram, 600, seed=8, chunk_size=250)
+    assert not np.array_equal(other_seed.taus, in_process.taus)
+
+
+@pytest.mark.parametrize('nr_replicates', [0, -1])
+def test_bootstrap_without_replicates(recording, nr_replicates):
+    histogram = CompileDuration(ReadTracksData(recording[0], min_spots=3))
+    assert BootstrapDuration(histogram, nr_replicates) is None
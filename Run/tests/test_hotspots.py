@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tmUtility import ReadTracksData
+from tmHotspots import FindHotspots, PIXEL_DIMENSION
+from tmSession import AnalysisSession
+
+
+SITE_COLUMNS = ['X', 'Y', 'NR_EVENTS', 'FIRST_START', 'LAST_START', 'MEAN_DURATION', 'TOTAL_DURATION',
+                'FIRST_EVENT']
+
+
+def test_sites_per_pixel_equal_groupby(recording):
+    tracks = ReadTracksData(recording[0], min_spots=3)
+    sites, events = FindHotspots(tracks)
+
+    pixel_x = np.round(tracks['TRACK_X_LOCATION'].to_numpy(dtype=np.float64) / PIXEL_DIMENSION).astype(np.int64)
+    pixel_y = np.round(tracks['TRACK_Y_LOCATION'].to_numpy(dtype=np.float64) / PIXEL_DIMENSION).astype(np.int64)
+    expected = pd.DataFrame({'PIXEL_X': pixel_x, 'PIXEL_Y': pixel_y}).value_counts()
+
+    found = sites.set_index(['PIXEL_X', 'PIXEL_Y'])['NR_EVENTS']
+    assert found.sum() == len(tracks) == len(events)
+    assert (found.sort_index() == expected.sort_index()).all()
+    assert (np.diff(sites['NR_EVENTS']) <= 0).all()
+
+
+def test_session_hotspots_from_the_shared_pixels(recording):
+    session = AnalysisSession(recording[0], use_cache=False)
+    for min_spots in [3, 5]:
+        sites, events = session.Hotspots(min_spots=min_spots, min_time=-1, max_time=-1)
+        expected_sites, expected_events = FindHotspots(ReadTracksData(recording[0], min_spots=min_spots))
+        pd.testing.assert_frame_equal(sites, expected_sites)
+        pd.testing.assert_frame_equal(events, expected_events)
+
+
+@pytest.mark.parametrize('cluster_radius', [None, 0.1])
+def test_no_tracks_gives_empty_sites_with_all_columns(recording, cluster_radius):
+    tracks = ReadTracksData(recording[0]).iloc[:0]
+    sites, events = FindHotspots(tracks, cluster_radius=cluster_radius)
+    assert len(sites) == 0 and len(events) == 0
+    assert set(SITE_COLUMNS) <= set(sites.columns)
+    assert ('PIXEL_X' in sites.columns) == (cluster_radius is None)
+    assert 'SITE' in events.columns
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from tmUtility import ReadTracksData, ReadSpotsData, BuildTrackIndex, FindSpotsForTracks
+from tmUtility import TRACK_INDEX_SUFFIX
+
+
+def MergedSpots(tracks, spots):
+
+    """
+    The spots of the tracks as FindSpotsForTracks finds them in a dataframe, ordered as the index orders them
+    """
+
+    merged = FindSpotsForTracks(tracks, spots)
+    return merged.sort_values(['TRACK_ID', 'FRAME'], kind='stable').reset_index(drop=True)
+
+
+def test_index_equals_merge(recording):
+    tracks_file, spots_file = recording
+    tracks = ReadTracksData(tracks_file, min_spots=3)
+    spots = ReadSpotsData(spots_file)
+    index = BuildTrackIndex(spots, spots_file)
+
+    pd.testing.assert_frame_equal(FindSpotsForTracks(tracks, index), MergedSpots(tracks, spots))
+    assert len(index) == spots['TRACK_ID'].nunique()
+
+
+def test_spots_of_one_track(recording):
+    _, spots_file = recording
+    spots = ReadSpotsData(spots_file)
+    index = BuildTrackIndex(spots)
+    for track_id in spots['TRACK_ID'].dropna().unique()[:20]:
+        expected = spots.loc[spots['TRACK_ID'] == track_id].sort_values('FRAME', kind='stable')
+        np.testing.assert_array_equal(index.Spots(track_id)['FRAME'].to_numpy(), expected['FRAME'].to_numpy())
+    assert len(index.Spots(-1)) == 0
+
+
+def test_saved_index_is_reused_until_the_csv_changes(recording):
+    _, spots_file = recording
+    spots = ReadSpotsData(spots_file)
+    built = BuildTrackIndex(spots, spots_file)
+    assert os.path.exists(spots_file + TRACK_INDEX_SUFFIX)
+    np.testing.assert_array_equal(BuildTrackIndex(spots, spots_file).order, built.order)
+
+    spots = spots.iloc[:-100]
+    with open(spots_file, 'a') as f:
+        f.write('\n')
+    pd.testing.assert_frame_equal(BuildTrackIndex(spots, spots_file).spots, BuildTrackIndex(spots).spots)
+
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from tmSyntheticData import GenerateRecording
+from tmUtility import ReadTracksData
+from tmLifetime import FitLifetimes, FitLifetime, CountFrames, SelectModel
+
+
+FRAME_TIME = 0.05
+TAUS = np.array([0.1, 1.0])
+
+
+@pytest.fixture(scope='module')
+def durations(tmp_path_factory):
+    tracks_file, _ = GenerateRecording(str(tmp_path_factory.mktemp('lifetimes')), 5000, frame_time=FRAME_TIME,
+                                       taus=TAUS, min_spots=2, seed=3)
+    return ReadTracksData(tracks_file, use_cache=False)['TRACK_DURATION'].to_numpy()
+
+
+def test_two_lifetimes_are_recovered(durations):
+    fits = FitLifetimes(durations, max_components=3, min_spots=2)
+    assert [fit.components for fit in fits] == [1, 2, 3]
+    assert SelectModel(fits, 'bic').components == 2
+
+    # The tracks are generated with equal weights, the fit gives the weights before the tracks shorter than one
+    # frame are left out, which are larger for the short lifetime
+    weights = 0.5 / np.exp(-FRAME_TIME / TAUS)
+    weights /= weights.sum()
+    fit = fits[1]
+    np.testing.assert_allclose(fit.taus, TAUS, rtol=0.1)
+    np.testing.assert_allclose(fit.weights, weights, atol=0.05)
+    assert fit.nr_tracks == len(durations)
+    assert fit.bic < fits[0].bic and fit.aic < fits[0].aic
+
+
+def test_minimum_above_all_durations(durations):
+    counts, frame_time = CountFrames(durations, FRAME_TIME)
+    assert FitLifetime(counts, frame_time, 1, k_min=len(counts)) is None
+    assert FitLifetimes(durations, min_spots=len(counts) + 1) is None
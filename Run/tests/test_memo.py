@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from tmMemo import MemoCache, MemoKey, NormalizeValue
+
+
+def test_parameters_that_mean_the_same_give_the_same_key(recording):
+    tracks_file, _ = recording
+    assert NormalizeValue({'min_time': 1.0, 'range': (np.int64(3), 2.5)}) == {'min_time': 1, 'range': [3, 2.5]}
+    assert MemoKey('Density', [tracks_file], {'min_spots': 3}) == MemoKey('Density', [tracks_file], {'min_spots': 3.0})
+    keys = {MemoKey(name, [tracks_file], {'min_spots': min_spots})[0]
+            for name, min_spots in [('Density', 3), ('Density', 4), ('Durations', 3)]}
+    assert len(keys) == 3
+
+
+def test_result_is_calculated_once_until_the_source_changes(recording):
+    tracks_file, _ = recording
+    cache = MemoCache()
+    calls = []
+
+    def Calculate():
+        calls.append(1)
+        return np.arange(10)
+
+    cache.Memoize('Calculate', [tracks_file], {'min_spots': 3}, Calculate)
+    cache.Memoize('Calculate', [tracks_file], {'min_spots': 3.0}, Calculate)
+    assert len(calls) == 1
+
+    stat = os.stat(tracks_file)
+    os.utime(tracks_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    cache.Memoize('Calculate', [tracks_file], {'min_spots': 3}, Calculate)
+    assert len(calls) == 2
+
+
+def test_least_recently_used_is_evicted(recording):
+    tracks_file, _ = recording
+    cache = MemoCache(max_bytes=2500)
+    for name in ['a', 'b', 'c']:
+        cache.Memoize(name, [tracks_file], {}, lambda: np.zeros(100))
+    cache.Memoize('a', [tracks_file], {}, lambda: np.zeros(100))
+    cache.Memoize('d', [tracks_file], {}, lambda: np.zeros(100))
+
+    kept = {MemoKey(name, [tracks_file], {})[0] for name in ['a', 'c', 'd']}
+    assert set(cache.entries) == kept
+    assert cache.Statistics()['evictions'] == 1
+    assert cache.nr_bytes <= cache.max_bytes
+
+
+def test_results_survive_on_disk(recording, tmp_path):
+    tracks_file, _ = recording
+    directory = str(tmp_path / 'memo')
+    MemoCache(directory=directory).Memoize('Calculate', [tracks_file], {'x': 1}, lambda: np.arange(5))
+
+    cache = MemoCache(directory=directory)
+    value = cache.Memoize('Calculate', [tracks_file], {'x': 1}, lambda: None)
+    np.testing.assert_array_equal(value, np.arange(5))
+    assert cache.Statistics()['disk_hits'] == 1
+
+    cache.Memoize('Other', [tracks_file], {}, lambda: np.arange(5), persist=False)
+    assert len(cache.DiskEntries()) == 1
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import tmUtility
+from tmUtility import ReadTracksData, ReadTrackMateHeader, TrackMateSchema, ParseTrackMateCsv, SetIntegerDtypes
+
+
+def PlainRead(csvfilename):
+
+    """
+    The file as pandas reads it without any of the options of the readers
+    """
+
+    return pd.read_csv(csvfilename, header=0, skiprows=[1, 2, 3])
+
+
+def AssertSameValues(tmd, plain):
+    for column in tmd.columns:
+        if plain[column].dtype == object or pd.api.types.is_string_dtype(plain[column]):
+            assert (tmd[column].astype(str) == plain[column].astype(str)).all(), column
+            continue
+        np.testing.assert_allclose(tmd[column].to_numpy(dtype=np.float64, na_value=np.nan),
+                                   plain[column].to_numpy(dtype=np.float64), rtol=1e-6, err_msg=column)
+
+
+@pytest.mark.parametrize('istrack', [True, False])
+@pytest.mark.parametrize('engine', ['pyarrow', 'c'])
+def test_parsers_equal_plain_pandas(recording, istrack, engine):
+    if engine == 'pyarrow':
+        pytest.importorskip('pyarrow')
+    csvfilename = recording[0] if istrack else recording[1]
+    usecols, dtype = TrackMateSchema(csvfilename, istrack)
+    tmd = ParseTrackMateCsv(csvfilename, usecols, dtype, engine)
+    SetIntegerDtypes(tmd)
+
+    header = ReadTrackMateHeader(csvfilename)
+    assert list(tmd.columns) == [header[i] for i in usecols]
+    AssertSameValues(tmd, PlainRead(csvfilename))
+    if not istrack:
+        assert tmd['TRACK_ID'].dtype == 'Int32'
+
+
+def test_c_parser_is_used_without_pyarrow(recording, monkeypatch):
+    tracks_file, _ = recording
+    expected = ReadTracksData(tracks_file, use_cache=False)
+    monkeypatch.setattr(tmUtility, 'PARSER_ENGINE', 'c')
+    pd.testing.assert_frame_equal(ReadTracksData(tracks_file, use_cache=False), expected)
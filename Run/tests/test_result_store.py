@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from tmResultStore import ResultStore
+
+
+def Histogram(durations, frequencies):
+    return pd.DataFrame({'Frequency': frequencies}, index=pd.Index(durations, name='TRACK_DURATION'))
+
+
+def test_round_trip(tmp_path):
+    store = ResultStore(str(tmp_path))
+    first = np.arange(12).reshape(3, 4)
+    second = np.ones((3, 4), dtype=np.int64)
+    store.Save('day1/cell1', density=first, histogram=Histogram([0.1, 0.2], [5, 3]), meta={'magnification': 5})
+    store.Save('day1/cell2', density=second, histogram=Histogram([0.2, 0.3], [2, 7]), meta={'magnification': 5})
+    store.Save('day2/cell1', density=np.zeros((6, 8), dtype=np.int64), meta={'magnification': 10})
+
+    assert store.Recordings() == ['day1/cell1', 'day1/cell2', 'day2/cell1']
+    selected = store.Recordings(magnification=5)
+    assert selected == ['day1/cell1', 'day1/cell2']
+    assert store.Meta('day2/cell1') == {'magnification': 10}
+
+    np.testing.assert_array_equal(store.DensityMap('day1/cell1'), first)
+    np.testing.assert_array_equal(store.SumDensityMaps(selected), first + second)
+    np.testing.assert_allclose(store.SumDensityMaps(selected, average=True), (first + second) / 2)
+
+    # The bins of the histograms differ, the frequencies of the bins they share are added
+    combined = store.SumDurationHistograms()
+    pd.testing.assert_frame_equal(combined, Histogram([0.1, 0.2, 0.3], [5, 5, 7]))
+    pd.testing.assert_frame_equal(store.DurationHistogram('day1/cell2'), Histogram([0.2, 0.3], [2, 7]))
+
+
+def test_save_replaces_earlier_results(tmp_path):
+    store = ResultStore(str(tmp_path))
+    store.Save('cell1', density=np.zeros((2, 2), dtype=np.int64), histogram=Histogram([0.1], [1]), meta={'min_spots': 3})
+    store.Save('cell1', density=np.ones((2, 2), dtype=np.int64), meta={'min_spots': 4})
+
+    assert store.Recordings() == ['cell1']
+    assert store.Recordings(min_spots=3) == []
+    assert store.Description('cell1')['arrays'] == ['density']
+    np.testing.assert_array_equal(store.DensityMap('cell1'), np.ones((2, 2)))
+    assert sorted(os.listdir(tmp_path)) == ['cell1']
+
+
+def test_interrupted_save_keeps_earlier_results(tmp_path):
+    store = ResultStore(str(tmp_path))
+    store.Save('cell1', density=np.ones((2, 2), dtype=np.int64))
+
+    # As if a save stopped after moving the results aside: they are still there, and not listed twice
+    store.Save('cell2', density=np.zeros((2, 2), dtype=np.int64))
+    os.replace(store.RecordingDirectory('cell2'), store.RecordingDirectory('cell2') + '.old')
+    os.makedirs(store.RecordingDirectory('cell3') + '.tmp')
+    assert store.Recordings() == ['cell1']
+    assert os.path.exists(os.path.join(store.RecordingDirectory('cell2') + '.old', 'density.npy'))
+    np.testing.assert_array_equal(store.SumDensityMaps(), np.ones((2, 2)))
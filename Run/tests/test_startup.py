@@ -0,0 +1,19 @@
+import pytest
+
+from tmStartupTime import MeasureImport, CHECKED_MODULES, BASELINE
+
+
+BUDGET = 0.25
+REPEAT = 3
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    return MeasureImport(BASELINE, REPEAT)[0]
+
+
+@pytest.mark.parametrize('module', CHECKED_MODULES)
+def test_module_starts_fast(module, baseline):
+    elapsed, loaded = MeasureImport(f'import {module}', REPEAT)
+    assert loaded == [], f'import {module} loads {", ".join(loaded)}'
+    assert elapsed <= baseline + BUDGET, f'import {module} takes {elapsed - baseline:.3f} s over numpy and pandas'
@@ -0,0 +1,41 @@
+import os
+import shutil
+
+import pandas as pd
+
+from tmBatchAnalysis import summary_filename
+from tmWatch import Watcher, state_filename
+
+
+def test_run_twice_on_unchanged_content(generated_recording, tmp_path, capsys):
+    experiment = tmp_path / 'experiment'
+    os.makedirs(experiment / 'day1')
+    for file in generated_recording:
+        shutil.copy(file, experiment / 'day1')
+
+    Watcher(str(experiment)).Run(workers=1, once=True)
+    assert (experiment / state_filename).exists()
+    summary = pd.read_csv(experiment / summary_filename)
+    assert list(summary['STATUS']) == ['OK']
+    assert 'OK' in capsys.readouterr().out
+
+    # A new modification time with the same content is recognised from the hashes in the state file
+    tracks_file = experiment / 'day1' / os.path.basename(generated_recording[0])
+    stat = os.stat(tracks_file)
+    os.utime(tracks_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    Watcher(str(experiment)).Run(workers=1, once=True)
+    assert f'Unchanged {tracks_file}' in capsys.readouterr().out
+    assert list(pd.read_csv(experiment / summary_filename)['STATUS']) == ['OK']
+
+
+def test_scan_forgets_recordings_that_are_removed(generated_recording, tmp_path):
+    for file in generated_recording:
+        shutil.copy(file, tmp_path)
+    watcher = Watcher(str(tmp_path))
+
+    assert watcher.Scan(0.0) == []
+    assert list(watcher.candidates) == [str(tmp_path / os.path.basename(generated_recording[0]))]
+    for file in generated_recording:
+        os.remove(tmp_path / os.path.basename(file))
+    assert watcher.Scan(1.0) == []
+    assert watcher.candidates == {}
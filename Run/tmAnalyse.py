@@ -0,0 +1,405 @@
+'''
+One command line entry point for the analyses, so that they can run unattended, i.e. from a scheduler.
+
+    python tmAnalyse.py duration    <tracks.csv> [--min-spots 3] [--bootstrap 1000] ...
+    python tmAnalyse.py density     <tracks.csv> [--magnification 5] [--cutoff 0.2] [--area 100] ...
+    python tmAnalyse.py hotspots    <tracks.csv> [--radius 0.1] [--top 10] ...
+    python tmAnalyse.py bbox        <tracks.csv> [--spots spots.csv] [--min-length 10] [--max-length 20]
+    python tmAnalyse.py plot-tracks <tracks.csv> [--spots spots.csv] [--square 15 0 70 75] ...
+    python tmAnalyse.py report      <tracks.csv> [--spots spots.csv] [--analyses duration density] ...
+
+The report command runs several analyses with their standard settings on a single read of the recording, see
+tmSession.py.
+
+The parameters that the scripts have hard-coded can be given on the command line or in a json config file
+(--config). A config file holds option names as keys (with '_' instead of '-'), either at the top level for all
+commands that have the option, or in a section per command:
+
+    {"min_spots": 3, "density": {"magnification": 10, "cutoff": 0.5}}
+
+Options on the command line take precedence over the config file.
+
+The results are written as json to standard output, or to the --output file: as json, or as csv when the file
+name ends in .csv. The csv file holds the table of the command (i.e. the sites for hotspots), or the results
+when the command has no table. All other messages go to standard error, so they do not mix with the results.
+Plots are only made with --plots DIRECTORY, except for plot-tracks, which shows them on screen otherwise.
+'''
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from tmUtility import ReadTracksData, ReadSpotsData, RestrictTracksLength, CompileDuration, CurveFitAndPlot
+from tmUtility import CalculateDensityMap, CalculateOccurrences, PlotDensityMap, SetPlotOutput
+from tmUtility import CalculateBoundingRectangles, BuildTrackIndex, TrackIndex, FindSpotsForTracks, SpatialIndex
+from tmUtility import PlotTracks
+from tmHotspots import FindHotspots, PIXEL_DIMENSION
+from tmSession import AnalysisSession, ANALYSES
+
+
+def SpotsFileFor(tracks_file):
+
+    """
+    :param tracks_file: i.e. 'tracks.csv' or 'xxx-tracks.csv'
+    :return: the spots file next to it, 'spots.csv' or 'xxx-spots.csv'
+    """
+
+    directory, name = os.path.split(tracks_file)
+    if name.lower().endswith('tracks.csv'):
+        return os.path.join(directory, name[:-len('tracks.csv')] + 'spots.csv')
+    return os.path.join(directory, 'spots.csv')
+
+
+def Duration(args):
+
+    """
+    Fit the duration histogram, as tmBindingDurationHistogram.py
+    :return: (results, table), the table is the histogram
+    """
+
+    # scipy is only loaded by the commands that fit
+    from tmFitting import FitDuration, BootstrapDuration
+    from tmLifetime import FitLifetimes, SelectModel
+
+    tracks = RestrictTracksLength(ReadTracksData(args.tracks), args.min_spots, args.max_spots)
+    duration_data = CompileDuration(tracks)
+    results = {'nr_tracks': tracks.shape[0]}
+
+    if args.plots is not None:
+        fit = CurveFitAndPlot(duration_data, tracks.shape[0], args.plot_max_x, plot_title='Duration histogram',
+                              save_as=f'duration.{args.format}')
+    else:
+        fit = FitDuration(duration_data)
+    if fit is not None:
+        results.update({'tau_ms': 1e3 * fit.tau, 'tau_ms_sd': 1e3 * math.sqrt(fit.covariance[1, 1]) / fit.t ** 2,
+                        'r_squared': fit.r_squared, 'm': fit.m, 't': fit.t, 'b': fit.b})
+
+    if args.bootstrap > 0:
+        bootstrap = BootstrapDuration(duration_data, args.bootstrap, seed=args.seed)
+        if bootstrap is not None:
+            results.update({'tau_ms_low': 1e3 * bootstrap.tau_low, 'tau_ms_high': 1e3 * bootstrap.tau_high,
+                            'confidence': bootstrap.confidence})
+
+    if args.max_components > 0:
+        fits = FitLifetimes(tracks['TRACK_DURATION'], args.max_components, min_spots=args.min_spots)
+        if fits is not None:
+            best = SelectModel(fits, 'bic')
+            results['lifetime_models'] = [{'components': f.components, 'taus_ms': list(1e3 * f.taus),
+                                           'weights': list(f.weights), 'aic': f.aic, 'bic': f.bic} for f in fits]
+            results['lifetime_components'] = best.components
+
+    table = duration_data.reset_index()
+    table.columns = ['DURATION', 'FREQUENCY']
+    return results, table
+
+
+def Density(args):
+
+    """
+    Determine the binding density, as tmDensityMap-v2.py, or per specified area, as tmSimpleDensity.py
+    :return: (results, table), the table gives the number of squares per track count
+    """
+
+    tracks = ReadTracksData(args.tracks, min_spots=args.min_spots, max_spots=args.max_spots,
+                            min_time=args.min_time, max_time=args.max_time)
+    duration = float(tracks['TRACK_START'].max() - tracks['TRACK_START'].min())
+
+    count_array = CalculateDensityMap(tracks, args.magnification, args.image_size, args.image_size)
+
+    # With an area all tracks count, otherwise the tracks on the image
+    if args.area is None:
+        nr_tracks = int(count_array.sum())
+        area = args.image_size * args.image_size
+    else:
+        nr_tracks = tracks.shape[0]
+        area = args.area
+    density = nr_tracks / area
+    results = {'nr_tracks': nr_tracks,
+               'area': area,
+               'duration': duration,
+               'density': density,
+               'density_per_second': density / duration if duration > 0 else None,
+               'max_square_count': int(count_array.max())}
+
+    if args.plots is not None:
+        PlotDensityMap(count_array, args.cutoff, title='Density map', save_as=f'density.{args.format}')
+
+    occurrence = CalculateOccurrences(count_array)
+    table = pd.DataFrame({'TRACKS_IN_SQUARE': np.arange(len(occurrence)), 'SQUARES': occurrence})
+    return results, table.loc[table['SQUARES'] > 0]
+
+
+def Hotspots(args):
+
+    """
+    Find the busiest binding sites, as tmFindBusiestSpotsOnSurface.py
+    :return: (results, table), the table holds the sites, the busiest first
+    """
+
+    tracks = ReadTracksData(args.tracks, min_spots=args.min_spots, max_spots=args.max_spots,
+                            min_time=args.min_time, max_time=args.max_time)
+    sites, events = FindHotspots(tracks, args.pixel_dimension, cluster_radius=args.radius,
+                                 min_events=args.min_events, top_k=args.top)
+    results = {'nr_tracks': tracks.shape[0],
+               'nr_sites': len(sites),
+               'nr_repeat_sites': int((sites['NR_EVENTS'] > 1).sum()) if len(sites) else 0,
+               'max_events': int(sites['NR_EVENTS'].max()) if len(sites) else 0}
+    return results, sites.reset_index()
+
+
+def BoundingBoxes(args):
+
+    """
+    List the bounding rectangles of the tracks, as tmListBoundingRectanglesOfTracks.py, without asking
+    :return: (results, table), the table holds a rectangle per track
+    """
+
+    tracks = ReadTracksData(args.tracks)
+    spots_file = args.spots or SpotsFileFor(args.tracks)
+    rectangles = CalculateBoundingRectangles(BuildTrackIndex(ReadSpotsData(spots_file), spots_file))
+    rectangles = tracks[['LABEL', 'TRACK_ID']].join(rectangles, on='TRACK_ID', how='inner')
+
+    mask = np.ones(rectangles.shape[0], dtype=bool)
+    if args.min_length != -1:
+        mask &= rectangles['NUMBER_SPOTS'].to_numpy() >= args.min_length
+    if args.max_length != -1:
+        mask &= rectangles['NUMBER_SPOTS'].to_numpy() <= args.max_length
+    rectangles = rectangles.loc[mask]
+
+    results = {'nr_tracks': rectangles.shape[0],
+               'mean_delta_x': float(rectangles['DELTA_X'].mean()) if rectangles.shape[0] else None,
+               'mean_delta_y': float(rectangles['DELTA_Y'].mean()) if rectangles.shape[0] else None}
+    return results, rectangles
+
+
+def PlotSelectedTracks(args):
+
+    """
+    Plot the tracks, optionally restricted to a square and a track length, as tmPlotSelectedTracks.py
+    :return: (results, None)
+    """
+
+    spots_file = args.spots or SpotsFileFor(args.tracks)
+    spots = BuildTrackIndex(ReadSpotsData(spots_file), spots_file)
+    if args.min_length != -1 or args.max_length != -1:
+        tracks = RestrictTracksLength(ReadTracksData(args.tracks), args.min_length, args.max_length)
+        spots = BuildTrackIndex(FindSpotsForTracks(tracks, spots))
+    if args.square is not None:
+        spots = SpatialIndex(spots).Rectangle(*args.square, whole_tracks=args.whole_tracks)
+
+    if isinstance(spots, TrackIndex):
+        nr_spots, nr_tracks = spots.spots.shape[0], len(spots)
+    else:
+        nr_spots, nr_tracks = spots.shape[0], spots['TRACK_ID'].nunique()
+    plot_file = PlotTracks(spots, line_width=args.line_width, title=args.title,
+                           save_as=f'tracks.{args.format}' if args.plots is not None else None)
+    return {'nr_tracks': int(nr_tracks), 'nr_spots': int(nr_spots), 'plot': plot_file}, None
+
+
+def Report(args):
+
+    """
+    Run the analyses on one read of the recording, see AnalysisSession.Report
+    :return: (results, None)
+    """
+
+    spots_file = args.spots or SpotsFileFor(args.tracks)
+    if not os.path.isfile(spots_file):
+        spots_file = None
+    session = AnalysisSession(args.tracks, spots_file)
+    analyses = args.analyses
+    if analyses is None:
+        analyses = [analysis for analysis in ANALYSES if analysis != 'bbox' or spots_file is not None]
+    return session.Report(analyses, args.magnification, args.image_size, args.area), None
+
+
+def AddTrackRestrictions(parser, time_restriction=True):
+    parser.add_argument('--min-spots', type=int, default=3, help='the minimum number of spots of a track')
+    parser.add_argument('--max-spots', type=int, default=-1, help='the maximum number of spots of a track')
+    if time_restriction:
+        parser.add_argument('--min-time', type=float, default=1, help='the low percentage cut-off of time')
+        parser.add_argument('--max-time', type=float, default=99, help='the high percentage cut-off of time')
+
+
+def MakeParser():
+
+    """
+    :return: the argument parser and a dictionary with the parser per command
+    """
+
+    parser = argparse.ArgumentParser(description='Analyse TrackMate exports')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('tracks', help='the tracks csv file')
+    common.add_argument('--config', help='json file with the parameters')
+    common.add_argument('--output', help='write the results to this .json or .csv file instead of standard output')
+    common.add_argument('--plots', metavar='DIRECTORY', help='save plots in this directory')
+    common.add_argument('--format', choices=['png', 'svg', 'pdf'], default='png', help='the format of the plots')
+
+    commands = {}
+    p = subparsers.add_parser('duration', parents=[common], help='fit the binding duration')
+    AddTrackRestrictions(p, time_restriction=False)
+    p.add_argument('--bootstrap', type=int, default=0, metavar='N', help='bootstrap replicates for the CI of tau')
+    p.add_argument('--seed', type=int, default=None, help='seed of the bootstrap')
+    p.add_argument('--max-components', type=int, default=3,
+                   help='maximum likelihood fits with up to this many components, 0 for none')
+    p.add_argument('--plot-max-x', type=float, default=5, help='the maximum duration shown in the plot')
+    p.set_defaults(function=Duration)
+    commands['duration'] = p
+
+    p = subparsers.add_parser('density', parents=[common], help='determine the binding density')
+    AddTrackRestrictions(p)
+    p.add_argument('--magnification', type=int, default=5, help='the number of squares per micrometer')
+    p.add_argument('--cutoff', type=float, default=0.2, help='the highest value shown, as fraction of the maximum')
+    p.add_argument('--image-size', type=int, default=81, help='the size of the image in micrometer')
+    p.add_argument('--area', type=float, default=None,
+                   help='the area in square micrometer the tracks were selected from (as tmSimpleDensity.py)')
+    p.set_defaults(function=Density)
+    commands['density'] = p
+
+    p = subparsers.add_parser('hotspots', parents=[common], help='find the busiest binding sites')
+    AddTrackRestrictions(p)
+    p.add_argument('--pixel-dimension', type=float, default=PIXEL_DIMENSION, help='the pixel size in micrometer')
+    p.add_argument('--radius', type=float, default=None, help='cluster events within this radius (micrometer)')
+    p.add_argument('--min-events', type=int, default=1, help='the minimum number of events of a site')
+    p.add_argument('--top', type=int, default=None, help='only the this many busiest sites')
+    p.set_defaults(function=Hotspots)
+    commands['hotspots'] = p
+
+    p = subparsers.add_parser('bbox', parents=[common], help='list the bounding rectangles of tracks')
+    p.add_argument('--spots', help='the spots csv file, by default the one next to the tracks file')
+    p.add_argument('--min-length', type=int, default=-1, help='the minimum number of spots of a track')
+    p.add_argument('--max-length', type=int, default=-1, help='the maximum number of spots of a track')
+    p.set_defaults(function=BoundingBoxes)
+    commands['bbox'] = p
+
+    p = subparsers.add_parser('plot-tracks', parents=[common], help='plot tracks')
+    p.add_argument('--spots', help='the spots csv file, by default the one next to the tracks file')
+    p.add_argument('--min-length', type=int, default=-1, help='the minimum number of spots of a track')
+    p.add_argument('--max-length', type=int, default=-1, help='the maximum number of spots of a track')
+    p.add_argument('--square', type=float, nargs=4, metavar=('X_MIN', 'Y_MIN', 'X_MAX', 'Y_MAX'),
+                   help='only the spots in this rectangle')
+    p.add_argument('--whole-tracks', action='store_true', help='with --square, keep whole tracks')
+    p.add_argument('--line-width', type=float, default=0.5)
+    p.add_argument('--title', default='')
+    p.set_defaults(function=PlotSelectedTracks)
+    commands['plot-tracks'] = p
+
+    p = subparsers.add_parser('report', parents=[common], help='run several analyses on one read of the tracks')
+    p.add_argument('--spots', help='the spots csv file, by default the one next to the tracks file')
+    p.add_argument('--analyses', nargs='+', choices=ANALYSES, default=None,
+                   help='the analyses to run (default: all, bbox only when there is a spots file)')
+    p.add_argument('--magnification', type=int, default=5, help='the number of squares per micrometer')
+    p.add_argument('--image-size', type=int, default=81, help='the size of the image in micrometer')
+    p.add_argument('--area', type=float, default=None,
+                   help='also the density on this area in square micrometer (as tmSimpleDensity.py)')
+    p.set_defaults(function=Report)
+    commands['report'] = p
+
+    return parser, commands
+
+
+def ApplyConfig(commands, command, config_file):
+
+    """
+    Use the values of the config file as defaults for the command
+    :param commands: the parsers per command, from MakeParser
+    :param command: the command that is run
+    :param config_file: the json config file
+    :return: nothing
+    """
+
+    try:
+        with open(config_file) as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f'Could not read the config file {config_file}: {e}', file=sys.stderr)
+        sys.exit(2)
+
+    parser = commands[command]
+    known = {action.dest for action in parser._actions}
+
+    # Values at the top level are for all commands that have them, the section of the command takes precedence
+    values = {key.replace('-', '_'): value for key, value in config.items() if not isinstance(value, dict)}
+    values = {key: value for key, value in values.items() if key in known}
+    section = {key.replace('-', '_'): value for key, value in config.get(command, {}).items()}
+    unknown = set(section) - known
+    if unknown:
+        parser.error(f'unknown parameters for {command} in {config_file}: {", ".join(sorted(unknown))}')
+    values.update(section)
+    parser.set_defaults(**values)
+
+
+def JsonValue(value):
+
+    """
+    Make numpy values and NaN fit for json
+    """
+
+    if isinstance(value, dict):
+        return {key: JsonValue(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [JsonValue(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def WriteResults(args, results, table):
+
+    """
+    Write the results as json, or the table (or the results) as csv, see the description of the module
+    """
+
+    hidden = ('command', 'function', 'config', 'output')
+    parameters = {key: value for key, value in vars(args).items() if key not in hidden}
+    if args.output is not None and args.output.lower().endswith('.csv'):
+        if table is None:
+            table = pd.DataFrame([JsonValue(results)])
+        table.to_csv(args.output, index=False)
+        return
+
+    output = {'command': args.command, 'parameters': parameters, 'results': results}
+    if table is not None:
+        output['table'] = table.to_dict(orient='records')
+    text = json.dumps(JsonValue(output), indent=1)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+def Main(argv=None):
+    parser, commands = MakeParser()
+
+    # First find the command and the config file, the config file then sets the defaults of the command
+    arguments = parser.parse_args(argv)
+    if arguments.config is not None:
+        ApplyConfig(commands, arguments.command, arguments.config)
+        arguments = parser.parse_args(argv)
+
+    if arguments.plots is not None:
+        SetPlotOutput(arguments.plots, arguments.format)
+
+    # The analyses report what they do on standard output, which is kept free for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            results, table = arguments.function(arguments)
+        except SystemExit as exit_request:
+            # The readers stop the program without an exit code when a file cannot be read, which is a failure
+            sys.exit(1 if exit_request.code in (None, 0) else exit_request.code)
+    WriteResults(arguments, results, table)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,286 @@
+'''
+Analyse all TrackMate exports of an experiment in one go.
+
+All 'tracks.csv' files (also 'xxx-tracks.csv') under the experiment directory are found, together with
+the 'spots.csv' file next to it. For every recording the duration histogram is fitted and the density and the
+busiest spot on the surface are determined, just as tmBindingDurationHistogram.py, tmDensityMap-v2.py and
+tmFindBusiestSpotsOnSurface.py do for a single recording.
+
+The recordings are analysed in parallel in a pool of worker processes. A recording that can not be analysed
+is reported in the summary and does not stop the batch.
+The results are written to one summary table, 'batch_summary.csv' in the experiment directory.
+Optionally a bootstrap confidence interval for tau is determined, with a fixed seed so that a rerun gives the
+same interval. Optionally the density map and duration histogram of every recording are kept in a ResultStore, so that
+they can be combined over recordings later without reading the csv files again (see tmResultStore.py).
+Optionally the duration fit and the density map of every recording are saved as plots in the 'plots'
+directory of the experiment. No window is opened, so this also works on machines without display.
+
+Usage: python tmBatchAnalysis.py <experiment directory> [--workers N] [--plots png|svg|pdf] [--bootstrap N]
+       [--store DIRECTORY]
+'''
+
+import argparse
+import contextlib
+import io
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from tmUtility import RestrictTracksLength, CompileDuration, CurveFitAndPlot
+from tmUtility import CalculateDensityMap, PlotDensityMap, SetPlotOutput, CACHE_SUFFIX
+from tmFitting import FitDuration, BootstrapDuration
+from tmHotspots import FindHotspots
+from tmResultStore import ResultStore
+from tmSession import AnalysisSession
+
+
+# The same settings as the single recording scripts
+min_spots = 3
+min_time = 1
+max_time = 99
+magnification = 5
+image_size = 81
+pixel_dimension = 0.1603251
+
+summary_filename = 'batch_summary.csv'
+plots_directory = 'plots'
+plot_max_x = 5
+cutoff = 0.2
+bootstrap_seed = 2023
+
+
+def FindRecordings(experiment_directory):
+
+    """
+    Find all tracks files under the experiment directory, with the spots file that belongs to them
+    :param experiment_directory:
+    :return: a sorted list of (tracks file, spots file) tuples, the spots file is None when there is none
+    """
+
+    recordings = []
+    for directory, subdirectories, files in os.walk(experiment_directory):
+
+        # Do not descend into the binary caches of earlier runs
+        subdirectories[:] = [d for d in subdirectories if not d.endswith(CACHE_SUFFIX)]
+
+        # The names are matched without regard to case, i.e. 'Cell1_Tracks.csv' goes with 'Cell1_Spots.csv'
+        names = {file.lower(): file for file in files}
+        for file in files:
+            name = file.lower()
+            if not name.endswith('tracks.csv'):
+                continue
+            spots_file = names.get(name[:-len('tracks.csv')] + 'spots.csv')
+            recordings.append((os.path.join(directory, file),
+                               os.path.join(directory, spots_file) if spots_file is not None else None))
+    return sorted(recordings)
+
+
+def RecordingName(experiment_directory, tracks_file):
+
+    """
+    :return: the name of a recording, used for its plots and in the result store, i.e. 'day1_cell2_tracks'
+    """
+
+    relative_name = os.path.splitext(os.path.relpath(tracks_file, experiment_directory))[0]
+    return relative_name.replace(os.sep, '_')
+
+
+def AnalyseDuration(tracks, plot_name=None, nr_replicates=0, arrays=None):
+
+    """
+    Fit the duration histogram of the tracks of at least min_spots spots
+    :param tracks:
+    :param plot_name: if specified, the fit is plotted to this file
+    :param nr_replicates: if not 0, a 95% bootstrap confidence interval for tau is determined
+    :param arrays: if specified, the histogram is added to this dictionary as 'histogram'
+    :return: a dictionary with the results
+    """
+
+    tracks = RestrictTracksLength(tracks, min_spots, -1)
+    duration_data = CompileDuration(tracks)
+    if arrays is not None:
+        arrays['histogram'] = duration_data
+    fit = FitDuration(duration_data)
+    if plot_name is not None and fit is not None:
+        CurveFitAndPlot(duration_data, tracks.shape[0], plot_max_x,
+                        plot_title=os.path.splitext(plot_name)[0], save_as=plot_name)
+    if fit is None:
+        return {'DURATION_TRACKS': tracks.shape[0], 'TAU_MS': np.nan, 'TAU_MS_SD': np.nan, 'R_SQUARED': np.nan}
+
+    # The standard deviation of tau follows from that of t: d(1/t) = dt / t^2
+    tau_sd = np.sqrt(fit.covariance[1, 1]) / fit.t ** 2
+    result = {'DURATION_TRACKS': tracks.shape[0], 'TAU_MS': 1e3 * fit.tau, 'TAU_MS_SD': 1e3 * tau_sd,
+              'R_SQUARED': fit.r_squared}
+
+    # The recordings already run in parallel, so the replicates are fitted in this worker
+    if nr_replicates > 0:
+        bootstrap = BootstrapDuration(duration_data, nr_replicates, seed=bootstrap_seed, workers=1)
+        result['TAU_MS_LOW'] = np.nan if bootstrap is None else 1e3 * bootstrap.tau_low
+        result['TAU_MS_HIGH'] = np.nan if bootstrap is None else 1e3 * bootstrap.tau_high
+    return result
+
+
+def AnalyseDensity(tracks, plot_name=None, arrays=None):
+
+    """
+    Determine the binding density, as in tmDensityMap-v2.py
+    :param tracks: the tracks, already restricted in length and time
+    :param plot_name: if specified, the density map is plotted to this file
+    :param arrays: if specified, the density map is added to this dictionary as 'density'
+    :return: a dictionary with the results
+    """
+
+    count_array = CalculateDensityMap(tracks, magnification, image_size, image_size)
+    if arrays is not None:
+        arrays['density'] = count_array
+    if plot_name is not None:
+        PlotDensityMap(count_array, cutoff, title=os.path.splitext(plot_name)[0], save_as=plot_name)
+    nr_tracks = count_array.sum()
+    duration = tracks['TRACK_START'].max() - tracks['TRACK_START'].min()
+    density = nr_tracks / (image_size * image_size)
+    return {'DENSITY_TRACKS': int(nr_tracks),
+            'DENSITY': density,
+            'DENSITY_PER_SECOND': density / duration if duration > 0 else np.nan,
+            'MAX_SQUARE_COUNT': int(count_array.max())}
+
+
+def AnalyseBusiestSpot(tracks):
+
+    """
+    Find the pixel with the most binding events, as in tmFindBusiestSpotsOnSurface.py
+    :param tracks: the tracks, already restricted in length and time
+    :return: a dictionary with the results
+    """
+
+    sites, events = FindHotspots(tracks, pixel_dimension)
+    if len(sites) == 0:
+        return {'BUSIEST_X': np.nan, 'BUSIEST_Y': np.nan, 'BUSIEST_EVENTS': 0, 'REPEAT_PIXELS': 0}
+    return {'BUSIEST_X': int(sites['PIXEL_X'].iloc[0]),
+            'BUSIEST_Y': int(sites['PIXEL_Y'].iloc[0]),
+            'BUSIEST_EVENTS': int(sites['NR_EVENTS'].iloc[0]),
+            'REPEAT_PIXELS': int(np.count_nonzero(sites['NR_EVENTS'] > 1))}
+
+
+def AnalyseRecording(tracks_file, spots_file, plot_prefix=None, plot_format='png', nr_replicates=0,
+                     store_directory=None, recording=None):
+
+    """
+    Run all analyses on one recording. This runs in a worker process.
+    The output of the analyses is captured, so that the output of the workers does not get mixed up.
+    A problem in a recording (including the sys.exit() of the readers) is returned rather than raised.
+    :param tracks_file:
+    :param spots_file:
+    :param plot_prefix: if specified, plots are made with file names starting with this prefix
+    :param plot_format: 'png', 'svg' or 'pdf'
+    :param nr_replicates: the number of bootstrap replicates for the confidence interval of tau, 0 for none
+    :param store_directory: if specified, the density map and duration histogram are saved in this ResultStore
+    :param recording: the name of the recording in the store
+    :return: a dictionary with the results, for one row of the summary table
+    """
+
+    duration_plot = density_plot = None
+    if plot_prefix is not None:
+        duration_plot = f'{plot_prefix}_duration.{plot_format}'
+        density_plot = f'{plot_prefix}_density.{plot_format}'
+
+    start_time = time.perf_counter()
+    result = {'TRACKS_FILE': tracks_file, 'SPOTS_FILE': spots_file, 'STATUS': 'OK', 'ERROR': ''}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            arrays = {}
+            # The tracks are read once, the restricted selection is made from them
+            session = AnalysisSession(tracks_file, spots_file, pixel_dimension)
+            tracks = session.tracks
+            result['NR_TRACKS'] = tracks.shape[0]
+            result.update(AnalyseDuration(tracks, duration_plot, nr_replicates, arrays))
+
+            tracks = session.Tracks(min_spots, -1, min_time, max_time)
+            result.update(AnalyseDensity(tracks, density_plot, arrays))
+            result.update(AnalyseBusiestSpot(tracks))
+
+            # The histogram is made of all tracks of at least min_spots spots, the density map also applies
+            # the time restriction
+            if store_directory is not None:
+                meta = {'tracks_file': tracks_file, 'magnification': magnification, 'image_size': image_size,
+                        'min_spots': min_spots, 'min_time': min_time, 'max_time': max_time,
+                        'time_window': [float(tracks['TRACK_START'].min()), float(tracks['TRACK_START'].max())]}
+                ResultStore(store_directory).Save(recording, arrays.get('density'), arrays.get('histogram'), meta)
+    except SystemExit:
+        result['STATUS'] = 'FAILED'
+        lines = log.getvalue().strip().splitlines()
+        result['ERROR'] = lines[-1] if lines else 'Stopped'
+    except Exception as e:
+        result['STATUS'] = 'FAILED'
+        result['ERROR'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+
+    result['ELAPSED'] = time.perf_counter() - start_time
+    return result
+
+
+def AnalyseExperiment(experiment_directory, workers=None, plot_format=None, nr_replicates=0, store_directory=None):
+
+    """
+    Analyse all recordings of an experiment in parallel and write the summary table
+    :param experiment_directory:
+    :param workers: the number of worker processes, by default the number of cores
+    :param plot_format: if specified ('png', 'svg' or 'pdf'), plots are saved in the plots directory
+    :param nr_replicates: the number of bootstrap replicates for the confidence interval of tau, 0 for none
+    :param store_directory: if specified, the density maps and duration histograms are saved in this ResultStore
+    :return: the summary dataframe
+    """
+
+    recordings = FindRecordings(experiment_directory)
+    if len(recordings) == 0:
+        print(f'No tracks files found in {experiment_directory}')
+        return None
+
+    print(f'Analysing {len(recordings)} recordings in {experiment_directory}')
+    start_time = time.perf_counter()
+    results = []
+
+    # Every worker saves its plots in the plots directory, named after the recording
+    plot_directory = None
+    if plot_format is not None:
+        plot_directory = os.path.join(experiment_directory, plots_directory)
+    with ProcessPoolExecutor(max_workers=workers, initializer=SetPlotOutput,
+                             initargs=(plot_directory, plot_format or 'png')) as executor:
+        futures = []
+        for tracks_file, spots_file in recordings:
+            recording = RecordingName(experiment_directory, tracks_file)
+            plot_prefix = recording if plot_format is not None else None
+            futures.append(executor.submit(AnalyseRecording, tracks_file, spots_file, plot_prefix, plot_format,
+                                           nr_replicates, store_directory, recording))
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            report = result['ERROR'] if result['STATUS'] != 'OK' else f"{result['ELAPSED']:.2f} s"
+            print(f"{len(results):5d}/{len(recordings)}  {result['STATUS']:6s}  {result['TRACKS_FILE']}  {report}")
+
+    summary = pd.DataFrame(results).sort_values('TRACKS_FILE').reset_index(drop=True)
+    summary_file = os.path.join(experiment_directory, summary_filename)
+    summary.to_csv(summary_file, index=False)
+
+    nr_failed = np.count_nonzero(summary['STATUS'] != 'OK')
+    print(f'\nAnalysed {len(recordings)} recordings in {time.perf_counter() - start_time:.1f} s, {nr_failed} failed')
+    print(f'The summary is written to {summary_file}')
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyse all TrackMate exports of an experiment')
+    parser.add_argument('experiment_directory')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--plots', choices=['png', 'svg', 'pdf'], default=None,
+                        help='save the duration fit and density map of every recording in this format')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help='determine a 95%% confidence interval for tau with N bootstrap replicates')
+    parser.add_argument('--store', default=None, metavar='DIRECTORY',
+                        help='keep the density map and duration histogram of every recording in this result store')
+    args = parser.parse_args()
+    AnalyseExperiment(args.experiment_directory, args.workers, args.plots, args.bootstrap, args.store)
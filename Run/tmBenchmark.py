@@ -0,0 +1,316 @@
+'''
+Time the hot paths of the analyses on synthetic recordings of increasing size, and keep a history of the timings
+so that a change that makes a stage slower is noticed.
+
+For every scale (the number of tracks) a recording is generated once with tmSyntheticData.py and kept in the data
+directory. Every stage is run a number of times and the fastest time counts. The timings are appended to the
+history file, together with the date, the git commit and the host, and compared with the best earlier timing of
+the same stage and scale on the same host. The table at the end shows the time per stage and scale, and how the
+time grows with the number of tracks: an exponent of 1 means linear, 2 quadratic.
+
+    python tmBenchmark.py [--scales 10000 100000] [--stages read_tracks_csv density_map] [--repeat 3]
+                          [--data DIRECTORY] [--history FILE] [--tolerance 0.2]
+
+The exit code is 1 when a stage is slower than before by more than the tolerance.
+'''
+
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tmUtility import ReadTracksData, ReadSpotsData, FindSpotsForTracks, BuildTrackIndex, PlotTracks, ReadSpotArrays
+from tmUtility import CompileDuration, CurveFitAndPlot, CalculateDensityMap, CalculateOccurrences, SetPlotOutput
+from tmSyntheticData import GenerateRecording
+
+
+SCALES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# The recordings of the benchmark. Short lifetimes keep the number of spots per track realistic (about 4).
+RECORDING_SETTINGS = {'taus': [0.05, 0.5], 'weights': [0.8, 0.2], 'min_spots': 2, 'untracked_fraction': 0.05}
+
+# The tracks in this square (in micrometer) are the ones whose spots are looked up and plotted
+SQUARE = (20, 20, 30, 30)
+
+# Differences smaller than this (in seconds) are never reported as a regression, they are noise
+MIN_DIFFERENCE = 0.01
+
+HISTORY_COLUMNS = ['DATE', 'COMMIT', 'HOST', 'SCALE', 'STAGE', 'SECONDS']
+
+
+######################################################################################
+# The stages. Every stage gets the benchmark context and may leave results in it
+# for the stages after it.
+######################################################################################
+
+
+def ReadTracksCsv(context):
+    context['tracks'] = ReadTracksData(context['tracks_file'], use_cache=False)
+
+
+def ReadTracksCache(context):
+    context['tracks'] = ReadTracksData(context['tracks_file'])
+
+
+def ReadSpotsCsv(context):
+    context['spots'] = ReadSpotsData(context['spots_file'], use_cache=False)
+
+
+def ReadSpotsCache(context):
+    context['spots'] = ReadSpotsData(context['spots_file'])
+
+
+def ReadSpotArraysCache(context):
+    context['spot_arrays'] = ReadSpotArrays(context['spots_file'])
+
+
+def SelectedTracks(context):
+    tracks = context['tracks']
+    x_min, y_min, x_max, y_max = SQUARE
+    x = tracks['TRACK_X_LOCATION']
+    y = tracks['TRACK_Y_LOCATION']
+    return tracks.loc[(x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)]
+
+
+def FindSpots(context):
+    context['selected_spots'] = FindSpotsForTracks(SelectedTracks(context), context['spots'])
+
+
+def BuildIndex(context):
+    context['track_index'] = BuildTrackIndex(context['spots'])
+
+
+def FindSpotsIndexed(context):
+    FindSpotsForTracks(SelectedTracks(context), context['track_index'])
+
+
+def FindSpotsArrays(context):
+    FindSpotsForTracks(SelectedTracks(context), context['spot_arrays'])
+
+
+def PlotSelectedTracks(context):
+    PlotTracks(context['selected_spots'], save_as=os.path.join(context['plot_directory'], 'tracks.png'))
+
+
+def CompileDurationHistogram(context):
+    context['duration_data'] = CompileDuration(context['tracks'])
+
+
+def FitDurationHistogram(context):
+    CurveFitAndPlot(context['duration_data'], len(context['tracks']), 2,
+                    save_as=os.path.join(context['plot_directory'], 'duration.png'))
+
+
+def DensityMap(context):
+    CalculateOccurrences(CalculateDensityMap(context['tracks'], magnification=5))
+
+
+# In the order they run, the later stages need what the earlier ones left in the context
+STAGES = {
+    'read_tracks_csv': ReadTracksCsv,
+    'read_tracks_cache': ReadTracksCache,
+    'read_spots_csv': ReadSpotsCsv,
+    'read_spots_cache': ReadSpotsCache,
+    'find_spots_for_tracks': FindSpots,
+    'build_track_index': BuildIndex,
+    'find_spots_indexed': FindSpotsIndexed,
+    'read_spot_arrays': ReadSpotArraysCache,
+    'find_spots_arrays': FindSpotsArrays,
+    'plot_tracks': PlotSelectedTracks,
+    'compile_duration': CompileDurationHistogram,
+    'curve_fit_and_plot': FitDurationHistogram,
+    'density_map': DensityMap,
+}
+
+# What a stage needs, when it is run without the stages before it
+PREREQUISITES = {
+    'find_spots_for_tracks': ['read_tracks_cache', 'read_spots_cache'],
+    'build_track_index': ['read_spots_cache'],
+    'find_spots_indexed': ['read_tracks_cache', 'read_spots_cache', 'build_track_index'],
+    'find_spots_arrays': ['read_tracks_cache', 'read_spot_arrays'],
+    'plot_tracks': ['read_tracks_cache', 'read_spots_cache', 'find_spots_for_tracks'],
+    'compile_duration': ['read_tracks_cache'],
+    'curve_fit_and_plot': ['read_tracks_cache', 'compile_duration'],
+    'density_map': ['read_tracks_cache'],
+}
+
+
+######################################################################################
+# Running and recording
+######################################################################################
+
+
+def PrepareRecording(data_directory, scale):
+
+    """
+    Generate the recording of a scale, unless it was generated before with the same settings
+    :return: (the tracks file, the spots file)
+    """
+
+    directory = os.path.join(data_directory, str(scale))
+    settings_file = os.path.join(directory, 'synthetic.json')
+    settings = dict(RECORDING_SETTINGS, nr_tracks=scale, seed=scale)
+    try:
+        with open(settings_file) as f:
+            if json.load(f) == settings:
+                return os.path.join(directory, 'tracks.csv'), os.path.join(directory, 'spots.csv')
+    except (OSError, ValueError):
+        pass
+
+    print(f'Generating a recording with {scale} tracks in {directory}', file=sys.stderr)
+    files = GenerateRecording(directory, scale, taus=settings['taus'], weights=settings['weights'],
+                              min_spots=settings['min_spots'], untracked_fraction=settings['untracked_fraction'],
+                              seed=settings['seed'])
+    with open(settings_file, 'w') as f:
+        json.dump(settings, f)
+    return files
+
+
+def TimeStage(function, context, repeat):
+
+    """
+    :return: the fastest of repeat runs of the stage, in seconds
+    """
+
+    fastest = math.inf
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function(context)
+        fastest = min(fastest, time.perf_counter() - start_time)
+    return fastest
+
+
+def RunScale(data_directory, scale, stages, repeat, plot_directory):
+
+    """
+    Run the stages on the recording of a scale
+    :return: a dictionary with the time in seconds per stage
+    """
+
+    tracks_file, spots_file = PrepareRecording(data_directory, scale)
+    context = {'tracks_file': tracks_file, 'spots_file': spots_file, 'plot_directory': plot_directory}
+
+    # The cache stages time reading a cache that is already there
+    ReadTracksData(tracks_file)
+    ReadSpotsData(spots_file)
+
+    timings = {}
+    done = set()
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        for prerequisite in PREREQUISITES.get(stage, []):
+            if prerequisite not in done:
+                STAGES[prerequisite](context)
+                done.add(prerequisite)
+        timings[stage] = TimeStage(STAGES[stage], context, repeat)
+        done.add(stage)
+        print(f'{scale:>10}  {stage:<24} {timings[stage]:9.4f} s', file=sys.stderr)
+    return timings
+
+
+def GitCommit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip()
+    except OSError:
+        return ''
+
+
+def CompareWithHistory(history, results, host, tolerance):
+
+    """
+    :param history: the earlier timings, with the columns of HISTORY_COLUMNS
+    :param results: the new timings, with the same columns
+    :return: a list of (scale, stage, seconds, best earlier seconds) of the stages that became slower
+    """
+
+    earlier = history.loc[history['HOST'] == host]
+    best = earlier.groupby(['SCALE', 'STAGE'])['SECONDS'].min()
+    regressions = []
+    for scale, stage, seconds in results[['SCALE', 'STAGE', 'SECONDS']].itertuples(index=False):
+        if (scale, stage) in best.index:
+            previous = best[(scale, stage)]
+            if seconds > previous * (1 + tolerance) and seconds - previous > MIN_DIFFERENCE:
+                regressions.append((scale, stage, seconds, previous))
+    return regressions
+
+
+def ScalingTable(results):
+
+    """
+    :param results: the timings, with the columns of HISTORY_COLUMNS
+    :return: a dataframe with a row per stage, a column per scale, and the exponent of the growth between the
+             two largest scales
+    """
+
+    table = results.pivot(index='STAGE', columns='SCALE', values='SECONDS')
+    table = table.reindex([stage for stage in STAGES if stage in table.index])
+    scales = list(table.columns)
+    if len(scales) > 1:
+        table['SCALING'] = np.log(table[scales[-1]] / table[scales[-2]]) / math.log(scales[-1] / scales[-2])
+    return table
+
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the analyses on synthetic recordings')
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES, help='the numbers of tracks')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help='the stages to run')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of runs per stage, the fastest counts')
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'tm_benchmark'),
+                        help='the directory for the synthetic recordings')
+    parser.add_argument('--history', default=None,
+                        help='the file with earlier timings, by default benchmark_history.csv in the data directory')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='a stage that is slower than its best earlier time by more than this fraction is a '
+                             'regression')
+    args = parser.parse_args(argv)
+
+    history_file = args.history or os.path.join(args.data, 'benchmark_history.csv')
+    os.makedirs(args.data, exist_ok=True)
+    host = platform.node()
+
+    rows = []
+    # The analyses report what they do, which is not of interest here
+    with tempfile.TemporaryDirectory() as plot_directory, open(os.devnull, 'w') as devnull:
+        SetPlotOutput(plot_directory)
+        for scale in sorted(args.scales):
+            with contextlib.redirect_stdout(devnull):
+                timings = RunScale(args.data, scale, args.stages, args.repeat, plot_directory)
+            rows.extend((scale, stage, seconds) for stage, seconds in timings.items())
+
+    results = pd.DataFrame(rows, columns=['SCALE', 'STAGE', 'SECONDS'])
+    results.insert(0, 'DATE', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    results.insert(1, 'COMMIT', GitCommit())
+    results.insert(2, 'HOST', host)
+
+    if os.path.exists(history_file):
+        history = pd.read_csv(history_file)
+        regressions = CompareWithHistory(history, results, host, args.tolerance)
+    else:
+        history = None
+        regressions = []
+
+    results.to_csv(history_file, mode='a', header=history is None, index=False)
+
+    print(ScalingTable(results).to_string(float_format=lambda value: f'{value:.4f}'))
+    print(f'\nThe timings are added to {history_file}')
+    for scale, stage, seconds, previous in regressions:
+        print(f'Regression: {stage} with {scale} tracks takes {seconds:.4f} s, it took {previous:.4f} s')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
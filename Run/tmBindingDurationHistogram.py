@@ -5,40 +5,54 @@ from tmUtility import CompileDuration
 from tmUtility import CurveFitAndPlot_Exp
 from tmUtility import PlotDuration
 from tmUtility import CurveFitAndPlot
+from tmLifetime import FitLifetimes, ReportLifetimes
 
-#root_directory = "/Users/jjaba/"
-root_directory = "/Users/hans/"
+if __name__ == '__main__':
+    #root_directory = "/Users/jjaba/"
+    root_directory = "/Users/hans/"
 
-filename = 'export.csv'
+    filename = 'export.csv'
 
-tracksfilename = root_directory + filename
+    tracksfilename = root_directory + filename
 
-# Read the tracks data and eliminate the ones that are too short or are too long
-# Default settings: only tracks of 3 points or more are considered for curve fitting
-# The very high value for maximum_track_length means that there is no restriction on maximum length
+    # Read the tracks data and eliminate the ones that are too short or are too long
+    # Default settings: only tracks of 3 points or more are considered for curve fitting
+    # The very high value for maximum_track_length means that there is no restriction on maximum length
 
-tracks = ReadTracksData(tracksfilename)
-minimum_track_length: int = 3
-maximum_track_length: int = -1
+    tracks = ReadTracksData(tracksfilename)
+    minimum_track_length: int = 3
+    maximum_track_length: int = -1
 
-tracks = RestrictTracksLength(tracks, minimum_track_length, maximum_track_length)
-duration_data = CompileDuration(tracks)
-nr_tracks = len(tracks.index)
+    tracks = RestrictTracksLength(tracks, minimum_track_length, maximum_track_length)
+    duration_data = CompileDuration(tracks)
+    nr_tracks = len(tracks.index)
 
-if minimum_track_length != -1 and maximum_track_length == -1:
-    title = f'Duration histogram - only tracks longer than {minimum_track_length} spots'
-if minimum_track_length != -1 and maximum_track_length != -1:
-    title = f'Duration histogram - only tracks between {minimum_track_length} and {maximum_track_length} spots'
-if minimum_track_length == -1 and maximum_track_length == -1:
-    title = f'Duration histogram - all tracks are used'
-if minimum_track_length == -1 and maximum_track_length != -1:
-    title = f'Duration histogram - only tracks shorter than {maximum_track_length} spots'
+    if minimum_track_length != -1 and maximum_track_length == -1:
+        title = f'Duration histogram - only tracks longer than {minimum_track_length} spots'
+    if minimum_track_length != -1 and maximum_track_length != -1:
+        title = f'Duration histogram - only tracks between {minimum_track_length} and {maximum_track_length} spots'
+    if minimum_track_length == -1 and maximum_track_length == -1:
+        title = f'Duration histogram - all tracks are used'
+    if minimum_track_length == -1 and maximum_track_length != -1:
+        title = f'Duration histogram - only tracks shorter than {maximum_track_length} spots'
 
 
-# For good visibility the time window over which the plot is viewed can be limited.
-# The parameter has no impact on the calculation, only on the visuals
-# This paremeter is in seconds (not in number opf spots)
+    # The 95% confidence interval of Tau is determined by fitting this many bootstrap replicates of the histogram.
+    # Set it to 0 to skip this. The seed makes the interval reproducible.
+    nr_bootstrap_replicates = 1000
+    bootstrap_seed = 2023
 
-PlotDuration(plot_data=duration_data, plot_max_x=5, plot_title=title)
-CurveFitAndPlot(plot_data=duration_data, nr_tracks=nr_tracks, plot_max_x=5, plot_title=title)
-#CurveFitAndPlot_Exp(duration_data, title)
+    # For good visibility the time window over which the plot is viewed can be limited.
+    # The parameter has no impact on the calculation, only on the visuals
+    # This paremeter is in seconds (not in number opf spots)
+
+    PlotDuration(plot_data=duration_data, plot_max_x=5, plot_title=title)
+    CurveFitAndPlot(plot_data=duration_data, nr_tracks=nr_tracks, plot_max_x=5, plot_title=title,
+                    nr_replicates=nr_bootstrap_replicates, seed=bootstrap_seed)
+    #CurveFitAndPlot_Exp(duration_data, title)
+
+    # Fit 1, 2 and 3 exponential components to the durations themselves by maximum likelihood
+    # and report which number of components is preferred
+    lifetime_fits = FitLifetimes(tracks['TRACK_DURATION'], max_components=3, min_spots=minimum_track_length)
+    if lifetime_fits is not None:
+        ReportLifetimes(lifetime_fits, criterion='bic')
@@ -1,8 +1,6 @@
-from tmUtility import ReadTracksData
+from tmUtility import ReadTracksData, CalculateDensityMap, CalculateOccurrences, PlotDensityMap
 import numpy as np
-import math
-import matplotlib.pyplot as plt
-from matplotlib.colors import LinearSegmentedColormap
+from tmResultStore import ResultStore
 
 
 # Magnification is the factor at which you can try to make the grid smaller
@@ -19,6 +17,16 @@ from matplotlib.colors import LinearSegmentedColormap
 magnification = 5
 cutoff = 0.2
 
+# The tracks that are counted, see ReadTracksData
+min_spots = 3
+max_spots = -1
+min_time = 1
+max_time = 99
+
+# If a store directory is specified, the density map is kept there, so that maps of many recordings can be
+# combined later without reading the tracks again (see tmResultStore.py)
+store_directory = None      # i.e. root_directory + 'results'
+
 #root_directory = '/Users/jjaba/'
 root_directory = '/Users/hans/'
 
@@ -42,10 +50,10 @@ tracksfilename = root_directory + 'tracks.csv'
 
 # Read the tracks data and eliminate the ones that are too short or are too long
 tracks = ReadTracksData(tracksfilename,
-                        min_spots=3,
-                        max_spots=-1,
-                        min_time=1,
-                        max_time=99)
+                        min_spots=min_spots,
+                        max_spots=max_spots,
+                        min_time=min_time,
+                        max_time=max_time)
 
 # Determine the earliest and latest start times
 time_first = tracks['TRACK_START'].min()
@@ -67,48 +75,21 @@ print(f"yMax is {ymax:0.2f}")
 
 print(f"Area is {area:0.2f}")
 
-# Make them integer values
-xmin = math.floor(xmin)
-ymin = math.floor(ymin)
-xmax = math.floor(xmax)
-ymax = math.floor(ymax)
-
-
-
+# The grid covers the whole image
 xmin = 0
 ymin = 0
 xmax = 81 * magnification
 ymax = 81 * magnification
 
-# Create the 2 dimensional array to hold the track count
-count_array = np.zeros((xmax-xmin+1, ymax-ymin+1), dtype=int)
-
-# Loop through the tracks
-track_names = list(tracks["TRACK_ID"].unique())
-for track_name in track_names:
-
-    # Retrieve the x and y coordinates
-    track = tracks[tracks['TRACK_ID'] == track_name]
-    x1 = track['TRACK_X_LOCATION'].loc[track.index[0]]
-    y1 = track['TRACK_Y_LOCATION'].loc[track.index[0]]
-
-    # Insert them in the array
-    x2 = math.floor(x1*magnification - xmin)
-    y2 = math.floor(y1*magnification - ymin)
-
-    count_array[x2][y2] = count_array[x2][y2] + 1
-
-    # For debugging
-    # print(f"{track_name:5d} {int(x1):3d} {int(y1):3d}")
-
+# Create the 2 dimensional array holding the track count
+count_array = CalculateDensityMap(tracks, magnification)
 
 # Count how many times a certain value occurs
 max_value = count_array.max()
-occurrence = np.zeros(max_value + 1, dtype=int)
-for i in range(1, max_value + 1):
-    occurrence[i] = np.count_nonzero(count_array == i)
+occurrence = CalculateOccurrences(count_array)
 
 # Now calculate how many values are cut off when a cutoff factor other than 1 is use
+new_max = max_value
 if cutoff != 1:
     new_max = int(max_value * cutoff)
     nr_cutoff = np.count_nonzero(count_array > new_max)
@@ -136,15 +117,7 @@ for i in range(new_max+1, max_value+1):
             print(f"Cut off: {occurrence[i]:3d} instance  of {i}")
 print("\n\n")
 
-# Create the meshgrid
-x = np.arange(xmin, xmax + 1, 1)
-y = np.arange(ymax, ymin - 1, -1)
-
-#x = np.linspace(0, 81, 81*n+1)
-#y = np.linspace(0, 81, 81*n+1)
-
-
-X, Y = np.meshgrid(x, y)
+# The plots have y along the rows
 Z = np.transpose(count_array)
 
 # For debugging
@@ -160,17 +133,15 @@ print(f"The period in which the binding events occurred was {duration:.1f} secon
 print(f"The average number of events per square micrometer per second is: {density/duration:.3f}")
 
 
-# Now do the plotting
+if store_directory is not None:
+    meta = {'tracks_file': tracksfilename, 'magnification': magnification, 'image_size': 81,
+            'min_spots': min_spots, 'max_spots': max_spots, 'min_time': min_time, 'max_time': max_time,
+            'time_window': [float(time_first), float(time_last)]}
+    ResultStore(store_directory).Save(tracksfilename, density=count_array, meta=meta)
 
-xlim = ylim = 81
+# Now do the plotting
 
-fig, ax = plt.subplots()
-ax.set_aspect('equal')
-colors = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (1, 1, 1)]
-cmap = LinearSegmentedColormap.from_list("colormap", colors, N=50)
-cm = ax.pcolormesh(X, Y, Z, vmin=np.amin(Z), vmax=np.amax(Z) * cutoff, cmap=cmap)
-plt.colorbar(cm)
-plt.show()
+PlotDensityMap(count_array, cutoff)
 
 '''
 fig, ax = plt.subplots()
@@ -0,0 +1,52 @@
+import sys
+
+from tmUtility import ReadTracksData, CalculateDensityCube, CalculateDensityMovie, AnimateDensityMovie
+
+# Shows how the binding density develops during the acquisition.
+# The tracks are counted per square (as in tmDensityMap-v2.py) and per time bin. A map is then made for a window
+# of window_length seconds that moves through the acquisition in steps of window_step seconds.
+#
+# Magnification and cutoff have the same meaning as in tmDensityMap-v2.py.
+# If movie_file is specified, the maps are also saved as a numpy array, that can be opened with
+# np.load(movie_file, mmap_mode='r') without reading it into memory.
+
+magnification = 5
+cutoff = 0.2
+
+time_bin = 0.1          # seconds
+window_length = 10      # seconds
+window_step = 0.5       # seconds
+
+movie_file = None       # i.e. root_directory + 'density_movie.npy'
+animation_file = None   # i.e. root_directory + 'density_movie.gif', None shows the movie on screen
+
+#root_directory = '/Users/jjaba/'
+root_directory = '/Users/hans/'
+
+tracksfilename = root_directory + 'tracks.csv'
+
+# Read the tracks data and eliminate the ones that are too short or are too long
+tracks = ReadTracksData(tracksfilename,
+                        min_spots=3,
+                        max_spots=-1,
+                        min_time=1,
+                        max_time=99)
+
+window = max(int(round(window_length / time_bin)), 1)
+step = max(int(round(window_step / time_bin)), 1)
+
+cube = CalculateDensityCube(tracks, magnification, time_bin=time_bin)
+movie = CalculateDensityMovie(cube, window, step, filename=movie_file)
+if len(movie) == 0:
+    print(f"The tracks of {tracksfilename} span less than the window of {window * time_bin:.1f} seconds, "
+          f"so there are no maps to show")
+    sys.exit()
+
+# Quick summary, the density per square micrometer per second in every window
+area = 81 * 81
+events = movie.sum(axis=(1, 2))
+print(f"{len(movie)} maps of {window * time_bin:.1f} seconds, every {step * time_bin:.1f} seconds")
+print(f"The number of events per square micrometer per second ranges from "
+      f"{events.min() / (area * window * time_bin):.4f} to {events.max() / (area * window * time_bin):.4f}")
+
+AnimateDensityMovie(movie, time_bin, window, step, cutoff=cutoff, title='Density', save_as=animation_file)
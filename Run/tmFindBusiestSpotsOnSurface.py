@@ -1,5 +1,7 @@
-from tmUtility import ReadTracksData, ReadSpotsData
-import pandas as pd
+import sys
+
+from tmUtility import ReadTracksData
+from tmHotspots import FindHotspots, SiteTimeline
 import matplotlib.pyplot as plt
 
 root_directory = "/Users/hans/"
@@ -8,7 +10,13 @@ root_directory = "/Users/hans/"
 tracksfilename = root_directory + 'tracks.csv'
 
 pixel_dimension = 0.1603251
-precision = 0
+
+# With cluster_radius = None events are grouped on the pixel they are in.
+# With a radius (in micrometer), events that are within that distance of each other are grouped, so that repeated
+# binding is also found when the events fall in neighbouring pixels. min_events is then the minimum number of
+# events within the radius (see ClusterSites in tmHotspots.py).
+cluster_radius = None
+min_events = 1
 
 # Read the tracks data, excluding the very short tracks and only include tracks
 # that are fall in the 1-99% range
@@ -18,25 +26,15 @@ tracks = ReadTracksData(tracksfilename,
                         min_time=1,
                         max_time=99)
 
-# Add the mean x and y coordinates of the track as new columns and make integer
-tracks['INT_X'] = round(tracks['TRACK_X_LOCATION'] / pixel_d
-imension,precision)
-tracks['INT_X'] = tracks['INT_X'].apply(lambda x: int(x))
-tracks['INT_Y'] = round(tracks['TRACK_Y_LOCATION'] / pixel_dimension,precision)
-tracks['INT_Y'] = tracks['INT_Y'].apply(lambda x: int(x))
-
-# Create a dataframe grouped on x and y and count
-test = tracks.groupby(['INT_X','INT_Y'])['INT_X']
-grouped_data = tracks.groupby(['INT_X','INT_Y'])['INT_X'].count()
-grouped_data = pd.DataFrame(grouped_data)
-grouped_data.columns = ['Count']
+# Find all sites, ranked on the number of binding events
+sites, events = FindHotspots(tracks, pixel_dimension, cluster_radius=cluster_radius, min_events=min_events)
+if len(sites) == 0:
+    print(f'There are no tracks in {tracksfilename} after the restrictions, so there are no sites to show')
+    sys.exit()
+max_events = sites['NR_EVENTS'].max()
 
-# Strange trick to get the row names into the dataframe itself (from the internet)
-grouped_data.index.name = 'newhead'
-grouped_data.reset_index(inplace=True)
-
-grouped_data = grouped_data.sort_values('Count', ascending=False)
-max_events = grouped_data['Count'].max()
+print(f'{len(sites)} sites, {(sites["NR_EVENTS"] > 1).sum()} with repeated binding, at most {max_events} events')
+print(sites.head(10).to_string())
 
 # Set up the picture for the max 6 events series, sharex and sharey need to be set so that the context
 # for the bar charts is consistent
@@ -44,21 +42,21 @@ nr_rows = 3
 nr_cols = 2
 fig, axs = plt.subplots(nrows=nr_rows, ncols=nr_cols, sharex=True, sharey=True)
 
-for i in range (0, int(nr_rows * nr_cols)):
-
-    # Get the x and y coordinates of the pixels with the highest number of events
-    x = grouped_data['INT_X'].iloc[i]
-    y = grouped_data['INT_Y'].iloc[i]
+for i in range(0, min(int(nr_rows * nr_cols), len(sites))):
 
-    # Get the data for those coordinates
-    mask = (tracks['INT_X'] == x) & (tracks['INT_Y'] == y)
-    selection = tracks.loc[mask]
-    sorted_selection = selection.sort_values(by=['TRACK_START'])
+    # The events of the site, sorted on start time
+    selection = SiteTimeline(sites, events, i)
+    if cluster_radius is None:
+        x = sites['PIXEL_X'].iloc[i]
+        y = sites['PIXEL_Y'].iloc[i]
+    else:
+        x = f"{sites['X'].iloc[i]:.2f}"
+        y = f"{sites['Y'].iloc[i]:.2f}"
 
     # Prepare the info for the bar chart
-    height = sorted_selection['TRACK_DURATION']
-    x_pos = sorted_selection['TRACK_START']
-    nr_events = sorted_selection['TRACK_DURATION'].count()
+    height = selection['TRACK_DURATION']
+    x_pos = selection['TRACK_START']
+    nr_events = selection['TRACK_DURATION'].count()
 
     axs[int(i/2), int(i%2)].bar(x_pos, height)
 
@@ -70,10 +68,3 @@ for i in range (0, int(nr_rows * nr_cols)):
     axs[int(i/2), int(i%2)].set_ylabel('Duration of binding')
 
 plt.show()
-
-i = 1
-
-
-
-
-
@@ -0,0 +1,281 @@
+'''
+Fitting of the mono exponential decay Y = m * e^(-t * x) + b to binding duration histograms.
+
+The initial values are derived from the data (a log-linear regression), rather than fixed, and the fit uses
+the analytic Jacobian. Results are returned as a FitResult, so they can be used further and not only printed.
+FitMonoExpBatch fits many histograms with the same bins at once, with all arithmetic done on whole arrays.
+BootstrapDuration uses that to give a confidence interval for tau.
+'''
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.optimize
+from scipy.optimize import OptimizeWarning
+
+
+# tau = 1 / t in seconds. covariance is the 3 x 3 covariance matrix of (m, t, b) as estimated by the fit.
+FitResult = namedtuple('FitResult', ['m', 't', 'b', 'tau', 'r_squared', 'covariance'])
+
+# tau is the tau of the fit to the original data, taus are the taus of all replicates (NaN where a fit failed)
+BootstrapResult = namedtuple('BootstrapResult', ['tau', 'tau_low', 'tau_high', 'confidence', 'taus'])
+
+# The values that were used before the initial values were derived from the data
+DEFAULT_P0 = (2000, 4, 10)
+
+
+def monoExp(x, m, t, b):
+    # Define the exponential decay function that will be used for fitting
+    return m * np.exp(-t * x) + b
+
+
+def MonoExpJacobian(x, m, t, b):
+
+    """
+    The derivatives of monoExp to m, t and b
+    :return: an array with a row per x value and the columns d/dm, d/dt and d/db
+    """
+
+    e = np.exp(-t * x)
+    return np.column_stack((e, -m * x * e, np.ones_like(x)))
+
+
+def InitialGuess(x, y):
+
+    """
+    Estimate m, t and b from the data.
+    b is taken from the tail of the histogram, where the decay has died out. Then log(y - b) is a straight line
+    in x with slope -t and intercept log(m), which is found with a weighted linear regression.
+    :param x: the durations
+    :param y: the frequencies
+    :return: (m, t, b), or DEFAULT_P0 if no estimate can be made
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) < 3:
+        return DEFAULT_P0
+
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    tail = y[-max(1, len(y) // 10):]
+    b = max(0.0, float(np.median(tail)))
+
+    # Only the points clearly above the tail say something about the decay, the higher ones say most
+    mask = y - b > 0.5
+    if np.count_nonzero(mask) < 2:
+        return DEFAULT_P0
+    weights = np.sqrt(y[mask] - b)
+    slope, intercept = np.polyfit(x[mask], np.log(y[mask] - b), 1, w=weights)
+    if not np.isfinite(slope) or slope >= 0:
+        return DEFAULT_P0
+    return float(np.exp(intercept)), float(-slope), b
+
+
+def RSquared(x, y, m, t, b):
+    squaredDiffs = np.square(y - monoExp(x, m, t, b))
+    squaredDiffsFromMean = np.square(y - np.mean(y))
+    return 1 - np.sum(squaredDiffs) / np.sum(squaredDiffsFromMean)
+
+
+def FitMonoExp(x, y, p0=None):
+
+    """
+    Fit monoExp to the data
+    :param x: the durations
+    :param y: the frequencies
+    :param p0: the initial values for m, t and b, by default they are derived from the data
+    :return: a FitResult, or None if the fit fails
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if p0 is None:
+        p0 = InitialGuess(x, y)
+
+    try:
+        params, cv = scipy.optimize.curve_fit(monoExp, x, y, p0, jac=MonoExpJacobian)
+        m, t, b = params
+    except ValueError:
+        print('FitMonoExp: ydata or xdata contain NaNs, or incompatible options are used')
+        return None
+    except RuntimeError:
+        print('FitMonoExp: The least-squares optimisation fails')
+        return None
+    except OptimizeWarning:
+        print('FitMonoExp: Covariance of the parameters can not be estimated')
+        return None
+
+    return FitResult(m, t, b, 1 / t, RSquared(x, y, m, t, b), cv)
+
+
+def FitDuration(histdata, p0=None):
+
+    """
+    Fit monoExp to a duration histogram
+    :param histdata: the histogram data as a Pandas dataframe, as produced by CompileDuration
+    :param p0: the initial values for m, t and b, by default they are derived from the data
+    :return: a FitResult, or None if the fit fails
+    """
+
+    return FitMonoExp(histdata.index, histdata['Frequency'], p0)
+
+
+def StackHistograms(histograms):
+
+    """
+    Put duration histograms on the same bins, so that they can be fitted together with FitMonoExpBatch
+    :param histograms: a list of histograms as produced by CompileDuration
+    :return: x, the union of all durations, and Y, an array with a row per histogram (0 where a bin is missing)
+    """
+
+    x = np.unique(np.concatenate([np.asarray(h.index, dtype=np.float64) for h in histograms]))
+    Y = np.zeros((len(histograms), len(x)))
+    for i, h in enumerate(histograms):
+        Y[i, np.searchsorted(x, np.asarray(h.index, dtype=np.float64))] = h['Frequency'].to_numpy()
+    return x, Y
+
+
+def FitMonoExpBatch(x, Y, max_iterations=200, tolerance=1e-10):
+
+    """
+    Fit monoExp to many histograms with the same bins at once.
+    This is a Levenberg-Marquardt fit, where every step is taken for all histograms together with array
+    operations, so the time hardly depends on the number of histograms.
+    :param x: the durations, shared by all histograms
+    :param Y: an array with a row of frequencies per histogram
+    :param max_iterations:
+    :param tolerance: a fit is done when the relative improvement of the sum of squares is less than this
+    :return: a FitResult of arrays, element i is the result for row i. Fits that fail are NaN.
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    n, k = Y.shape
+
+    params = np.array([InitialGuess(x, y) for y in Y], dtype=np.float64)
+    damping = np.full(n, 1e-3)
+    active = np.ones(n, dtype=bool)
+
+    def Residuals(p, y):
+        return y - (p[:, 0:1] * np.exp(-p[:, 1:2] * x) + p[:, 2:3])
+
+    def Jacobians(p):
+        e = np.exp(-p[:, 1:2] * x)
+        return np.stack((e, -p[:, 0:1] * x * e, np.ones_like(e)), axis=2)
+
+    ssr = np.sum(np.square(Residuals(params, Y)), axis=1)
+    for iteration in range(max_iterations):
+        if not active.any():
+            break
+        J = Jacobians(params[active])
+        r = Residuals(params[active], Y[active])
+        JtJ = np.einsum('nki,nkj->nij', J, J)
+        Jtr = np.einsum('nki,nk->ni', J, r)
+
+        # Solve (JtJ + damping * diag(JtJ)) step = Jtr for all active fits at once
+        A = JtJ + damping[active, None, None] * JtJ * np.eye(3)
+        try:
+            step = np.linalg.solve(A, Jtr[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            step = np.stack([np.linalg.lstsq(a, g, rcond=None)[0] for a, g in zip(A, Jtr)])
+
+        candidate = params[active] + step
+        new_ssr = np.sum(np.square(Residuals(candidate, Y[active])), axis=1)
+        better = np.isfinite(new_ssr) & (new_ssr < ssr[active])
+
+        indices = np.flatnonzero(active)
+        improvement = (ssr[active] - new_ssr) / np.maximum(ssr[active], np.finfo(float).tiny)
+        params[indices[better]] = candidate[better]
+        ssr[indices[better]] = new_ssr[better]
+        damping[indices[better]] /= 10
+        damping[indices[~better]] *= 10
+
+        # A fit is done when a step hardly improves it, or when no step improves it anymore
+        done = (better & (improvement < tolerance)) | (damping[indices] > 1e10)
+        active[indices[done]] = False
+
+    m, t, b = params[:, 0], params[:, 1], params[:, 2]
+
+    # The covariance as curve_fit estimates it: the residual variance times (JtJ)^-1
+    J = Jacobians(params)
+    JtJ = np.einsum('nki,nkj->nij', J, J)
+    variance = ssr / max(k - 3, 1)
+    covariance = np.full((n, 3, 3), np.nan)
+    invertible = np.abs(np.linalg.det(JtJ)) > 0
+    covariance[invertible] = np.linalg.inv(JtJ[invertible]) * variance[invertible, None, None]
+
+    r_squared = 1 - ssr / np.sum(np.square(Y - Y.mean(axis=1, keepdims=True)), axis=1)
+    failed = ~np.isfinite(ssr) | (t <= 0)
+    m, t, b, r_squared = (np.where(failed, np.nan, v) for v in (m, t, b, r_squared))
+    return FitResult(m, t, b, 1 / t, r_squared, covariance)
+
+
+def BootstrapTaus(x, frequencies, nr_replicates, seed):
+
+    """
+    Fit tau to bootstrap replicates of a histogram.
+    Resampling the tracks with replacement and counting them per bin is the same as one multinomial draw over
+    the bins, so a replicate is made without touching the tracks themselves.
+    :param x: the durations
+    :param frequencies: the number of tracks per duration
+    :param nr_replicates:
+    :param seed: a seed or SeedSequence for the random generator
+    :return: an array with the tau of every replicate
+    """
+
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    total = int(round(frequencies.sum()))
+    rng = np.random.default_rng(seed)
+    Y = rng.multinomial(total, frequencies / frequencies.sum(), size=nr_replicates)
+    return FitMonoExpBatch(x, Y).tau
+
+
+def BootstrapDuration(histdata, nr_replicates=1000, confidence=0.95, seed=None, workers=1, chunk_size=250):
+
+    """
+    Determine a percentile bootstrap confidence interval for tau of a duration histogram.
+    The replicates are fitted in chunks, by default in this process: the batched fit is fast enough that a pool
+    of worker processes does not pay off for a few thousand replicates, and a pool needs the calling script to
+    be guarded with if __name__ == '__main__'. Every chunk has its own seed, spawned from the one seed, so the
+    result is reproducible and does not depend on the number of workers.
+    :param histdata: the histogram data as a Pandas dataframe, as produced by CompileDuration
+    :param nr_replicates:
+    :param confidence: the confidence level of the interval
+    :param seed: the seed for the random generator, None gives a different result every time
+    :param workers: the number of worker processes, 1 (the default) to fit in this process, None for the
+                    number of cores
+    :param chunk_size: the number of replicates per chunk
+    :return: a BootstrapResult, or None if there are no replicates or the original fit fails
+    """
+
+    if nr_replicates < 1:
+        print(f'BootstrapDuration: {nr_replicates} replicates were asked for, at least 1 is needed')
+        return None
+
+    fit = FitDuration(histdata)
+    if fit is None:
+        return None
+
+    x = np.asarray(histdata.index, dtype=np.float64)
+    frequencies = histdata['Frequency'].to_numpy(dtype=np.float64)
+    sizes = [min(chunk_size, nr_replicates - i) for i in range(0, nr_replicates, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers == 1 or len(sizes) == 1:
+        taus = [BootstrapTaus(x, frequencies, size, s) for size, s in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            taus = list(executor.map(BootstrapTaus, [x] * len(sizes), [frequencies] * len(sizes), sizes, seeds))
+    taus = np.concatenate(taus)
+
+    nr_failed = np.count_nonzero(np.isnan(taus))
+    if nr_failed == nr_replicates:
+        print('BootstrapDuration: none of the replicates could be fitted')
+        return None
+    if nr_failed > 0:
+        print(f'BootstrapDuration: {nr_failed} of {nr_replicates} replicates could not be fitted and are ignored')
+    alpha = 100 * (1 - confidence) / 2
+    tau_low, tau_high = np.nanpercentile(taus, [alpha, 100 - alpha])
+    return BootstrapResult(fit.tau, tau_low, tau_high, confidence, taus)
@@ -0,0 +1,190 @@
+'''
+Find the sites on the surface where binding happens repeatedly.
+
+Every track is a binding event at (TRACK_X_LOCATION, TRACK_Y_LOCATION). Events are grouped into sites in one of
+two ways:
+
+    - by pixel: events that round to the same camera pixel form a site, as in tmFindBusiestSpotsOnSurface.py
+    - by distance: events within cluster_radius of each other are clustered with DBSCAN, so repeated binding
+      at one location is found even when the events fall in neighbouring pixels
+
+The sites are ranked on their number of events. The events of all sites are sorted once on site and start
+time, so the timeline of every site is a slice of that table and the per site statistics are computed in the
+same pass.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+# The size of a camera pixel in micrometer
+PIXEL_DIMENSION = 0.1603251
+
+EVENT_COLUMNS = ['TRACK_ID', 'TRACK_START', 'TRACK_DURATION', 'TRACK_X_LOCATION', 'TRACK_Y_LOCATION']
+
+
+def PixelSites(x, y, pixel_dimension=PIXEL_DIMENSION, pixel_coordinates=None):
+
+    """
+    Group the events on the pixel they are in
+    :param x: the x locations in micrometer
+    :param y: the y locations in micrometer
+    :param pixel_dimension: the size of a pixel in micrometer
+    :param pixel_coordinates: if specified, (x, y) the integer pixel of every event, which are used instead of
+                              rounding the locations
+    :return: (labels, pixels), labels gives the site of every event, pixels the (x, y) pixel of every site
+    """
+
+    if pixel_coordinates is not None:
+        int_x, int_y = (np.asarray(c, dtype=np.int64) for c in pixel_coordinates)
+    else:
+        int_x = np.round(np.asarray(x, dtype=np.float64) / pixel_dimension).astype(np.int64)
+        int_y = np.round(np.asarray(y, dtype=np.float64) / pixel_dimension).astype(np.int64)
+    if len(int_x) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 2), dtype=np.int64)
+
+    # One integer per pixel, which is much faster to group than (x, y) pairs
+    x_min, y_min = int_x.min(), int_y.min()
+    height = int_y.max() - y_min + 1
+    codes, labels = np.unique((int_x - x_min) * height + (int_y - y_min), return_inverse=True)
+    pixels = np.column_stack((codes // height + x_min, codes % height + y_min))
+    return labels, pixels
+
+
+def ClusterSites(x, y, radius, min_events=2):
+
+    """
+    Group the events with DBSCAN. An event with at least min_events events (itself included) within radius is a
+    core event. Core events within radius of each other belong to the same site, other events within radius of a
+    core event join its site. The remaining events are noise and get label -1.
+    The neighbours are found with a KD-tree and the sites are the connected components of the core events.
+    :param x: the x locations in micrometer
+    :param y: the y locations in micrometer
+    :param radius: the neighbourhood radius in micrometer
+    :param min_events: the minimum number of events in the neighbourhood of a core event
+    :return: an array with the site of every event, or -1
+    """
+
+    # scipy is only needed here, grouping by pixel does not load it
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    points = np.column_stack((np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)))
+    n = len(points)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    tree = cKDTree(points)
+    pairs = tree.query_pairs(radius, output_type='ndarray')
+    nr_neighbours = 1 + np.bincount(pairs.ravel(), minlength=n)
+    core = nr_neighbours >= min_events
+
+    # Sites are the connected components of the core events
+    both_core = core[pairs[:, 0]] & core[pairs[:, 1]]
+    graph = coo_matrix((np.ones(np.count_nonzero(both_core)), (pairs[both_core, 0], pairs[both_core, 1])),
+                       shape=(n, n))
+    nr_components, components = connected_components(graph, directed=False)
+    labels = np.where(core, components, -1)
+
+    # A border event joins the site of (one of) the core events it is close to
+    for a, b in ((0, 1), (1, 0)):
+        border = core[pairs[:, a]] & ~core[pairs[:, b]]
+        labels[pairs[border, b]] = components[pairs[border, a]]
+
+    # Number the sites 0, 1, 2, ... and leave the noise at -1
+    clustered = labels >= 0
+    labels[clustered] = np.unique(labels[clustered], return_inverse=True)[1]
+    return labels
+
+
+def FindHotspots(tracks, pixel_dimension=PIXEL_DIMENSION, cluster_radius=None, min_events=1, top_k=None,
+                 pixel_coordinates=None):
+
+    """
+    Find the binding sites and rank them on the number of events
+    :param tracks: the tracks dataframe
+    :param pixel_dimension: the size of a pixel in micrometer, used when grouping by pixel
+    :param cluster_radius: if specified, events are clustered with DBSCAN with this radius (in micrometer)
+                           instead of grouped by pixel
+    :param min_events: sites with fewer events are left out. For DBSCAN it is also the minimum number of events
+                       in the neighbourhood of a core event.
+    :param top_k: if specified, only the top_k busiest sites are returned
+    :param pixel_coordinates: if specified, (x, y) the integer pixel of every track, i.e. computed once for
+                              several calls, see PixelSites
+    :return: (sites, events)
+             sites is a dataframe with a row per site, the busiest first, with the columns X and Y (the mean
+             location in micrometer), PIXEL_X and PIXEL_Y (only when grouped by pixel), NR_EVENTS, FIRST_START,
+             LAST_START, MEAN_DURATION, TOTAL_DURATION and FIRST_EVENT.
+             events holds the events of these sites, sorted on SITE and TRACK_START. The timeline of site s is
+             events.iloc[sites['FIRST_EVENT'][s]:sites['FIRST_EVENT'][s] + sites['NR_EVENTS'][s]]
+    """
+
+    x = tracks['TRACK_X_LOCATION'].to_numpy(dtype=np.float64)
+    y = tracks['TRACK_Y_LOCATION'].to_numpy(dtype=np.float64)
+    if cluster_radius is None:
+        labels, pixels = PixelSites(x, y, pixel_dimension, pixel_coordinates)
+    else:
+        labels, pixels = ClusterSites(x, y, cluster_radius, max(min_events, 1)), None
+
+    # Rank the sites on the number of events, ties in the order of the site number
+    counts = np.bincount(labels[labels >= 0]) if len(labels) else np.zeros(0, dtype=np.int64)
+    candidates = np.flatnonzero(counts >= min_events)
+    if top_k is not None and top_k < len(candidates):
+        # Only the top_k sites have to be sorted, np.argpartition finds them without sorting all sites
+        kth = np.argpartition(-counts[candidates], top_k - 1)[:top_k]
+        threshold = counts[candidates[kth]].min()
+        candidates = candidates[counts[candidates] >= threshold]
+    ranked = candidates[np.lexsort((candidates, -counts[candidates]))][:top_k]
+
+    # The new site number of every old site, -1 for the sites that are left out.
+    # The extra last element maps the noise label -1 to -1 as well.
+    site_of_label = np.full(len(counts) + 1, -1, dtype=np.int64)
+    site_of_label[ranked] = np.arange(len(ranked))
+    sites_of_events = site_of_label[labels]
+
+    # One sort on site and start time gives the timelines of all sites
+    selected = np.flatnonzero(sites_of_events >= 0)
+    start = tracks['TRACK_START'].to_numpy(dtype=np.float64)
+    order = selected[np.lexsort((start[selected], sites_of_events[selected]))]
+    events = tracks[EVENT_COLUMNS].iloc[order].reset_index(drop=True)
+    events.insert(0, 'SITE', sites_of_events[order])
+
+    # All site statistics in one pass over the sorted events
+    nr_events = counts[ranked]
+    first_event = (np.cumsum(nr_events) - nr_events).astype(np.int64)
+    sorted_start = events['TRACK_START'].to_numpy(dtype=np.float64)
+    sorted_duration = events['TRACK_DURATION'].to_numpy(dtype=np.float64)
+    if len(ranked) > 0:
+        total_duration = np.add.reduceat(sorted_duration, first_event)
+        x_sum = np.add.reduceat(events['TRACK_X_LOCATION'].to_numpy(dtype=np.float64), first_event)
+        y_sum = np.add.reduceat(events['TRACK_Y_LOCATION'].to_numpy(dtype=np.float64), first_event)
+    else:
+        # No sites, the columns are there all the same
+        total_duration = x_sum = y_sum = np.zeros(0)
+    sites = pd.DataFrame(index=pd.RangeIndex(len(ranked), name='SITE'))
+    sites['X'] = x_sum / nr_events
+    sites['Y'] = y_sum / nr_events
+    if pixels is not None:
+        sites['PIXEL_X'] = pixels[ranked, 0]
+        sites['PIXEL_Y'] = pixels[ranked, 1]
+    sites['NR_EVENTS'] = nr_events
+    sites['FIRST_START'] = sorted_start[first_event]
+    sites['LAST_START'] = sorted_start[first_event + nr_events - 1]
+    sites['MEAN_DURATION'] = total_duration / nr_events
+    sites['TOTAL_DURATION'] = total_duration
+    sites['FIRST_EVENT'] = first_event
+    return sites, events
+
+
+def SiteTimeline(sites, events, site):
+
+    """
+    :param sites: the sites, as produced by FindHotspots
+    :param events: the events, as produced by FindHotspots
+    :param site: the site number (0 is the busiest)
+    :return: the events of the site, sorted on TRACK_START
+    """
+
+    first = sites['FIRST_EVENT'].iloc[site]
+    return events.iloc[first:first + sites['NR_EVENTS'].iloc[site]]
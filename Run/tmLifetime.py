@@ -0,0 +1,213 @@
+'''
+Maximum likelihood estimation of binding lifetimes directly from the track durations.
+
+The lifetime of a binding is modelled as a mixture of one, two or three exponential components. Unlike the
+least squares fit of monoExp to the duration histogram (see tmFitting.py), the likelihood uses every track with
+its proper weight and takes into account that:
+
+    - durations are measured in whole frames: a binding with lifetime T is seen as a track of
+      floor(T / frame_time) frames, so the probability of k frames is the integral of the density over
+      [k, k + 1) frames
+    - short tracks are removed (RestrictTracksLength), so the distribution is truncated at k_min frames and
+      the probabilities are divided by the probability of a duration of at least k_min frames
+
+Because only the number of tracks per number of frames matters, the durations are first counted with
+np.bincount. The likelihood is then evaluated over the few hundred distinct durations with array operations,
+however many tracks there are.
+The models are compared with AIC and BIC, the model with the lowest value is preferred.
+'''
+
+from collections import namedtuple
+
+import numpy as np
+import scipy.optimize
+from scipy.special import logsumexp
+
+
+# taus (in seconds) and weights are sorted from the shortest to the longest lifetime.
+# The weights are those of the bindings, before the short tracks were removed.
+LifetimeFit = namedtuple('LifetimeFit', ['components', 'taus', 'weights', 'log_likelihood', 'aic', 'bic',
+                                         'nr_tracks', 'converged'])
+
+
+def FrameTime(durations):
+
+    """
+    Determine the frame time from the durations, as the smallest difference between two durations
+    :param durations: the track durations in seconds
+    :return: the frame time in seconds
+    """
+
+    values = np.unique(np.asarray(durations, dtype=np.float64))
+    differences = np.diff(values)
+
+    # Durations are stored as float32, differences in the rounding of the same duration are ignored
+    differences = differences[differences > 1e-6 * max(values.max(), 1)]
+    if len(differences) == 0:
+        print('FrameTime: the frame time can not be determined from the durations')
+        return None
+    return differences.min()
+
+
+def CountFrames(durations, frame_time=None):
+
+    """
+    Convert the durations to a number of frames and count the tracks per number of frames
+    :param durations: the track durations in seconds
+    :param frame_time: the frame time in seconds, if None it is determined from the durations
+    :return: (counts, frame_time), counts[k] is the number of tracks of k frames
+    """
+
+    if frame_time is None:
+        frame_time = FrameTime(durations)
+        if frame_time is None:
+            return None, None
+    frames = np.rint(np.asarray(durations, dtype=np.float64) / frame_time).astype(np.int64)
+    return np.bincount(frames), frame_time
+
+
+def Unpack(params, components):
+
+    """
+    The parameters are the log of the rates (in 1/frame) and the log of the weights relative to the first
+    component, so that the optimisation needs no bounds
+    :return: (log rates, log weights), the weights add up to 1
+    """
+
+    log_rates = params[:components]
+    log_weights = np.concatenate(([0.0], params[components:]))
+    return log_rates, log_weights - logsumexp(log_weights)
+
+
+def LogProbabilities(params, components, frames, k_min):
+
+    """
+    The log probability of a track of k frames, for every k in frames, given a minimum of k_min frames
+    :return: an array with the log probability per element of frames
+    """
+
+    log_rates, log_weights = Unpack(params, components)
+    rates = np.exp(log_rates)
+
+    # log of w * (e^(-rate * k) - e^(-rate * (k + 1))) for every k (rows) and component (columns)
+    log_bins = log_weights - np.outer(frames, rates) + np.log(-np.expm1(-rates))
+    log_survival = logsumexp(log_weights - rates * k_min)
+    return logsumexp(log_bins, axis=1) - log_survival
+
+
+def NegativeLogLikelihood(params, components, frames, counts, k_min):
+    return -np.dot(counts, LogProbabilities(params, components, frames, k_min))
+
+
+def StartValues(frames, counts, k_min, components):
+
+    """
+    Start values for a fit with the given number of components.
+    For one component the truncated geometric distribution has a closed form maximum likelihood estimate,
+    the rates of more components are spread around it.
+    :return: a list of parameter arrays to start from
+    """
+
+    mean_excess = np.dot(counts, frames - k_min) / counts.sum()
+    rate = np.log1p(1 / max(mean_excess, 1e-3))
+    if components == 1:
+        return [np.array([np.log(rate)])]
+
+    starts = []
+    for spread in (3.0, 10.0):
+        factors = np.geomspace(spread, 1 / spread, components)
+        starts.append(np.concatenate((np.log(rate * factors), np.zeros(components - 1))))
+    return starts
+
+
+def FitLifetime(counts, frame_time, components=1, k_min=None):
+
+    """
+    Fit a mixture of exponentials to the durations by maximum likelihood
+    :param counts: the number of tracks per number of frames, as produced by CountFrames
+    :param frame_time: the frame time in seconds
+    :param components: the number of exponential components
+    :param k_min: the minimum number of frames of a track, by default the shortest duration that occurs
+    :return: a LifetimeFit, or None if there are no tracks of at least k_min frames
+    """
+
+    frames = np.flatnonzero(counts)
+    if k_min is None:
+        k_min = frames.min()
+
+    # Tracks shorter than the minimum can not occur in the model and are left out
+    frames = frames[frames >= k_min]
+    counts = counts[frames].astype(np.float64)
+    nr_tracks = counts.sum()
+    if nr_tracks == 0:
+        print(f'FitLifetime: there are no tracks of at least {k_min} frames')
+        return None
+
+    best = None
+    for start in StartValues(frames, counts, k_min, components):
+        result = scipy.optimize.minimize(NegativeLogLikelihood, start, args=(components, frames, counts, k_min),
+                                         method='L-BFGS-B')
+        if best is None or result.fun < best.fun:
+            best = result
+
+    log_rates, log_weights = Unpack(best.x, components)
+    order = np.argsort(-log_rates)
+    taus = frame_time / np.exp(log_rates[order])
+    weights = np.exp(log_weights[order])
+
+    log_likelihood = -best.fun
+    nr_parameters = 2 * components - 1
+    aic = 2 * nr_parameters - 2 * log_likelihood
+    bic = nr_parameters * np.log(nr_tracks) - 2 * log_likelihood
+    return LifetimeFit(components, taus, weights, log_likelihood, aic, bic, int(nr_tracks), best.success)
+
+
+def FitLifetimes(durations, max_components=3, frame_time=None, min_spots=None):
+
+    """
+    Fit models of 1 up to max_components exponential components to the durations
+    :param durations: the track durations in seconds, e.g. tracks['TRACK_DURATION']
+    :param max_components:
+    :param frame_time: the frame time in seconds, if None it is determined from the durations
+    :param min_spots: the minimum track length used in RestrictTracksLength. A track of n spots lasts n - 1
+    frames. If None, the shortest duration that occurs is taken as the minimum.
+    :return: a list of LifetimeFit, one per number of components, or None if the durations can not be used
+    """
+
+    counts, frame_time = CountFrames(durations, frame_time)
+    if counts is None:
+        return None
+    k_min = None if min_spots is None or min_spots == -1 else min_spots - 1
+    fits = [FitLifetime(counts, frame_time, components, k_min) for components in range(1, max_components + 1)]
+    return None if fits[0] is None else fits
+
+
+def SelectModel(fits, criterion='bic'):
+
+    """
+    :param fits: a list of LifetimeFit, as produced by FitLifetimes
+    :param criterion: 'aic' or 'bic'
+    :return: the LifetimeFit with the lowest AIC or BIC
+    """
+
+    return min(fits, key=lambda fit: getattr(fit, criterion))
+
+
+def ReportLifetimes(fits, criterion='bic'):
+
+    """
+    Print the fitted models and the model that is preferred
+    :param fits: a list of LifetimeFit, as produced by FitLifetimes
+    :param criterion: 'aic' or 'bic'
+    :return: the preferred LifetimeFit
+    """
+
+    best = SelectModel(fits, criterion)
+    print(f'\nMaximum likelihood lifetimes of {fits[0].nr_tracks} tracks')
+    for fit in fits:
+        components = ', '.join(f'{tau * 1e3:.0f} ms ({weight:.0%})' for tau, weight in zip(fit.taus, fit.weights))
+        marker = '*' if fit is best else ' '
+        print(f'{marker} {fit.components} component(s): {components:45s}  AIC = {fit.aic:.1f}  BIC = {fit.bic:.1f}'
+              f'{"" if fit.converged else "  (not converged)"}')
+    print(f'The preferred model (lowest {criterion.upper()}) has {best.components} component(s)')
+    return best
@@ -1,5 +1,5 @@
-from tmUtility import ReadTracksData, ReadSpotsData
-from tmUtility import RestrictTracksLength, RestrictTracksTime
+from tmSession import AnalysisSession
+from tmMemo import MemoCache
 
 '''
 A simple routine to get information on the rectangle tracks that just contains the tracks
@@ -13,30 +13,16 @@ The output then is for each track the bounding rectangle and the delta x and del
 root_directory = "/Users/jjaba/"
 
 
-def DetermineBoundingRectangle(tracks, spots, minimum_size, maximum_size):
-    tracks = tracks.loc[tracks['NUMBER_SPOTS'] >= minimum_size]
-    tracks = tracks.loc[tracks['NUMBER_SPOTS'] <= maximum_size]
-
-    # Find the area of each track
-    nr_tracks = tracks.shape[0]
-
-    for i in range(0, nr_tracks):
-        track = tracks.iloc[i]
-        track_name = track['LABEL']
-        track_index = track['TRACK_INDEX']
-        nr_spots = track['NUMBER_SPOTS']
-
-        # Select the spots
-
-        spots_in_track = spots.loc[spots['TRACK_ID'] == track_index]
-        max_values = spots_in_track.max()
-        min_values = spots_in_track.min()
-
-        min_x = min_values['POSITION_X']
-        max_x = max_values['POSITION_X']
-        min_y = min_values['POSITION_Y']
-        max_y = max_values['POSITION_Y']
+def DetermineBoundingRectangle(session, minimum_size, maximum_size):
 
+    # The rectangles are determined once, and a selection that was asked for before comes from the cache
+    rectangles = session.BoundingRectangles(minimum_size, maximum_size)
+    for track_name, nr_spots, min_x, max_x, min_y, max_y in zip(rectangles['LABEL'],
+                                                                  rectangles['NUMBER_SPOTS'],
+                                                                  rectangles['X_MIN'],
+                                                                  rectangles['X_MAX'],
+                                                                  rectangles['Y_MIN'],
+                                                                  rectangles['Y_MAX']):
         print(
             f'Track {track_name:12s} with {nr_spots:5d} spots:\
                 xmin = {min_x:5.2f}   xmax = {max_x:5.2f}   deltax = {max_x - min_x:5.2f}\
@@ -46,8 +32,8 @@ def DetermineBoundingRectangle(tracks, spots, minimum_size, maximum_size):
 tracksfilename = root_directory + 'tracks.csv'
 spotsfilename = root_directory + 'spots.csv'
 
-tracks = ReadTracksData(tracksfilename)
-spots = ReadSpotsData(spotsfilename)
+cache = MemoCache(max_bytes=256 * 1024 * 1024)
+session = AnalysisSession(tracksfilename, spotsfilename, memo=cache)
 
 while True:
     min_number = input('Specify a value for the minimum track length (or any letter to stop: ')
@@ -60,6 +46,7 @@ while True:
         break
     else:
         print(f'Analysing for a track length of larger {int(min_number)} and smaller than {int(max_number)}\n\n')
-        DetermineBoundingRectangle(tracks, spots, int(min_number), int(max_number))
+        DetermineBoundingRectangle(session, int(min_number), int(max_number))
+        cache.Report()
         print('\n\n')
 
@@ -0,0 +1,262 @@
+'''
+A cache for what is derived from a recording (duration histograms, selections of tracks, density maps, ...), so
+that asking again for the same thing with the same parameters in an interactive session returns at once.
+
+A result is identified by the recording it was derived from (the fingerprint of its csv files, see CsvFingerprint,
+so a result is not used any more once the file changes), the name of what was calculated and its parameters.
+The results are kept in memory, the least recently used are dropped when they take more than max_bytes. With a
+directory the results are also written to disk, so that they survive the session and the memory limit.
+
+    cache = MemoCache(max_bytes=500 * 1024 * 1024, directory=root_directory + 'memo')
+    histogram = cache.Memoize('CompileDuration', [tracks_file], {'min_spots': 3},
+                              lambda: CompileDuration(ReadTracksData(tracks_file, min_spots=3)))
+    cache.Report()
+
+An AnalysisSession (tmSession.py) that is given a cache keeps its results in it.
+'''
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from tmUtility import CsvFingerprint, TrackIndex
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+MEMO_SUFFIX = '.pkl'
+
+
+def NormalizeValue(value):
+
+    """
+    Make parameters that mean the same compare the same: numpy values become Python values, tuples become lists
+    and a float with an integer value becomes an int (min_time=1 and min_time=1.0 select the same tracks)
+    """
+
+    if isinstance(value, dict):
+        return {str(key): NormalizeValue(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [NormalizeValue(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return [NormalizeValue(v) for v in value.tolist()]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def MemoKey(name, sources, parameters):
+
+    """
+    :param name: what is calculated, i.e. 'CompileDuration'
+    :param sources: the csv files the result is derived from
+    :param parameters: the parameters of the calculation, anything that NormalizeValue turns into json
+    :return: (key, description), the key is a hash of the description
+    """
+
+    description = json.dumps({'name': name,
+                              'sources': [CsvFingerprint(source) for source in sources],
+                              'parameters': NormalizeValue(parameters)}, sort_keys=True, default=str)
+    return hashlib.sha256(description.encode()).hexdigest(), description
+
+
+def SizeOf(value):
+
+    """
+    :return: an estimate of the memory a result takes, in bytes
+    """
+
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        size = value.memory_usage(deep=True)
+        return int(size.sum()) if isinstance(size, pd.Series) else int(size)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, TrackIndex):
+        return SizeOf(value.spots) + value.order.nbytes + value.track_ids.nbytes + value.offsets.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(SizeOf(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(SizeOf(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class MemoCache:
+
+    """
+    The results in memory, the least recently used first, with an optional directory, see the description of
+    the module
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None, max_disk_bytes=None):
+
+        """
+        :param max_bytes: the memory the results may take
+        :param directory: if specified, the results are also kept on disk in this directory
+        :param max_disk_bytes: if specified, the least recently used results are removed from the directory when
+                               they take more than this
+        """
+
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self.entries = OrderedDict()
+        self.nr_bytes = 0
+        self.statistics = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def Memoize(self, name, sources, parameters, function, persist=True):
+
+        """
+        :param name: what is calculated
+        :param sources: the csv files the result is derived from
+        :param parameters: the parameters of the calculation
+        :param function: calculates the result, only called if it is not in the cache
+        :param persist: if False, the result is not written to disk, i.e. because it is quickly made from data
+                        that is itself cached
+        :return: the result
+        """
+
+        key, description = MemoKey(name, sources, parameters)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.statistics['hits'] += 1
+            return self.entries[key][0]
+
+        value = self.Load(key, description) if persist else None
+        if value is not None:
+            self.statistics['disk_hits'] += 1
+        else:
+            self.statistics['misses'] += 1
+            value = function()
+            if persist:
+                self.Save(key, description, value)
+        self.Keep(key, value)
+        return value
+
+    def Keep(self, key, value):
+        size = SizeOf(value)
+        if size > self.max_bytes:
+            # It would push everything else out and then not fit itself
+            return
+        self.entries[key] = (value, size)
+        self.nr_bytes += size
+        while self.nr_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.nr_bytes -= evicted_size
+            self.statistics['evictions'] += 1
+
+    def Clear(self):
+
+        """
+        Forget the results in memory, the results on disk are kept
+        """
+
+        self.entries.clear()
+        self.nr_bytes = 0
+
+    ######################################################################################
+    # The results on disk
+    ######################################################################################
+
+    def Filename(self, key):
+        return os.path.join(self.directory, key + MEMO_SUFFIX)
+
+    def Load(self, key, description):
+
+        """
+        :return: the result from disk, or None if it is not there (or can not be read)
+        """
+
+        if self.directory is None:
+            return None
+        filename = self.Filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                saved_description, value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            return None
+        if saved_description != description:
+            return None
+
+        # The modification time marks when a result was last used, for TrimDisk
+        os.utime(filename)
+        return value
+
+    def Save(self, key, description, value):
+        if self.directory is None or value is None:
+            return
+        filename = self.Filename(key)
+        tmp_file = filename + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump((description, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, filename)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f'Could not save a result in {self.directory}: {e}')
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return
+        if self.max_disk_bytes is not None:
+            self.TrimDisk()
+
+    def DiskEntries(self):
+
+        """
+        :return: a list of (last used, size, filename) of the results on disk
+        """
+
+        entries = []
+        with os.scandir(self.directory) as files:
+            for file in files:
+                if file.name.endswith(MEMO_SUFFIX):
+                    stat = file.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, file.path))
+        return entries
+
+    def TrimDisk(self):
+
+        """
+        Remove the least recently used results from disk until they take at most max_disk_bytes
+        """
+
+        entries = sorted(self.DiskEntries())
+        nr_bytes = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if nr_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            nr_bytes -= size
+
+    ######################################################################################
+    # Statistics
+    ######################################################################################
+
+    def Statistics(self):
+
+        """
+        :return: a dictionary with the number of hits (in memory and on disk), misses and evictions, the number
+                 of results in memory and the memory they take
+        """
+
+        requests = self.statistics['hits'] + self.statistics['disk_hits'] + self.statistics['misses']
+        hit_rate = (self.statistics['hits'] + self.statistics['disk_hits']) / requests if requests else 0.0
+        return dict(self.statistics, hit_rate=hit_rate, entries=len(self.entries), nr_bytes=self.nr_bytes,
+                    max_bytes=self.max_bytes)
+
+    def Report(self):
+        s = self.Statistics()
+        print(f"Cache: {s['hits']} hits, {s['disk_hits']} from disk, {s['misses']} misses "
+              f"({100 * s['hit_rate']:.0f}% hit rate), {s['evictions']} evicted, "
+              f"{s['entries']} results taking {s['nr_bytes'] / 1024 ** 2:.1f} of {s['max_bytes'] / 1024 ** 2:.0f} MB")
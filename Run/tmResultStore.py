@@ -0,0 +1,187 @@
+'''
+A store for the density maps and duration histograms of many recordings, so that they can be combined later
+without reading the csv files again.
+
+Every recording gets a directory in the store with its arrays as .npy files and a meta.json file that describes
+how they were made (i.e. magnification, the restrictions applied to the tracks, the time window). The arrays are
+opened memory mapped, so summing the maps of hundreds of recordings only ever holds one map and the sum in memory.
+
+    store = ResultStore('/data/experiment/results')
+    store.Save('recording_1', density=count_array, histogram=CompileDuration(tracks), meta={'magnification': 5})
+    total = store.SumDensityMaps(store.Recordings(magnification=5))
+'''
+
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# A save is written to the directory of the recording with TMP_SUFFIX, the results it replaces are first
+# renamed to the directory with OLD_SUFFIX
+TMP_SUFFIX = '.tmp'
+OLD_SUFFIX = '.old'
+
+
+class ResultStore:
+
+    """
+    A directory with per recording results, see the description of the module
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def RecordingDirectory(self, recording):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9._-]+', '_', recording))
+
+    def Save(self, recording, density=None, histogram=None, meta=None):
+
+        """
+        Save the results of a recording, replacing earlier results of that recording.
+        The results are written to a temporary directory first, the earlier results are renamed aside and only
+        removed once the new ones are in place. A reader sees the old or the new results, never half of them, and
+        after an interrupted save the earlier results are still there, in the directory with the '.old' suffix.
+        :param recording: the name of the recording
+        :param density: optional density map, as produced by CalculateDensityMap
+        :param histogram: optional duration histogram, as produced by CompileDuration
+        :param meta: optional dictionary with how the results were made, it must be serializable to json
+        :return: nothing
+        """
+
+        recording_dir = self.RecordingDirectory(recording)
+        tmp_dir = recording_dir + TMP_SUFFIX
+        old_dir = recording_dir + OLD_SUFFIX
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        arrays = []
+        if density is not None:
+            np.save(os.path.join(tmp_dir, 'density.npy'), np.asarray(density))
+            arrays.append('density')
+        if histogram is not None:
+            np.save(os.path.join(tmp_dir, 'duration.npy'), np.asarray(histogram.index, dtype=np.float64))
+            np.save(os.path.join(tmp_dir, 'frequency.npy'), histogram['Frequency'].to_numpy(dtype=np.int64))
+            arrays.append('histogram')
+
+        description = {'recording': recording, 'arrays': arrays, 'saved': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'meta': meta or {}}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(description, f, indent=1)
+
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(recording_dir):
+            os.replace(recording_dir, old_dir)
+        os.replace(tmp_dir, recording_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def Description(self, recording):
+        with open(os.path.join(self.RecordingDirectory(recording), 'meta.json')) as f:
+            return json.load(f)
+
+    def Meta(self, recording):
+
+        """
+        :param recording:
+        :return: the meta dictionary the results of the recording were saved with
+        """
+
+        return self.Description(recording)['meta']
+
+    def Recordings(self, **selection):
+
+        """
+        The recordings in the store, optionally only those with specific meta values
+        :param selection: meta values the recordings must have, i.e. Recordings(magnification=5)
+        :return: a sorted list of recording names
+        """
+
+        recordings = []
+        for entry in sorted(os.listdir(self.directory)):
+            if entry.endswith((TMP_SUFFIX, OLD_SUFFIX)):
+                continue
+            try:
+                with open(os.path.join(self.directory, entry, 'meta.json')) as f:
+                    description = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta = description['meta']
+            if all(meta.get(key) == value for key, value in selection.items()):
+                recordings.append(description['recording'])
+        return recordings
+
+    def DensityMap(self, recording):
+
+        """
+        :param recording:
+        :return: the density map of the recording, memory mapped (read only)
+        """
+
+        return np.load(os.path.join(self.RecordingDirectory(recording), 'density.npy'), mmap_mode='r')
+
+    def DurationHistogram(self, recording):
+
+        """
+        :param recording:
+        :return: the duration histogram of the recording, in the form of CompileDuration
+        """
+
+        recording_dir = self.RecordingDirectory(recording)
+        durations = np.load(os.path.join(recording_dir, 'duration.npy'))
+        frequencies = np.load(os.path.join(recording_dir, 'frequency.npy'))
+        return pd.DataFrame({'Frequency': frequencies}, index=pd.Index(durations, name='TRACK_DURATION'))
+
+    def SumDensityMaps(self, recordings=None, average=False):
+
+        """
+        Add up the density maps of recordings, reading one map at a time
+        :param recordings: the recordings to combine, by default all recordings with a density map
+        :param average: if True, the mean map is returned instead of the sum
+        :return: the sum (int64) or the mean (float64) of the maps, or None if there are no maps
+        """
+
+        if recordings is None:
+            recordings = [r for r in self.Recordings() if 'density' in self.Description(r)['arrays']]
+
+        total = None
+        nr_maps = 0
+        for recording in recordings:
+            count_array = self.DensityMap(recording)
+            if total is None:
+                total = np.zeros(count_array.shape, dtype=np.int64)
+            elif count_array.shape != total.shape:
+                print(f'The density map of {recording} is {count_array.shape}, not {total.shape}, it is skipped')
+                continue
+            total += count_array
+            nr_maps += 1
+
+        if total is None:
+            print('There are no density maps to combine')
+            return None
+        return total / nr_maps if average else total
+
+    def SumDurationHistograms(self, recordings=None):
+
+        """
+        Add up the duration histograms of recordings
+        :param recordings: the recordings to combine, by default all recordings with a histogram
+        :return: the combined histogram, in the form of CompileDuration, or None if there are no histograms
+        """
+
+        if recordings is None:
+            recordings = [r for r in self.Recordings() if 'histogram' in self.Description(r)['arrays']]
+        if len(recordings) == 0:
+            print('There are no duration histograms to combine')
+            return None
+
+        histograms = [self.DurationHistogram(recording) for recording in recordings]
+        durations = np.concatenate([np.asarray(h.index) for h in histograms])
+        frequencies = np.concatenate([h['Frequency'].to_numpy() for h in histograms])
+        values, positions = np.unique(durations, return_inverse=True)
+        return pd.DataFrame({'Frequency': np.bincount(positions, weights=frequencies).astype(np.int64)},
+                            index=pd.Index(values, name='TRACK_DURATION'))
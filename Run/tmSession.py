@@ -0,0 +1,299 @@
+'''
+All analyses of one recording on a single load of its tracks (and spots).
+
+The single recording scripts (tmBindingDurationHistogram.py, tmDensityMap-v2.py, tmSimpleDensity.py,
+tmFindBusiestSpotsOnSurface.py and tmListBoundingRectanglesOfTracks.py) each read the tracks file and apply their
+own restrictions. An AnalysisSession reads the tracks once and keeps them in memory. A selection of tracks, and
+everything derived from the data (the durations, the pixel of every track, the bounding rectangles of the tracks)
+is calculated the first time it is asked for and then kept, so asking for it again, or running another analysis
+on the same selection, costs nothing. With a MemoCache (tmMemo.py) the results are kept in the cache instead, so
+that they are shared by the sessions of a recording, the memory they take is bounded, and with a cache directory
+they are kept between sessions.
+
+    session = AnalysisSession(root_directory + 'tracks.csv', root_directory + 'spots.csv')
+    fit = session.DurationFit(min_spots=3)
+    count_array = session.DensityMap(magnification=5, min_spots=3, min_time=1, max_time=99)
+    sites, events = session.Hotspots(min_spots=3, min_time=1, max_time=99)
+    report = session.Report()
+'''
+
+import sys
+
+import numpy as np
+
+from tmUtility import ReadTracksData, ReadSpotsData, TrackFilter, CompileDuration, CalculateDensityMap
+from tmUtility import CalculateBoundingRectangles, BuildTrackIndex
+from tmHotspots import FindHotspots, PIXEL_DIMENSION
+
+
+# The restrictions of tmDensityMap-v2.py and tmFindBusiestSpotsOnSurface.py
+DEFAULT_RESTRICTIONS = {'min_spots': 3, 'max_spots': -1, 'min_time': 1, 'max_time': 99}
+
+ANALYSES = ['duration', 'lifetimes', 'density', 'hotspots', 'bbox']
+
+
+class AnalysisSession:
+
+    """
+    One recording, read once, see the description of the module.
+    A selection of tracks is given by min_spots, max_spots, min_time and max_time, as for ReadTracksData.
+    The results are shared, they should not be changed by the caller.
+    """
+
+    def __init__(self, tracks_file, spots_file=None, pixel_dimension=PIXEL_DIMENSION, use_cache=True, memo=None):
+
+        """
+        :param tracks_file:
+        :param spots_file: only needed for the bounding rectangles
+        :param pixel_dimension: the size of a pixel in micrometer
+        :param use_cache: read from and write to the binary cache
+        :param memo: optional MemoCache for the results, otherwise they are kept in the session
+        """
+
+        self.tracks_file = tracks_file
+        self.spots_file = spots_file
+        self.pixel_dimension = pixel_dimension
+        self.use_cache = use_cache
+        self.memo = memo
+        self.tracks = ReadTracksData(tracks_file, use_cache=use_cache)
+        self.results = {}
+
+    def Memo(self, key, function, persist=True):
+
+        """
+        :param key: identifies the result, i.e. ('density map', magnification, selection)
+        :param function: calculates the result, it is only called the first time the key is asked for
+        :param persist: if False, the result is not written to the directory of the MemoCache
+        :return: the result
+        """
+
+        if self.memo is not None:
+            sources = [self.tracks_file] if self.spots_file is None else [self.tracks_file, self.spots_file]
+            return self.memo.Memoize('AnalysisSession', sources, [key, self.pixel_dimension], function, persist)
+        if key not in self.results:
+            self.results[key] = function()
+        return self.results[key]
+
+    ######################################################################################
+    # The data and the selections of tracks
+    ######################################################################################
+
+    def Spots(self):
+        if self.spots_file is None:
+            print(f'There is no spots file for {self.tracks_file}')
+            sys.exit()
+        return self.Memo('spots', lambda: ReadSpotsData(self.spots_file, use_cache=self.use_cache),
+                         persist=False)
+
+    def TrackIndex(self):
+        return self.Memo('track index', lambda: BuildTrackIndex(self.Spots(), self.spots_file), persist=False)
+
+    def Selection(self, min_spots=-1, max_spots=-1, min_time=-1, max_time=-1):
+
+        """
+        :return: the positions of the selected tracks, in the order of the tracks
+        """
+
+        def Select():
+            row_filter = TrackFilter().Length(min_spots, max_spots).TimePercentage(min_time, max_time)
+            return np.flatnonzero(row_filter.Mask(self.tracks))
+
+        return self.Memo(('selection', min_spots, max_spots, min_time, max_time), Select)
+
+    def Tracks(self, min_spots=-1, max_spots=-1, min_time=-1, max_time=-1):
+
+        """
+        :return: the selected tracks, as ReadTracksData with these restrictions would return them
+        """
+
+        key = (min_spots, max_spots, min_time, max_time)
+        return self.Memo(('tracks',) + key, lambda: self.tracks.iloc[self.Selection(*key)], persist=False)
+
+    ######################################################################################
+    # What is derived from the data, for all tracks
+    ######################################################################################
+
+    def Durations(self):
+        return self.Memo('durations', lambda: self.tracks['TRACK_DURATION'].to_numpy(dtype=np.float64),
+                         persist=False)
+
+    def PixelCoordinates(self):
+
+        """
+        :return: (x, y), the pixel of every track, as integer arrays
+        """
+
+        def Pixels():
+            x = self.tracks['TRACK_X_LOCATION'].to_numpy(dtype=np.float64)
+            y = self.tracks['TRACK_Y_LOCATION'].to_numpy(dtype=np.float64)
+            return (np.round(x / self.pixel_dimension).astype(np.int64),
+                    np.round(y / self.pixel_dimension).astype(np.int64))
+
+        return self.Memo('pixels', Pixels, persist=False)
+
+    def Bounds(self):
+
+        """
+        :return: the bounding rectangle of every track, with LABEL, TRACK_ID and NUMBER_SPOTS,
+                 see CalculateBoundingRectangles
+        """
+
+        def Rectangles():
+            rectangles = CalculateBoundingRectangles(self.TrackIndex())
+            return self.tracks[['LABEL', 'TRACK_ID']].join(rectangles, on='TRACK_ID', how='inner')
+
+        return self.Memo('bounds', Rectangles)
+
+    ######################################################################################
+    # The analyses
+    ######################################################################################
+
+    def DurationHistogram(self, min_spots=3, max_spots=-1):
+        return self.Memo(('duration histogram', min_spots, max_spots),
+                         lambda: CompileDuration(self.Tracks(min_spots, max_spots)))
+
+    def DurationFit(self, min_spots=3, max_spots=-1):
+
+        """
+        As tmBindingDurationHistogram.py
+        :return: the FitResult of the duration histogram, or None if the fit fails
+        """
+
+        from tmFitting import FitDuration
+        return self.Memo(('duration fit', min_spots, max_spots),
+                         lambda: FitDuration(self.DurationHistogram(min_spots, max_spots)))
+
+    def Lifetimes(self, max_components=3, min_spots=3, max_spots=-1):
+
+        """
+        :return: the LifetimeFits with 1 up to max_components components, see FitLifetimes
+        """
+
+        from tmLifetime import FitLifetimes
+        return self.Memo(('lifetimes', max_components, min_spots, max_spots),
+                         lambda: FitLifetimes(self.Durations()[self.Selection(min_spots, max_spots)],
+                                              max_components, min_spots=min_spots))
+
+    def DensityMap(self, magnification=5, image_size=81, **restrictions):
+
+        """
+        As tmDensityMap-v2.py
+        :param restrictions: the selection of tracks, by default DEFAULT_RESTRICTIONS
+        :return: the density map, see CalculateDensityMap
+        """
+
+        selection = tuple(dict(DEFAULT_RESTRICTIONS, **restrictions).values())
+        return self.Memo(('density map', magnification, image_size) + selection,
+                         lambda: CalculateDensityMap(self.Tracks(*selection), magnification, image_size, image_size))
+
+    def Density(self, area, min_spots=6, max_spots=-1):
+
+        """
+        As tmSimpleDensity.py: the number of tracks per square micrometer per second
+        :param area: the area of the region the tracks are from, in square micrometer
+        :return: a dictionary with the number of tracks, the time interval and the density
+        """
+
+        tracks = self.Tracks(min_spots, max_spots)
+        interval = float(tracks['TRACK_START'].max() - tracks['TRACK_START'].min()) if len(tracks) else 0.0
+        return {'nr_tracks': len(tracks), 'interval': interval,
+                'density': len(tracks) / (area * interval) if interval > 0 else np.nan}
+
+    def Hotspots(self, cluster_radius=None, min_events=1, top_k=None, **restrictions):
+
+        """
+        As tmFindBusiestSpotsOnSurface.py
+        :param restrictions: the selection of tracks, by default DEFAULT_RESTRICTIONS
+        :return: (sites, events), see FindHotspots
+        """
+
+        selection = tuple(dict(DEFAULT_RESTRICTIONS, **restrictions).values())
+
+        def Find():
+            # The pixels of all tracks are rounded once, for every selection and every grouping by pixel
+            pixel_coordinates = None
+            if cluster_radius is None:
+                positions = self.Selection(*selection)
+                pixel_coordinates = tuple(c[positions] for c in self.PixelCoordinates())
+            return FindHotspots(self.Tracks(*selection), self.pixel_dimension, cluster_radius, min_events, top_k,
+                                pixel_coordinates)
+
+        return self.Memo(('hotspots', cluster_radius, min_events, top_k) + selection, Find)
+
+    def BoundingRectangles(self, min_spots=-1, max_spots=-1):
+
+        """
+        As tmListBoundingRectanglesOfTracks.py
+        :return: the bounding rectangles of the tracks with min_spots up to max_spots spots
+        """
+
+        def Select():
+            rectangles = self.Bounds()
+            nr_spots = rectangles['NUMBER_SPOTS'].to_numpy()
+            mask = np.ones(len(rectangles), dtype=bool)
+            if min_spots != -1:
+                mask &= nr_spots >= min_spots
+            if max_spots != -1:
+                mask &= nr_spots <= max_spots
+            return rectangles.loc[mask]
+
+        return self.Memo(('bounding rectangles', min_spots, max_spots), Select)
+
+    def Report(self, analyses=None, magnification=5, image_size=81, area=None):
+
+        """
+        The standard analyses of the recording in one go, with the settings of the single recording scripts
+        :param analyses: the analyses to include, a list from ANALYSES. By default all of them, but 'bbox' only
+                         when there is a spots file.
+        :param magnification: of the density map
+        :param image_size: of the density map, in micrometer
+        :param area: if specified, the density of the tracks on this area (in square micrometer) is added, as
+                     tmSimpleDensity.py
+        :return: a dictionary with the results
+        """
+
+        if analyses is None:
+            analyses = [analysis for analysis in ANALYSES if analysis != 'bbox' or self.spots_file is not None]
+
+        report = {'nr_tracks': len(self.tracks)}
+        if 'duration' in analyses:
+            fit = self.DurationFit()
+            report['duration_tracks'] = len(self.Selection(3))
+            if fit is not None:
+                report.update({'tau_ms': 1e3 * fit.tau, 'r_squared': fit.r_squared})
+
+        if 'lifetimes' in analyses:
+            from tmLifetime import SelectModel
+            fits = self.Lifetimes()
+            if fits is not None:
+                best = SelectModel(fits, 'bic')
+                report.update({'lifetime_components': best.components, 'lifetime_taus_ms': list(1e3 * best.taus),
+                               'lifetime_weights': list(best.weights)})
+
+        if 'density' in analyses:
+            count_array = self.DensityMap(magnification, image_size)
+            tracks = self.Tracks(**DEFAULT_RESTRICTIONS)
+            duration = float(tracks['TRACK_START'].max() - tracks['TRACK_START'].min()) if len(tracks) else 0.0
+            density = count_array.sum() / (image_size * image_size)
+            report.update({'density_tracks': int(count_array.sum()),
+                           'density': density,
+                           'density_per_second': density / duration if duration > 0 else np.nan,
+                           'max_square_count': int(count_array.max())})
+            if area is not None:
+                report['area_density'] = self.Density(area)['density']
+
+        if 'hotspots' in analyses:
+            sites, events = self.Hotspots()
+            report['nr_sites'] = len(sites)
+            if len(sites) > 0:
+                report.update({'busiest_x': int(sites['PIXEL_X'].iloc[0]),
+                               'busiest_y': int(sites['PIXEL_Y'].iloc[0]),
+                               'busiest_events': int(sites['NR_EVENTS'].iloc[0]),
+                               'repeat_pixels': int(np.count_nonzero(sites['NR_EVENTS'] > 1))})
+
+        if 'bbox' in analyses:
+            rectangles = self.BoundingRectangles()
+            if len(rectangles) > 0:
+                report.update({'mean_delta_x': float(rectangles['DELTA_X'].mean()),
+                               'mean_delta_y': float(rectangles['DELTA_Y'].mean())})
+        return report
@@ -0,0 +1,85 @@
+'''
+Check that the modules that read and compute start fast, i.e. that they do not import matplotlib or scipy.
+
+Every module is imported in a fresh Python process, a number of times, and the fastest time is compared to the
+time it takes to import numpy and pandas alone, which every module needs anyway. A module passes when it adds at
+most the budget to that, and when none of the modules that only plotting and fitting need has been loaded.
+
+    python tmStartupTime.py [--budget 0.25] [--repeat 5]
+
+The exit code is 1 when a module is over budget, so the check can run after every change.
+tests/test_startup.py makes the same check part of the tests.
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+# The modules that must start fast, and the modules they may not load at import time
+CHECKED_MODULES = ['tmUtility', 'tmAnalyse', 'tmHotspots', 'tmResultStore']
+HEAVY_MODULES = ['matplotlib', 'scipy']
+
+BASELINE = 'import numpy, pandas'
+
+MEASURE = '''
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, ' '.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+
+def MeasureImport(statement, repeat):
+
+    """
+    Run the import statement in fresh processes
+    :param statement: the statement to time, i.e. 'import tmUtility'
+    :param repeat: the number of processes
+    :return: (the fastest time in seconds, the heavy modules that were loaded)
+    """
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [directory, os.environ.get('PYTHONPATH')])))
+    fastest = None
+    loaded = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', MEASURE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, env=env, cwd=directory)
+        if result.returncode != 0:
+            print(result.stderr)
+            sys.exit(f'"{statement}" failed')
+        elapsed, *loaded = result.stdout.split()
+        fastest = float(elapsed) if fastest is None else min(fastest, float(elapsed))
+    return fastest, loaded
+
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the import time of the analysis modules')
+    parser.add_argument('--budget', type=float, default=0.25,
+                        help='the time in seconds a module may add to importing numpy and pandas')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of measurements per module')
+    args = parser.parse_args(argv)
+
+    baseline, _ = MeasureImport(BASELINE, args.repeat)
+    print(f'{BASELINE:<24} {baseline:6.3f} s')
+
+    failed = False
+    for module in CHECKED_MODULES:
+        elapsed, loaded = MeasureImport(f'import {module}', args.repeat)
+        problems = []
+        if elapsed > baseline + args.budget:
+            problems.append(f'{elapsed - baseline:.3f} s over numpy and pandas, the budget is {args.budget:.3f} s')
+        if loaded:
+            problems.append(f'loads {", ".join(loaded)}')
+        print(f'{"import " + module:<24} {elapsed:6.3f} s  {"; ".join(problems) if problems else "ok"}')
+        failed = failed or len(problems) > 0
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
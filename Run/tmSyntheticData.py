@@ -0,0 +1,381 @@
+'''
+Write synthetic TrackMate exports, so that the analyses can be tried out and timed without microscope data.
+
+The files have the layout of a TrackMate export: the row with the column names, three commentary rows (the
+feature names, the short names and the units) and then the data. The tracks are made as follows:
+
+    - the lifetime of a track is drawn from an exponential distribution, or a mixture of them (taus, weights),
+      and the track has a spot in every frame of its lifetime (at least min_spots spots)
+    - the start frame is uniform over the recording
+    - a fraction of the tracks binds at a number of hotspots, the others anywhere on the image
+    - the spots of a track diffuse slowly around the binding location and have a localisation error
+
+The track features (duration, mean location, speeds, distances) are calculated from the spots, as TrackMate does.
+
+    python tmSyntheticData.py <directory> <number of tracks> [--tau 0.5 --tau 2 --weight 0.8 --weight 0.2] ...
+'''
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv
+except ImportError:
+    pa = None
+
+
+# Per column the three commentary rows of a TrackMate export: the feature name, the short name and the unit
+
+TRACKS_COLUMNS = {
+    'LABEL': ('Label', 'Label', ''),
+    'TRACK_INDEX': ('Track index', 'Index', ''),
+    'TRACK_ID': ('Track ID', 'ID', ''),
+    'NUMBER_SPOTS': ('Number of spots in track', 'N spots', ''),
+    'NUMBER_GAPS': ('Number of gaps', 'N gaps', ''),
+    'NUMBER_SPLITS': ('Number of split events', 'N splits', ''),
+    'NUMBER_MERGES': ('Number of merge events', 'N merges', ''),
+    'NUMBER_COMPLEX': ('Number of complex points', 'N complex', ''),
+    'LONGEST_GAP': ('Longest gap', 'Lgst gap', ''),
+    'TRACK_DURATION': ('Track duration', 'Duration', '(sec)'),
+    'TRACK_START': ('Track start', 'Track start', '(sec)'),
+    'TRACK_STOP': ('Track stop', 'Track stop', '(sec)'),
+    'TRACK_DISPLACEMENT': ('Track displacement', 'Track disp.', '(micron)'),
+    'TRACK_X_LOCATION': ('Track mean X', 'Track X', '(micron)'),
+    'TRACK_Y_LOCATION': ('Track mean Y', 'Track Y', '(micron)'),
+    'TRACK_Z_LOCATION': ('Track mean Z', 'Track Z', '(micron)'),
+    'TRACK_MEAN_SPEED': ('Track mean speed', 'Mean sp.', '(micron/sec)'),
+    'TRACK_MAX_SPEED': ('Track max speed', 'Max speed', '(micron/sec)'),
+    'TRACK_MIN_SPEED': ('Track min speed', 'Min speed', '(micron/sec)'),
+    'TRACK_MEDIAN_SPEED': ('Track median speed', 'Med. speed', '(micron/sec)'),
+    'TRACK_STD_SPEED': ('Track std speed', 'Std speed', '(micron/sec)'),
+    'TRACK_MEAN_QUALITY': ('Track mean quality', 'Mean Q', '(quality)'),
+    'TOTAL_DISTANCE_TRAVELED': ('Total distance traveled', 'Total dist.', '(micron)'),
+    'MAX_DISTANCE_TRAVELED': ('Max distance traveled', 'Max dist.', '(micron)'),
+    'CONFINEMENT_RATIO': ('Confinement ratio', 'Cfn. ratio', ''),
+    'MEAN_STRAIGHT_LINE_SPEED': ('Mean straight line speed', 'Mn. v. line', '(micron/sec)'),
+    'LINEARITY_OF_FORWARD_PROGRESSION': ('Linearity of forward progression', 'Fwd. progr.', ''),
+    'MEAN_DIRECTIONAL_CHANGE_RATE': ('Mean directional change rate', 'Mn. γ rate', '(rad/sec)'),
+}
+
+SPOTS_COLUMNS = {
+    'LABEL': ('Label', 'Label', ''),
+    'ID': ('Spot ID', 'Spot ID', ''),
+    'TRACK_ID': ('Track ID', 'Track ID', ''),
+    'QUALITY': ('Quality', 'Quality', '(quality)'),
+    'POSITION_X': ('X', 'X', '(micron)'),
+    'POSITION_Y': ('Y', 'Y', '(micron)'),
+    'POSITION_Z': ('Z', 'Z', '(micron)'),
+    'POSITION_T': ('T', 'T', '(sec)'),
+    'FRAME': ('Frame', 'Frame', ''),
+    'RADIUS': ('Radius', 'R', '(micron)'),
+    'VISIBILITY': ('Visibility', 'Visibility', ''),
+    'MANUAL_SPOT_COLOR': ('Manual spot color', 'Spot color', '(color)'),
+    'MEAN_INTENSITY_CH1': ('Mean intensity ch1', 'Mean ch1', '(counts)'),
+    'MEDIAN_INTENSITY_CH1': ('Median intensity ch1', 'Median ch1', '(counts)'),
+    'MIN_INTENSITY_CH1': ('Min intensity ch1', 'Min ch1', '(counts)'),
+    'MAX_INTENSITY_CH1': ('Max intensity ch1', 'Max ch1', '(counts)'),
+    'TOTAL_INTENSITY_CH1': ('Sum intensity ch1', 'Sum ch1', '(counts)'),
+    'STD_INTENSITY_CH1': ('Std intensity ch1', 'Std ch1', '(counts)'),
+    'CONTRAST_CH1': ('Contrast ch1', 'Ctrst ch1', ''),
+    'SNR_CH1': ('Signal/Noise ratio ch1', 'SNR ch1', ''),
+}
+
+# The tracks are generated and written in chunks of this many tracks, which bounds the memory use
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def DrawLifetimes(rng, n, taus, weights=None):
+
+    """
+    :param rng: a numpy Generator
+    :param n: the number of lifetimes
+    :param taus: the mean lifetime of every component in seconds
+    :param weights: the fraction of every component, by default equal fractions
+    :return: n lifetimes in seconds
+    """
+
+    taus = np.asarray(taus, dtype=np.float64)
+    weights = np.full(len(taus), 1 / len(taus)) if weights is None else np.asarray(weights, dtype=np.float64)
+    components = rng.choice(len(taus), size=n, p=weights / weights.sum())
+    return rng.exponential(taus[components])
+
+
+def DrawLocations(rng, n, image_size, hotspots, hotspot_fraction, hotspot_radius):
+
+    """
+    :param rng: a numpy Generator
+    :param n: the number of locations
+    :param image_size: the size of the (square) image in micrometer
+    :param hotspots: a (number of hotspots, 2) array with their centres in micrometer
+    :param hotspot_fraction: the fraction of the locations that is at a hotspot
+    :param hotspot_radius: the standard deviation of the locations around a hotspot centre in micrometer
+    :return: (x, y) in micrometer
+    """
+
+    x = rng.uniform(0, image_size, n)
+    y = rng.uniform(0, image_size, n)
+    if len(hotspots) > 0 and hotspot_fraction > 0:
+        at_hotspot = np.flatnonzero(rng.random(n) < hotspot_fraction)
+        centres = hotspots[rng.integers(0, len(hotspots), len(at_hotspot))]
+        x[at_hotspot] = centres[:, 0] + rng.normal(0, hotspot_radius, len(at_hotspot))
+        y[at_hotspot] = centres[:, 1] + rng.normal(0, hotspot_radius, len(at_hotspot))
+    return x, y
+
+
+def MakeChunk(rng, first_track_id, first_spot_id, n, hotspots, frame_time, nr_frames, taus, weights, min_spots,
+              image_size, hotspot_fraction, hotspot_radius, diffusion, localisation_error, untracked_fraction):
+
+    """
+    Make n tracks and their spots, see GenerateRecording for the parameters
+    :return: (tracks, spots) dataframes with the columns of TRACKS_COLUMNS and SPOTS_COLUMNS
+    """
+
+    # The number of spots follows from the lifetime, a track can not be longer than the recording.
+    # Only molecules that stay bound for min_spots - 1 frames make a track. As the exponential distribution has no
+    # memory, their lifetime is that minimum plus an exponential lifetime.
+    lifetimes = (min_spots - 1) * frame_time + DrawLifetimes(rng, n, taus, weights)
+    nr_spots = np.minimum(1 + np.floor(lifetimes / frame_time), nr_frames).astype(np.int64)
+    start_frame = rng.integers(0, nr_frames - nr_spots + 1)
+    track_x, track_y = DrawLocations(rng, n, image_size, hotspots, hotspot_fraction, hotspot_radius)
+
+    # The spots of all tracks, track after track. first is the position of the first spot of every track.
+    nr_all = int(nr_spots.sum())
+    first = np.concatenate(([0], np.cumsum(nr_spots)[:-1]))
+    track_of_spot = np.repeat(np.arange(n), nr_spots)
+    frame = np.repeat(start_frame - first, nr_spots) + np.arange(nr_all)
+
+    # A random walk from the binding location, plus the localisation error
+    walk = rng.normal(0, np.sqrt(2 * diffusion * frame_time), (nr_all, 2))
+    walk[first] = 0
+    walk = np.cumsum(walk, axis=0)
+    walk -= np.repeat(walk[first], nr_spots, axis=0)
+    position = walk + rng.normal(0, localisation_error, (nr_all, 2))
+    position[:, 0] += np.repeat(track_x, nr_spots)
+    position[:, 1] += np.repeat(track_y, nr_spots)
+    position = np.clip(position, 0, np.nextafter(image_size, 0))
+    quality = rng.gamma(4.0, 10.0, nr_all)
+
+    # The steps within the tracks (a track with k spots has k - 1 steps) and their offsets per track
+    step = np.diff(position, axis=0)
+    within = np.ones(nr_all - 1, dtype=bool)
+    within[first[1:] - 1] = False
+    step = step[within]
+    step_first = first - np.arange(n)
+    nr_steps = nr_spots - 1
+    distance = np.hypot(step[:, 0], step[:, 1])
+    speed = distance / frame_time
+
+    # The median speed from the speeds sorted within every track
+    sorted_speed = speed[np.lexsort((speed, np.repeat(np.arange(n), nr_steps)))]
+    median_speed = (sorted_speed[step_first + (nr_steps - 1) // 2] + sorted_speed[step_first + nr_steps // 2]) / 2
+    mean_speed = np.add.reduceat(speed, step_first) / nr_steps
+    mean_square = np.add.reduceat(speed * speed, step_first) / nr_steps
+
+    # The directional change is the angle between a step and the step before it, the first step of a track has
+    # none, so a track with one step has no directional change rate
+    angle = np.arctan2(step[:, 1], step[:, 0])
+    change = np.abs(np.angle(np.exp(1j * np.diff(angle, prepend=0))))
+    change[step_first] = 0
+    total_change = np.add.reduceat(change, step_first)
+    directional_change = np.where(nr_steps > 1, total_change / np.maximum(nr_steps - 1, 1) / frame_time, np.nan)
+
+    last = first + nr_spots - 1
+    duration = nr_steps * frame_time
+    total_distance = np.add.reduceat(distance, step_first)
+    displacement = np.hypot(*(position[last] - position[first]).T)
+    from_start = np.hypot(*(position - np.repeat(position[first], nr_spots, axis=0)).T)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        confinement = np.where(total_distance > 0, displacement / total_distance, 0.0)
+        straight_line_speed = displacement / duration
+        linearity = np.where(mean_speed > 0, straight_line_speed / mean_speed, 0.0)
+
+    track_ids = first_track_id + np.arange(n)
+    tracks = pd.DataFrame({
+        'LABEL': 'Track_' + pd.Series(track_ids).astype(str),
+        'TRACK_INDEX': track_ids,
+        'TRACK_ID': track_ids,
+        'NUMBER_SPOTS': nr_spots,
+        'NUMBER_GAPS': 0,
+        'NUMBER_SPLITS': 0,
+        'NUMBER_MERGES': 0,
+        'NUMBER_COMPLEX': 0,
+        'LONGEST_GAP': 0,
+        'TRACK_DURATION': duration,
+        'TRACK_START': start_frame * frame_time,
+        'TRACK_STOP': (start_frame + nr_steps) * frame_time,
+        'TRACK_DISPLACEMENT': displacement,
+        'TRACK_X_LOCATION': np.add.reduceat(position[:, 0], first) / nr_spots,
+        'TRACK_Y_LOCATION': np.add.reduceat(position[:, 1], first) / nr_spots,
+        'TRACK_Z_LOCATION': 0.0,
+        'TRACK_MEAN_SPEED': mean_speed,
+        'TRACK_MAX_SPEED': np.maximum.reduceat(speed, step_first),
+        'TRACK_MIN_SPEED': np.minimum.reduceat(speed, step_first),
+        'TRACK_MEDIAN_SPEED': median_speed,
+        'TRACK_STD_SPEED': np.sqrt(np.maximum(mean_square - mean_speed * mean_speed, 0)),
+        'TRACK_MEAN_QUALITY': np.add.reduceat(quality, first) / nr_spots,
+        'TOTAL_DISTANCE_TRAVELED': total_distance,
+        'MAX_DISTANCE_TRAVELED': np.maximum.reduceat(from_start, first),
+        'CONFINEMENT_RATIO': confinement,
+        'MEAN_STRAIGHT_LINE_SPEED': straight_line_speed,
+        'LINEARITY_OF_FORWARD_PROGRESSION': linearity,
+        'MEAN_DIRECTIONAL_CHANGE_RATE': directional_change,
+    })
+
+    # Spots that were detected but not linked into a track have no TRACK_ID
+    nr_untracked = rng.binomial(nr_all, untracked_fraction) if untracked_fraction > 0 else 0
+    if nr_untracked > 0:
+        frame = np.concatenate((frame, rng.integers(0, nr_frames, nr_untracked)))
+        position = np.concatenate((position, rng.uniform(0, image_size, (nr_untracked, 2))))
+        quality = np.concatenate((quality, rng.gamma(2.0, 10.0, nr_untracked)))
+    nr_spots_all = nr_all + nr_untracked
+    spot_track_ids = pd.array(np.concatenate((first_track_id + track_of_spot, np.zeros(nr_untracked, np.int64))),
+                              dtype='Int64')
+    spot_track_ids[nr_all:] = pd.NA
+
+    spot_ids = first_spot_id + np.arange(nr_spots_all)
+    intensity = rng.gamma(8.0, 40.0, nr_spots_all) + 100
+    noise = rng.gamma(4.0, 5.0, nr_spots_all)
+    spots = pd.DataFrame({
+        'LABEL': 'ID' + pd.Series(spot_ids).astype(str),
+        'ID': spot_ids,
+        'TRACK_ID': spot_track_ids,
+        'QUALITY': quality,
+        'POSITION_X': position[:, 0],
+        'POSITION_Y': position[:, 1],
+        'POSITION_Z': 0.0,
+        'POSITION_T': frame * frame_time,
+        'FRAME': frame,
+        'RADIUS': 0.5,
+        'VISIBILITY': 1,
+        'MANUAL_SPOT_COLOR': None,
+        'MEAN_INTENSITY_CH1': intensity,
+        'MEDIAN_INTENSITY_CH1': np.round(intensity * 0.95),
+        'MIN_INTENSITY_CH1': np.round(intensity * 0.5),
+        'MAX_INTENSITY_CH1': np.round(intensity * 1.8),
+        'TOTAL_INTENSITY_CH1': np.round(intensity * 29),
+        'STD_INTENSITY_CH1': noise,
+        'CONTRAST_CH1': (intensity - 100) / (intensity + 100),
+        'SNR_CH1': (intensity - 100) / noise,
+    })
+    return tracks, spots
+
+
+def WriteTrackMateHeader(f, columns):
+
+    """
+    Write the column names and the three commentary rows
+    :param f: a file opened in binary mode
+    :param columns: TRACKS_COLUMNS or SPOTS_COLUMNS
+    :return: nothing
+    """
+
+    rows = [list(columns)] + [[commentary[i] for commentary in columns.values()] for i in range(3)]
+    f.write(''.join(','.join(row) + '\n' for row in rows).encode('utf-8'))
+
+
+def WriteTrackMateRows(f, df):
+
+    """
+    Append the data rows, with pyarrow when it is available, as it writes csv many times faster than pandas
+    :param f: a file opened in binary mode
+    :param df: the dataframe
+    :return: nothing
+    """
+
+    if pa is not None:
+        options = pyarrow.csv.WriteOptions(include_header=False, quoting_style='none')
+        pyarrow.csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), f, options)
+    else:
+        f.write(df.to_csv(header=False, index=False, lineterminator='\n').encode('utf-8'))
+
+
+def GenerateRecording(directory, nr_tracks, frame_time=0.05, nr_frames=2000, taus=(0.5,), weights=None, min_spots=2,
+                      image_size=81, nr_hotspots=20, hotspot_fraction=0.2, hotspot_radius=0.1, diffusion=0.005,
+                      localisation_error=0.02, untracked_fraction=0.0, shuffle_spots=True, seed=None,
+                      chunk_size=DEFAULT_CHUNK_SIZE):
+
+    """
+    Write tracks.csv and spots.csv of a synthetic recording
+    :param directory: the directory for the files, it is created when needed
+    :param nr_tracks: the number of tracks
+    :param frame_time: the time between frames in seconds
+    :param nr_frames: the number of frames of the recording
+    :param taus: the mean lifetime of every exponential component in seconds
+    :param weights: the fraction of the tracks of every component, by default equal fractions.
+                    FitLifetimes reports the fractions before the short tracks are left out, which are larger
+                    for the short lifetimes.
+    :param min_spots: the minimum number of spots of a track
+    :param image_size: the size of the (square) image in micrometer
+    :param nr_hotspots: the number of hotspots
+    :param hotspot_fraction: the fraction of the tracks that is at a hotspot
+    :param hotspot_radius: the standard deviation of the locations around a hotspot in micrometer
+    :param diffusion: the diffusion coefficient of a bound molecule in micrometer^2/s
+    :param localisation_error: the standard deviation of the localisation error in micrometer
+    :param untracked_fraction: the number of spots without track, as fraction of the spots in tracks
+    :param shuffle_spots: if True the spots are in random order, otherwise track after track
+    :param seed: the seed of the random generator, the same seed gives the same files
+    :param chunk_size: the number of tracks generated at a time
+    :return: (the tracks file, the spots file)
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    tracks_file = os.path.join(directory, 'tracks.csv')
+    spots_file = os.path.join(directory, 'spots.csv')
+
+    rng = np.random.default_rng(seed)
+    margin = min(1.0, image_size / 4)
+    hotspots = rng.uniform(margin, image_size - margin, (nr_hotspots, 2))
+
+    first_spot_id = 0
+    with open(tracks_file, 'wb') as tracks_f, open(spots_file, 'wb') as spots_f:
+        WriteTrackMateHeader(tracks_f, TRACKS_COLUMNS)
+        WriteTrackMateHeader(spots_f, SPOTS_COLUMNS)
+        for first_track_id in range(0, nr_tracks, chunk_size):
+            n = min(chunk_size, nr_tracks - first_track_id)
+            tracks, spots = MakeChunk(rng, first_track_id, first_spot_id, n, hotspots, frame_time, nr_frames, taus,
+                                      weights, min_spots, image_size, hotspot_fraction, hotspot_radius, diffusion,
+                                      localisation_error, untracked_fraction)
+            if shuffle_spots:
+                spots = spots.iloc[rng.permutation(len(spots))]
+            WriteTrackMateRows(tracks_f, tracks)
+            WriteTrackMateRows(spots_f, spots)
+            first_spot_id += len(spots)
+
+    return tracks_file, spots_file
+
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic TrackMate recording (tracks.csv and spots.csv)')
+    parser.add_argument('directory', help='the directory for the files')
+    parser.add_argument('nr_tracks', type=int, help='the number of tracks')
+    parser.add_argument('--tau', type=float, action='append', help='mean lifetime in s, repeat for a mixture')
+    parser.add_argument('--weight', type=float, action='append', help='the fraction of every --tau')
+    parser.add_argument('--frame-time', type=float, default=0.05, help='the time between frames in s')
+    parser.add_argument('--frames', type=int, default=2000, help='the number of frames')
+    parser.add_argument('--min-spots', type=int, default=2, help='the minimum number of spots of a track')
+    parser.add_argument('--hotspots', type=int, default=20, help='the number of hotspots')
+    parser.add_argument('--hotspot-fraction', type=float, default=0.2, help='the fraction of tracks at a hotspot')
+    parser.add_argument('--untracked', type=float, default=0.0, help='spots without track, as fraction')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generator')
+    args = parser.parse_args(argv)
+
+    if args.weight is not None and len(args.weight) != len(args.tau or []):
+        sys.exit('Give a --weight for every --tau')
+
+    start_time = time.perf_counter()
+    tracks_file, spots_file = GenerateRecording(args.directory, args.nr_tracks, frame_time=args.frame_time,
+                                                nr_frames=args.frames, taus=args.tau or (0.5,), weights=args.weight,
+                                                min_spots=args.min_spots, nr_hotspots=args.hotspots,
+                                                hotspot_fraction=args.hotspot_fraction,
+                                                untracked_fraction=args.untracked, seed=args.seed)
+    print(f'Wrote {tracks_file} and {spots_file} in {time.perf_counter() - start_time:.1f} s')
+
+
+if __name__ == '__main__':
+    Main()
@@ -1,10 +1,30 @@
 
 import sys
+import os
+import time
+import json
+import re
+import shutil
+import importlib.util
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import scipy.optimize
-from scipy.optimize import OptimizeWarning
+
+# matplotlib and scipy (through tmFitting) take longer to import than everything else together, while reading and
+# filtering tracks does not need them. They are therefore imported in the functions that plot or fit, so a script
+# that only computes (i.e. a density map or bounding boxes) does not pay for them. tmStartupTime.py checks this.
+
+
+def __getattr__(name):
+
+    """
+    monoExp, FitDuration and BootstrapDuration moved to tmFitting, but can still be imported from here.
+    They are imported on first use, so that scipy is not loaded with this module.
+    """
+
+    if name in ('monoExp', 'FitDuration', 'BootstrapDuration'):
+        import tmFitting
+        return getattr(tmFitting, name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
 ######################################################################################
@@ -12,20 +32,130 @@ from scipy.optimize import OptimizeWarning
 ######################################################################################
 
 
-def ReadTrackMateData(csvfilename, istrack):
+# Columns that are never used. They are not parsed at all.
+
+UNUSED_TRACKS_COLUMNS = ['NUMBER_SPLITS', 'NUMBER_MERGES', 'TRACK_Z_LOCATION', 'NUMBER_COMPLEX']
+UNUSED_SPOTS_COLUMNS = ['POSITION_Z', 'MANUAL_SPOT_COLOR']
+
+# The known TrackMate columns with a compact dtype. Floating point columns are parsed directly as float32,
+# channel dependent columns (i.e. MEAN_INTENSITY_CH1) included. Integer columns become 'int32' after parsing,
+# or the nullable 'Int32' when values are missing (a spot that is not part of a track has no TRACK_ID).
+# All other columns, LABEL included, keep the inferred dtype.
+
+INTEGER_COLUMNS = ['TRACK_INDEX', 'TRACK_ID', 'ID', 'NUMBER_SPOTS', 'NUMBER_GAPS', 'LONGEST_GAP', 'FRAME', 'VISIBILITY']
+FLOAT_COLUMNS = ['TRACK_DURATION', 'TRACK_START', 'TRACK_STOP', 'TRACK_DISPLACEMENT',
+                 'TRACK_X_LOCATION', 'TRACK_Y_LOCATION',
+                 'TRACK_MEAN_SPEED', 'TRACK_MAX_SPEED', 'TRACK_MIN_SPEED', 'TRACK_MEDIAN_SPEED', 'TRACK_STD_SPEED',
+                 'TRACK_MEAN_QUALITY', 'TOTAL_DISTANCE_TRAVELED', 'MAX_DISTANCE_TRAVELED', 'CONFINEMENT_RATIO',
+                 'MEAN_STRAIGHT_LINE_SPEED', 'LINEARITY_OF_FORWARD_PROGRESSION', 'MEAN_DIRECTIONAL_CHANGE_RATE',
+                 'QUALITY', 'POSITION_X', 'POSITION_Y', 'POSITION_T', 'RADIUS',
+                 'ELLIPSE_X0', 'ELLIPSE_Y0', 'ELLIPSE_MAJOR', 'ELLIPSE_MINOR', 'ELLIPSE_THETA', 'ELLIPSE_ASPECTRATIO',
+                 'AREA', 'PERIMETER', 'CIRCULARITY', 'SOLIDITY', 'SHAPE_INDEX']
+
+# pyarrow parses multithreaded and is considerably faster than the C parser, but it is optional
+# Only check that it is installed, pandas imports it when it is used
+PARSER_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+
+# The binary cache lives in a directory next to the csv file, i.e. 'tracks.csv' is cached in 'tracks.csv.cache'
+# Every column is stored as a separate .npy file, the meta.json file describes the columns and the csv file
+# the cache was made from. Bump CACHE_VERSION whenever the layout changes, old caches are then simply rebuilt.
+
+CACHE_SUFFIX = '.cache'
+CACHE_VERSION = 2
+
+
+def ReadTrackMateData(csvfilename, istrack, use_cache=True, report=False, row_filter=None):
 
     """
     Function is not to be called externally, but by ReadTracksData or ReadSpotsData
     Read in the data file (it can be either 'tracks' or 'spots').
     Row 0 contains the header.
     Rows 1, 2 and 3 contain commentary, so skip those.
+    Only the used columns are parsed, with the compact dtypes from TrackMateSchema and SetIntegerDtypes.
+    If use_cache is True, the data is read from the binary cache next to the csv file when that cache is
+    still valid, otherwise the csv file is parsed and the cache is (re)written.
+    If a row_filter is specified, only the rows it selects are returned. From the cache only the columns of the
+    filter are read completely, of the other columns only the selected rows are taken.
     :param csvfilename:
     :param istrack: A boolean value indicating whether it is tracks data (True) or spots data (False)
+    :param use_cache: A boolean value indicating whether the binary cache is used
+    :param report: print the time it took to read the data and the memory used per column
+    :param row_filter: optional TrackFilter
     :return: the dataframe with tracks
     """
 
+    start_time = time.perf_counter()
+
+    tmd = None
+    source = 'cache'
+    if use_cache:
+        tmd = ReadTrackMateCache(csvfilename, istrack, row_filter)
+
+    if tmd is None:
+        engine = PARSER_ENGINE
+        usecols, dtype = TrackMateSchema(csvfilename, istrack)
+        if engine == 'pyarrow':
+            tmd = ParseTrackMateCsv(csvfilename, usecols, dtype, engine)
+            if tmd is None:
+                engine = 'c'
+        if engine == 'c':
+            tmd = ParseTrackMateCsv(csvfilename, usecols, dtype, engine)
+            if tmd is None:
+                print(f'Problem parsing {csvfilename}')
+                sys.exit()
+        source = f'csv file ({engine} parser)'
+        SetIntegerDtypes(tmd)
+
+        if use_cache:
+            WriteTrackMateCache(csvfilename, istrack, tmd)
+        if row_filter is not None:
+            tmd = row_filter.Apply(tmd)
+
+    if report:
+        ReportTrackMateData(csvfilename, tmd, source, time.perf_counter() - start_time)
+    return tmd
+
+
+def ParseTrackMateCsv(csvfilename, usecols, dtype, engine):
+
+    """
+    Parse the data file with the 'pyarrow' or the 'c' parser
+    :param csvfilename:
+    :param usecols: the positions of the columns to parse
+    :param dtype: a dictionary with the dtype per column name
+    :param engine: 'pyarrow' or 'c'
+    :return: the dataframe, or None if the file could not be parsed
+    """
+
+    try:
+        if engine == 'pyarrow':
+            # The pyarrow parser only accepts a number of rows to skip, so the names are supplied separately.
+            # It can not turn an integer column with missing values (i.e. TRACK_ID of a spot that is not part of a
+            # track) into numpy integers, so the integer columns are parsed as nullable, see SetIntegerDtypes.
+            columns = ReadTrackMateHeader(csvfilename)
+            names = [columns[i] for i in usecols]
+            dtype = dict(dtype, **{column: 'Int32' for column in INTEGER_COLUMNS if column in names})
+            return pd.read_csv(csvfilename, header=None, skiprows=4, names=names,
+                               usecols=usecols, dtype=dtype, engine='pyarrow')
+        else:
+            return pd.read_csv(csvfilename, header=0, skiprows=[1, 2, 3], usecols=usecols, dtype=dtype, engine='c')
+    except FileNotFoundError:
+        print(f'Could not open {csvfilename}')
+        sys.exit()
+    except:
+        return None
+
+
+def ReadTrackMateHeader(csvfilename):
+
+    """
+    Read only the column names of the data file
+    :param csvfilename:
+    :return: the list of column names
+    """
+
     try:
-        tmd = pd.read_csv(csvfilename, header=0, skiprows=[1, 2, 3])
+        return list(pd.read_csv(csvfilename, header=0, nrows=0).columns)
     except FileNotFoundError:
         print(f'Could not open {csvfilename}')
         sys.exit()
@@ -33,24 +163,225 @@ def ReadTrackMateData(csvfilename, istrack):
         print(f'Problem parsing {csvfilename}')
         sys.exit()
 
-    # Drop unused columns for 'tracks' data or 'plots' data
-    try:
-        if istrack:
-            tmd.drop([ 'NUMBER_SPLITS', 'NUMBER_MERGES', 'TRACK_Z_LOCATION',
-                      'NUMBER_COMPLEX'], axis=1, inplace=True)
-        else:
-            tmd.drop(['POSITION_Z', 'MANUAL_SPOT_COLOR'], axis=1, inplace=True)
-        return tmd
-    except KeyError:
+
+def TrackMateSchema(csvfilename, istrack):
+
+    """
+    Determine which columns of the data file are parsed and with what dtype
+    :param csvfilename:
+    :param istrack: A boolean value indicating whether it is tracks data (True) or spots data (False)
+    :return: the positions of the columns to parse and a dictionary with the parse dtype per column name
+    """
+
+    columns = ReadTrackMateHeader(csvfilename)
+    unused = UNUSED_TRACKS_COLUMNS if istrack else UNUSED_SPOTS_COLUMNS
+    if not set(unused).issubset(columns):
         print(f'Unexpected column names in {csvfilename}')
         sys.exit()
 
+    usecols = [i for i, column in enumerate(columns) if column not in unused]
+    dtype = {}
+    for i in usecols:
+        column = columns[i]
+        if column in FLOAT_COLUMNS or '_CH' in column:
+            dtype[column] = 'float32'
+    return usecols, dtype
+
+
+def SetIntegerDtypes(tmd):
+
+    """
+    Give the integer columns the 'int32' dtype, or 'Int32' if the column has missing values.
+    This is done after parsing, because both parsers are much slower when they have to produce these dtypes.
+    :param tmd: the dataframe, it is changed in place
+    :return: nothing
+    """
+
+    for column in INTEGER_COLUMNS:
+        if column in tmd.columns:
+            tmd[column] = tmd[column].astype('Int32' if tmd[column].hasnans else 'int32')
+
+
+def ReportTrackMateData(csvfilename, tmd, source, elapsed):
+
+    """
+    Print how long reading the data took and how much memory every column takes
+    :param csvfilename:
+    :param tmd: the dataframe
+    :param source: where the data came from
+    :param elapsed: the time it took to read the data in sec
+    :return: nothing
+    """
+
+    memory = tmd.memory_usage(index=False, deep=True)
+    print(f'Read {tmd.shape[0]} rows of {csvfilename} from {source} in {elapsed:.3f} s')
+    for column in tmd.columns:
+        print(f'    {column:35s} {str(tmd[column].dtype):10s} {memory[column]:12d} bytes')
+    print(f'    {"Total":35s} {"":10s} {memory.sum():12d} bytes')
+
+
+def CsvFingerprint(csvfilename):
+
+    """
+    Identify the current version of a csv file by its full path, size and modification time
+    :param csvfilename:
+    :return: a dictionary with the fingerprint, or None if the file does not exist
+    """
+
+    try:
+        stat = os.stat(csvfilename)
+    except OSError:
+        return None
+    return {'source': os.path.abspath(csvfilename), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def ReadTrackMateCache(csvfilename, istrack, row_filter=None, columns=None):
+
+    """
+    Read the dataframe from the binary cache of a csv file
+    :param csvfilename:
+    :param istrack: A boolean value indicating whether it is tracks data (True) or spots data (False)
+    :param row_filter: optional TrackFilter, only the rows it selects are read
+    :param columns: optional list of column names, only these columns are read
+    :return: the dataframe, or None if there is no valid cache
+    """
+
+    cache_dir = csvfilename + CACHE_SUFFIX
+    fingerprint = CsvFingerprint(csvfilename)
+    if fingerprint is None:
+        return None
+
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # The cache is only valid if it was made from exactly this csv file
+    if meta.get('version') != CACHE_VERSION or meta.get('istrack') != istrack or meta.get('fingerprint') != fingerprint:
+        return None
+
+    try:
+        # First determine the selected rows from the columns the filter needs
+        rows = None
+        if row_filter is not None:
+            known = {column['name']: column for column in meta['columns']}
+            filter_columns = {name: ReadCacheColumn(cache_dir, known[name])
+                              for name in row_filter.Columns() if name in known}
+            rows = np.flatnonzero(row_filter.Mask(filter_columns))
+
+        data = {}
+        for column in meta['columns']:
+            if columns is None or column['name'] in columns:
+                data[column['name']] = ReadCacheColumn(cache_dir, column, rows)
+        tmd = pd.DataFrame(data)
+
+        # Keep the row numbers of the complete file, as RestrictTracksLength and friends do
+        if rows is not None:
+            tmd.index = rows
+        return tmd
+    except (OSError, ValueError, KeyError):
+        print(f'Cache for {csvfilename} is damaged, the csv file will be read instead')
+        return None
+
+
+def ReadCacheColumn(cache_dir, column, rows=None):
+
+    """
+    Read one column from the binary cache.
+    The files are memory mapped, so when rows are specified only those rows are actually read.
+    :param cache_dir:
+    :param column: the description of the column in meta.json
+    :param rows: optional array of row numbers
+    :return: the column as a numpy array or a Pandas series
+    """
+
+    def Load(file):
+        values = np.load(os.path.join(cache_dir, column['file'] + file), mmap_mode='r', allow_pickle=False)
+        return np.array(values) if rows is None else values[rows]
+
+    kind, dtype = column['kind'], column['dtype']
+    if kind == 'numeric':
+        return Load('.npy').astype(dtype, copy=False)
+    elif kind == 'nullable':
+        values = pd.Series(Load('.npy')).astype(dtype)
+        return values.mask(Load('.mask.npy'))
+    else:
+        codes = Load('.codes.npy')
+        categories = np.load(os.path.join(cache_dir, column['file'] + '.categories.npy'),
+                             allow_pickle=False).astype(object)
+        values = pd.Series(pd.Categorical.from_codes(codes, categories=categories))
+        return values if kind == 'category' else values.astype(dtype)
+
+
+def WriteTrackMateCache(csvfilename, istrack, tmd):
+
+    """
+    Write the dataframe to the binary cache of a csv file.
+    Integer columns are stored with the smallest dtype that holds them, nullable integer columns with a separate
+    mask of missing values and text columns as codes into a table of distinct values. A cache that can not be written is reported, but is not an error.
+    :param csvfilename:
+    :param istrack: A boolean value indicating whether it is tracks data (True) or spots data (False)
+    :param tmd: the dataframe as read from the csv file
+    :return: nothing
+    """
+
+    cache_dir = csvfilename + CACHE_SUFFIX
+    fingerprint = CsvFingerprint(csvfilename)
+    if fingerprint is None:
+        return
+
+    # Write into a temporary directory first, so that an interrupted write never leaves a valid looking cache
+    tmp_dir = cache_dir + '.tmp'
+    try:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        columns = []
+        for i, name in enumerate(tmd.columns):
+            column = tmd[name]
+            file = f'{i:03d}'
+            base = os.path.join(tmp_dir, file)
+            if isinstance(column.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(column.dtype):
+                kind = 'category' if isinstance(column.dtype, pd.CategoricalDtype) else 'text'
+                values = column.astype('category')
+                codes = pd.to_numeric(pd.Series(values.cat.codes), downcast='integer').to_numpy()
+                np.save(base + '.codes.npy', codes)
+                np.save(base + '.categories.npy', np.asarray(values.cat.categories, dtype=str))
+            elif isinstance(column.dtype, pd.api.extensions.ExtensionDtype):
+                # Nullable integers, i.e. the TRACK_ID of spots that are not part of a track
+                kind = 'nullable'
+                mask = column.isna().to_numpy()
+                values = pd.to_numeric(column.fillna(0), downcast='integer').to_numpy()
+                np.save(base + '.npy', values)
+                np.save(base + '.mask.npy', mask)
+            else:
+                kind = 'numeric'
+                values = column.to_numpy()
+                if np.issubdtype(values.dtype, np.integer):
+                    values = pd.to_numeric(column, downcast='integer').to_numpy()
+                np.save(base + '.npy', values)
+            columns.append({'name': name, 'kind': kind, 'dtype': str(column.dtype), 'file': file})
+
+        meta = {'version': CACHE_VERSION, 'istrack': istrack, 'fingerprint': fingerprint, 'columns': columns}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f'Could not write the cache for {csvfilename}, continuing without')
+
 
 def ReadTracksData(csvfilename,
                    min_spots=-1,
                    max_spots=-1,
                    min_time=-1,
-                   max_time=-1):
+                   max_time=-1,
+                   use_cache=True,
+                   report=False,
+                   track_filter=None):
 
     """
 
@@ -59,33 +390,38 @@ def ReadTracksData(csvfilename,
     :param max_spots: The largest number of sp[ots a tracks can have
     :param min_time: The low percentage cut-off of time, often 1 (%)
     :param max_time: The high percentage cut-off of time, ofteh 99 (%)
+    :param use_cache: Read from and write to the binary cache next to the csv file
+    :param report: Print the read time and the memory used per column
+    :param track_filter: optional TrackFilter with further restrictions, applied after the ones above
     :return:
     """
 
-    tracks = ReadTrackMateData(csvfilename, istrack=True)
-    if min_spots != -1 or max_spots != -1:
-        tracks = RestrictTracksLength(tracks, min_spots, max_spots)
+    # The restrictions are applied while reading, see TrackFilter
+    row_filter = TrackFilter().Length(min_spots, max_spots)
     if min_time != -1 or max_time != -1:
-      tracks = RestrictTracksTime(tracks,
-                                  tracks['TRACK_STOP'].max() * min_time/100,
-                                  tracks['TRACK_STOP'].max() * max_time/100)
-    return tracks
+        row_filter.TimePercentage(min_time, max_time)
+    if track_filter is not None:
+        row_filter.stages.extend(track_filter.stages)
+    if len(row_filter.stages) == 0:
+        row_filter = None
 
+    return ReadTrackMateData(csvfilename, istrack=True, use_cache=use_cache, report=report, row_filter=row_filter)
 
-def ReadSpotsData(csvfilename):
-    return ReadTrackMateData(csvfilename, istrack=False)
+
+def ReadSpotsData(csvfilename, use_cache=True, report=False):
+    return ReadTrackMateData(csvfilename, istrack=False, use_cache=use_cache, report=report)
 
 
 def RestrictTracksLength(tracks, minimum_track_length=-1, maximum_track_length=-1):
     """
     The function removes the tracks shorter  than minimum_track_length
-    :param tracks: the datafrane containing tracks
+    :param tracks: the datafrane containing tracks, or TrackArrays
     :param minimum_track_length (if -1 no minimum)
     :param maximum_track_length (if -1 no maximum)
     :return: the updates dataframe containing fewer tracks
     """
 
-    old_tracks_count = tracks.shape[0]
+    old_tracks_count = len(tracks)
     if minimum_track_length != -1 and maximum_track_length != -1:
         mask = (tracks['NUMBER_SPOTS'] >= minimum_track_length) & (tracks['NUMBER_SPOTS'] <= maximum_track_length)
         report = f'Tracks between {minimum_track_length} to {maximum_track_length} spots'
@@ -99,8 +435,8 @@ def RestrictTracksLength(tracks, minimum_track_length=-1, maximum_track_length=-
         print(f'No length restriction applied : total tracks: {old_tracks_count}')
         return tracks
 
-    tracks = tracks.loc[mask]
-    new_tracks_count = tracks.shape[0]
+    tracks = tracks.Select(mask) if isinstance(tracks, TrackArrays) else tracks.loc[mask]
+    new_tracks_count = len(tracks)
     print(f"{report} : eliminated {old_tracks_count - new_tracks_count} : selected/total tracks: {new_tracks_count}/{old_tracks_count}")
 
     return tracks
@@ -162,12 +498,30 @@ def RestrictTracksSpeed(tracks, min_speed=-1, max_speed=-1):
     return tracks
 
 
+def SquareMask(spots, x_min, y_min, x_max, y_max):
+
+    """
+    Determine which spots lie in a rectangle (borders included)
+    :param spots: The spots dataframe
+    :param x_min:
+    :param y_min:
+    :param x_max:
+    :param y_max:
+    :return: a boolean series, True for the spots in the rectangle
+    """
+
+    mask = (spots['POSITION_X'] >= x_min) & (spots['POSITION_X'] <= x_max)
+    mask = mask & (spots['POSITION_Y'] >= y_min) & (spots['POSITION_Y'] <= y_max)
+    return mask
+
+
 def RestrictTracksSquare(spots, x_min, y_min, x_max, y_max):
 
     """
     Only let tracks through that fit in a rectangle
     All parameters are needed
-    :param spots: The spots dataframe containing the spots to be restricted
+    With a SpatialIndex only the spots near the rectangle are looked at, which is much faster for small rectangles.
+    :param spots: The spots dataframe containing the spots to be restricted, or a SpatialIndex over the spots
     :param x_min:
     :param y_min:
     :param x_max:
@@ -175,11 +529,12 @@ def RestrictTracksSquare(spots, x_min, y_min, x_max, y_max):
     :return: The updated dataframe containing only the spots in the rectangle
     """
 
-    old_spots_count = spots.shape[0]
-    mask = (spots['POSITION_X'] >= x_min) & (spots['POSITION_X'] <= x_max)
-    mask = mask & (spots['POSITION_Y'] >= y_min) & (spots['POSITION_Y'] <= y_max)
-
-    spots = spots.loc[mask]
+    if isinstance(spots, SpatialIndex):
+        old_spots_count = spots.data.shape[0]
+        spots = spots.Rectangle(x_min, y_min, x_max, y_max)
+    else:
+        old_spots_count = spots.shape[0]
+        spots = spots.loc[SquareMask(spots, x_min, y_min, x_max, y_max)]
     new_spots_count = spots.shape[0]
 
     print(f'Square restriction: selected/total spots: {new_spots_count}/{old_spots_count}')
@@ -191,12 +546,17 @@ def FindSpotsForTracks(tracks, spots):
     """
     The function eliminates all the spots in the dataframe that are not part of any of the tracks in
     the tracks dataframe
+    When spots is a TrackIndex the spots are taken from the index, which is much faster. They are then
+    ordered on TRACK_ID and FRAME, rather than in the order of the spots file.
 
-    :param tracks:
-    :param spots:
-    :return: reduced spots dataframe
+    :param tracks: the tracks dataframe or TrackArrays
+    :param spots: the spots dataframe, a TrackIndex or SpotArrays
+    :return: reduced spots dataframe, or SpotArrays for SpotArrays
     """
 
+    if isinstance(spots, (TrackIndex, SpotArrays)):
+        return spots.SpotsForTracks(pd.unique(np.asarray(tracks['TRACK_ID'])))
+
     # Find all the TRACK_IDs and put them in a dataframe
     track_ids = tracks['TRACK_ID'].unique()
     track_ids = pd.DataFrame(track_ids, columns=['TRACK_ID'])
@@ -205,6 +565,831 @@ def FindSpotsForTracks(tracks, spots):
     reduced_spots = pd.merge(spots, track_ids, on='TRACK_ID')
     return reduced_spots
 
+
+def CalculateBoundingRectangles(spots):
+
+    """
+    Determine for every track the smallest rectangle that contains all its spots, in one pass over the spots
+    :param spots: the spots dataframe, a TrackIndex or SpotArrays, spots without TRACK_ID are ignored
+    :return: a dataframe indexed on TRACK_ID with the columns X_MIN, X_MAX, Y_MIN, Y_MAX, DELTA_X, DELTA_Y
+             and NUMBER_SPOTS
+    """
+
+    if isinstance(spots, (TrackIndex, SpotArrays)):
+        # The spots of a track are adjacent in the index, so every column can be reduced per track directly
+        starts = spots.offsets[:-1]
+        columns = spots.spots if isinstance(spots, TrackIndex) else spots
+        x = np.asarray(columns['POSITION_X'])
+        y = np.asarray(columns['POSITION_Y'])
+        rectangles = pd.DataFrame({'X_MIN': np.minimum.reduceat(x, starts),
+                                   'X_MAX': np.maximum.reduceat(x, starts),
+                                   'Y_MIN': np.minimum.reduceat(y, starts),
+                                   'Y_MAX': np.maximum.reduceat(y, starts),
+                                   'NUMBER_SPOTS': np.diff(spots.offsets)},
+                                  index=pd.Index(spots.track_ids, name='TRACK_ID'))
+    else:
+        rectangles = spots.groupby('TRACK_ID').agg(X_MIN=('POSITION_X', 'min'),
+                                                   X_MAX=('POSITION_X', 'max'),
+                                                   Y_MIN=('POSITION_Y', 'min'),
+                                                   Y_MAX=('POSITION_Y', 'max'),
+                                                   NUMBER_SPOTS=('POSITION_X', 'size'))
+    rectangles.insert(4, 'DELTA_X', rectangles['X_MAX'] - rectangles['X_MIN'])
+    rectangles.insert(5, 'DELTA_Y', rectangles['Y_MAX'] - rectangles['Y_MIN'])
+    return rectangles
+
+
+######################################################################################
+# A filter pipeline, to apply a number of restrictions on tracks in one go
+######################################################################################
+
+
+def RangeMask(values, minimum=-1, maximum=-1):
+
+    """
+    :param values: a numpy array
+    :param minimum: the smallest value let through (if -1 no minimum)
+    :param maximum: the largest value let through (if -1 no maximum)
+    :return: a boolean array, True for the values in the range (borders included)
+    """
+
+    mask = np.ones(len(values), dtype=bool)
+    if minimum != -1:
+        mask &= values >= minimum
+    if maximum != -1:
+        mask &= values <= maximum
+    return mask
+
+
+class TrackFilter:
+
+    """
+    A number of restrictions on tracks that are collected first and then applied in one go.
+    TrackFilter().Length(3, -1).Time(10, 90).Apply(tracks) selects the same tracks as RestrictTracksLength
+    followed by RestrictTracksTime, but the restrictions are combined into one mask and the table is copied once.
+    The number of tracks every restriction eliminates is still reported.
+    Given to ReadTracksData, the restrictions are applied while reading, so that from the cache only the
+    selected rows are read.
+    Every restriction returns the filter itself, so they can be chained.
+    """
+
+    def __init__(self):
+
+        # Every stage is (report, columns, predicate). The predicate gets a dictionary with the columns it needs,
+        # as numpy arrays, and the mask of the tracks selected by the stages before it. It returns a boolean array.
+        self.stages = []
+
+    def Where(self, report, columns, predicate):
+
+        """
+        Add any restriction
+        :param report: the description used when reporting the eliminated tracks
+        :param columns: the names of the columns the predicate needs
+        :param predicate: a function (columns, selected) -> boolean array, see __init__
+        :return: the filter
+        """
+
+        self.stages.append((report, list(columns), predicate))
+        return self
+
+    def Length(self, minimum_track_length=-1, maximum_track_length=-1):
+
+        """
+        As RestrictTracksLength
+        """
+
+        if minimum_track_length != -1 and maximum_track_length != -1:
+            report = f'Tracks between {minimum_track_length} to {maximum_track_length} spots'
+        elif minimum_track_length != -1:
+            report = f'Tracks longer than {minimum_track_length} spots'
+        elif maximum_track_length != -1:
+            report = f'Tracks shorter than {maximum_track_length} spots'
+        else:
+            return self
+        return self.Where(report, ['NUMBER_SPOTS'],
+                          lambda c, selected: RangeMask(c['NUMBER_SPOTS'], minimum_track_length, maximum_track_length))
+
+    def Time(self, begin_time=-1, end_time=-1):
+
+        """
+        As RestrictTracksTime: tracks that start at or after begin_time and stop at or before end_time (in sec)
+        """
+
+        if begin_time == -1 and end_time == -1:
+            return self
+        return self.Where('Time restriction', ['TRACK_START', 'TRACK_STOP'],
+                          lambda c, selected: (RangeMask(c['TRACK_START'], begin_time) &
+                                               RangeMask(c['TRACK_STOP'], -1, end_time)))
+
+    def TimePercentage(self, min_time=-1, max_time=-1):
+
+        """
+        As Time, but with the times as a percentage of the latest TRACK_STOP of the tracks selected so far,
+        which is what ReadTracksData does with min_time and max_time
+        """
+
+        def Predicate(c, selected):
+            last_stop = c['TRACK_STOP'][selected].max() if selected.any() else 0
+            begin_time = -1 if min_time == -1 else last_stop * min_time / 100
+            end_time = -1 if max_time == -1 else last_stop * max_time / 100
+            return RangeMask(c['TRACK_START'], begin_time) & RangeMask(c['TRACK_STOP'], -1, end_time)
+
+        if min_time == -1 and max_time == -1:
+            return self
+        return self.Where('Time restriction', ['TRACK_START', 'TRACK_STOP'], Predicate)
+
+    def Speed(self, min_speed=-1, max_speed=-1):
+
+        """
+        As RestrictTracksSpeed
+        """
+
+        if min_speed == -1 and max_speed == -1:
+            return self
+        return self.Where('Speed restriction', ['TRACK_MEAN_SPEED'],
+                          lambda c, selected: RangeMask(c['TRACK_MEAN_SPEED'], min_speed, max_speed))
+
+    def Columns(self):
+
+        """
+        :return: the names of the columns needed to apply the filter
+        """
+
+        return list(dict.fromkeys(name for report, columns, predicate in self.stages for name in columns))
+
+    def Mask(self, data):
+
+        """
+        Determine which tracks pass all restrictions and report per restriction how many it eliminated
+        :param data: the tracks dataframe, or a dictionary with (at least) the columns of the filter
+        :return: a boolean numpy array, True for the tracks that pass
+        """
+
+        columns = {name: np.asarray(data[name]) for name in self.Columns()}
+        nr_tracks = len(next(iter(columns.values()))) if columns else len(data)
+        selected = np.ones(nr_tracks, dtype=bool)
+        for report, names, predicate in self.stages:
+            old_tracks_count = np.count_nonzero(selected)
+            selected &= predicate(columns, selected)
+            new_tracks_count = np.count_nonzero(selected)
+            print(f"{report} : eliminated {old_tracks_count - new_tracks_count} : selected/total tracks: {new_tracks_count}/{old_tracks_count}")
+        return selected
+
+    def Apply(self, tracks):
+
+        """
+        :param tracks: the dataframe containing tracks, or TrackArrays
+        :return: the tracks that pass all restrictions, copied once
+        """
+
+        if len(self.stages) == 0:
+            return tracks
+        if isinstance(tracks, TrackArrays):
+            return tracks.Select(self.Mask(tracks))
+        return tracks.loc[self.Mask(tracks)]
+
+
+######################################################################################
+# Streaming versions of the readers, for spots files that are too large to fit in memory
+######################################################################################
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+
+def ReadTrackMateDataChunks(csvfilename, istrack, chunksize=DEFAULT_CHUNKSIZE):
+
+    """
+    Read the data file in chunks of at most chunksize rows, with the same columns and dtypes as ReadTrackMateData.
+    Memory use is bounded by the chunk size rather than by the file size.
+    The chunks keep the row numbers of the complete file as index.
+    :param csvfilename:
+    :param istrack: A boolean value indicating whether it is tracks data (True) or spots data (False)
+    :param chunksize: the maximum number of rows in a chunk
+    :return: a generator producing dataframes
+    """
+
+    # The pyarrow parser can not read in chunks, so the C parser is always used here
+    usecols, dtype = TrackMateSchema(csvfilename, istrack)
+    try:
+        reader = pd.read_csv(csvfilename, header=0, skiprows=[1, 2, 3], usecols=usecols, dtype=dtype,
+                             chunksize=chunksize, engine='c')
+    except FileNotFoundError:
+        print(f'Could not open {csvfilename}')
+        sys.exit()
+    except:
+        print(f'Problem parsing {csvfilename}')
+        sys.exit()
+
+    with reader:
+        while True:
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                return
+            except:
+                print(f'Problem parsing {csvfilename}')
+                sys.exit()
+            SetIntegerDtypes(chunk)
+            yield chunk
+
+
+def ReadSpotsDataChunks(csvfilename, chunksize=DEFAULT_CHUNKSIZE, square=None, track_ids=None):
+
+    """
+    Read the spots file in chunks and filter every chunk as it is read
+    :param csvfilename:
+    :param chunksize: the maximum number of rows in a chunk
+    :param square: optional (x_min, y_min, x_max, y_max), as in RestrictTracksSquare
+    :param track_ids: optional collection of TRACK_IDs, only spots of these tracks are let through
+    :return: a generator producing the filtered dataframes
+    """
+
+    if track_ids is not None:
+        track_ids = pd.unique(np.asarray(track_ids))
+
+    for chunk in ReadTrackMateDataChunks(csvfilename, istrack=False, chunksize=chunksize):
+        yield FilterSpotsChunk(chunk, square, track_ids)
+
+
+def FilterSpotsChunk(chunk, square, track_ids):
+
+    """
+    Apply the rectangle and track filters of the streaming readers to one chunk
+    :param chunk: a spots dataframe
+    :param square: None or (x_min, y_min, x_max, y_max)
+    :param track_ids: None or an array of TRACK_IDs
+    :return: the filtered chunk
+    """
+
+    if square is not None:
+        chunk = chunk.loc[SquareMask(chunk, *square)]
+    if track_ids is not None:
+        chunk = chunk.loc[chunk['TRACK_ID'].isin(track_ids)]
+    return chunk
+
+
+def ReadSpotsDataStreaming(csvfilename, tracks=None, square=None, chunksize=DEFAULT_CHUNKSIZE):
+
+    """
+    Read only the spots that are needed, without ever holding the complete spots file in memory.
+    The result is the same as reading the complete file with ReadSpotsData and then applying
+    RestrictTracksSquare (if square is specified) and FindSpotsForTracks (if tracks is specified).
+    :param csvfilename:
+    :param tracks: optional tracks dataframe, only spots of these tracks are let through
+    :param square: optional (x_min, y_min, x_max, y_max), as in RestrictTracksSquare
+    :param chunksize: the maximum number of rows read at once
+    :return: the reduced spots dataframe
+    """
+
+    track_ids = None if tracks is None else pd.unique(np.asarray(tracks['TRACK_ID']))
+
+    old_spots_count = 0
+    chunks = []
+    for chunk in ReadTrackMateDataChunks(csvfilename, istrack=False, chunksize=chunksize):
+        old_spots_count += chunk.shape[0]
+        chunks.append(FilterSpotsChunk(chunk, square, track_ids))
+
+    # FindSpotsForTracks produces a new index, RestrictTracksSquare keeps the original one
+    spots = pd.concat(chunks, ignore_index=track_ids is not None)
+    print(f'Streaming read: selected/total spots: {spots.shape[0]}/{old_spots_count}')
+
+    return spots
+
+
+######################################################################################
+# An index over the spots, to find the spots of a track without searching the whole table
+######################################################################################
+
+TRACK_INDEX_SUFFIX = '.index.npz'
+
+
+class TrackIndex:
+
+    """
+    The spots sorted on TRACK_ID and then FRAME, with the position where every track starts.
+    The spots of track track_ids[i] are rows offsets[i] up to offsets[i + 1] of the sorted spots,
+    so the spots of a track are found with a binary search and returned as a slice, without copying.
+    Spots without TRACK_ID are not part of the index.
+    """
+
+    def __init__(self, spots, order=None):
+
+        """
+        :param spots: the spots dataframe
+        :param order: the order that sorts the spots, as saved by Save. It is determined if not specified.
+        """
+
+        spots = spots.loc[spots['TRACK_ID'].notna()]
+        if order is None:
+            frames = spots['FRAME'].to_numpy() if 'FRAME' in spots.columns else np.zeros(spots.shape[0])
+            order = np.lexsort((frames, spots['TRACK_ID'].to_numpy(dtype=np.int64)))
+
+        self.order = order
+        self.spots = spots.iloc[order].reset_index(drop=True)
+
+        sorted_ids = self.spots['TRACK_ID'].to_numpy()
+        starts = np.flatnonzero(np.diff(sorted_ids, prepend=sorted_ids[:1] - 1))
+        self.track_ids = sorted_ids[starts]
+        self.offsets = np.append(starts, len(sorted_ids)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def Spots(self, track_id):
+
+        """
+        :param track_id:
+        :return: the spots of one track, as a slice of the sorted spots (empty if the track is unknown)
+        """
+
+        i = np.searchsorted(self.track_ids, track_id)
+        if i == len(self.track_ids) or self.track_ids[i] != track_id:
+            return self.spots.iloc[0:0]
+        return self.spots.iloc[self.offsets[i]:self.offsets[i + 1]]
+
+    def SpotsForTracks(self, track_ids):
+
+        """
+        :param track_ids: a collection of TRACK_IDs, unknown ones are ignored
+        :return: the spots of these tracks, ordered on TRACK_ID and FRAME, with a new index
+        """
+
+        track_ids = np.asarray(track_ids, dtype=np.float64)
+        track_ids = np.unique(track_ids[~np.isnan(track_ids)])
+        i = np.searchsorted(self.track_ids, track_ids)
+        found = i < len(self.track_ids)
+        found[found] = self.track_ids[i[found]] == track_ids[found]
+        i = i[found]
+
+        # Expand the [start, stop) ranges of the selected tracks to row numbers in one go
+        rows = ExpandRanges(self.offsets[i], self.offsets[i + 1] - self.offsets[i])
+        return self.spots.iloc[rows].reset_index(drop=True)
+
+    def Save(self, filename, fingerprint=None):
+
+        """
+        Save the index, which only stores the sort order and the track boundaries, not the spots themselves
+        :param filename:
+        :param fingerprint: the fingerprint of the csv file the spots were read from (see CsvFingerprint)
+        :return: nothing
+        """
+
+        np.savez(filename, order=self.order, nr_spots=self.spots.shape[0],
+                 fingerprint=json.dumps(fingerprint))
+
+
+def BuildTrackIndex(spots, csvfilename=None):
+
+    """
+    Build the TrackIndex of a spots dataframe.
+    If the spots were read unfiltered from csvfilename, the index is saved next to it and reused as long as the
+    csv file does not change, so the spots are only sorted once per file.
+    :param spots: the spots dataframe
+    :param csvfilename: optional, the spots file the spots dataframe was read from
+    :return: the TrackIndex
+    """
+
+    if csvfilename is None:
+        return TrackIndex(spots)
+
+    index_filename = csvfilename + TRACK_INDEX_SUFFIX
+    fingerprint = CsvFingerprint(csvfilename)
+    nr_tracked_spots = int(spots['TRACK_ID'].notna().sum())
+    try:
+        with np.load(index_filename, allow_pickle=False) as saved:
+            if json.loads(str(saved['fingerprint'])) == fingerprint and int(saved['nr_spots']) == nr_tracked_spots:
+                return TrackIndex(spots, order=saved['order'])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = TrackIndex(spots)
+    try:
+        index.Save(index_filename, fingerprint)
+    except OSError:
+        print(f'Could not save the track index for {csvfilename}, continuing without')
+    return index
+
+
+######################################################################################
+# A spatial index over spot or track positions, for region of interest queries
+######################################################################################
+
+
+class SpatialIndex:
+
+    """
+    The positions bucketed in a uniform grid of square cells. The points are sorted on cell, so the points of
+    a row of cells are adjacent and a region of interest only looks at the points in the cells it overlaps.
+    A query therefore takes time in proportion to the size of the region, not to the number of points.
+    Points without a position are not part of the index.
+    The index is built on a spots dataframe (POSITION_X, POSITION_Y), a TrackIndex, or a tracks dataframe
+    (with x_column='TRACK_X_LOCATION' and y_column='TRACK_Y_LOCATION').
+    """
+
+    def __init__(self, data, x_column='POSITION_X', y_column='POSITION_Y', cell_size=None):
+
+        """
+        :param data: a dataframe or a TrackIndex. With a TrackIndex, whole tracks are found without a search.
+        :param x_column:
+        :param y_column:
+        :param cell_size: the size of a grid cell, by default such that a cell holds about 8 points on average
+        """
+
+        self.track_index = data if isinstance(data, TrackIndex) else None
+        self.data = data.spots if isinstance(data, TrackIndex) else data
+
+        x = self.data[x_column].to_numpy(dtype=np.float64)
+        y = self.data[y_column].to_numpy(dtype=np.float64)
+        rows = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        x, y = x[rows], y[rows]
+
+        self.x_min = x.min() if len(x) else 0.0
+        self.y_min = y.min() if len(y) else 0.0
+        width = max(x.max() - self.x_min, 1e-9) if len(x) else 1.0
+        height = max(y.max() - self.y_min, 1e-9) if len(y) else 1.0
+        if cell_size is None:
+            cell_size = np.sqrt(width * height * 8 / max(len(x), 1))
+        self.cell_size = cell_size
+        self.nx = int(width // cell_size) + 1
+        self.ny = int(height // cell_size) + 1
+
+        cells = self.CellX(x) + self.nx * self.CellY(y)
+        order = np.argsort(cells, kind='stable')
+        self.rows = rows[order]
+        self.x = x[order]
+        self.y = y[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=self.nx * self.ny))))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def CellX(self, x):
+        return np.clip(np.floor((x - self.x_min) / self.cell_size), 0, self.nx - 1).astype(np.int64)
+
+    def CellY(self, y):
+        return np.clip(np.floor((y - self.y_min) / self.cell_size), 0, self.ny - 1).astype(np.int64)
+
+    def Candidates(self, x_min, y_min, x_max, y_max):
+
+        """
+        :return: the positions, in the sorted points, of all points in the cells that overlap the rectangle
+        """
+
+        if x_max < x_min or y_max < y_min or len(self.rows) == 0:
+            return np.zeros(0, dtype=np.int64)
+        ix0, ix1 = self.CellX(x_min), self.CellX(x_max)
+        iy = np.arange(self.CellY(y_min), self.CellY(y_max) + 1)
+
+        # Per row of cells, the points of the cells ix0 up to ix1 are one range
+        starts = self.offsets[iy * self.nx + ix0]
+        lengths = self.offsets[iy * self.nx + ix1 + 1] - starts
+        return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    def RectangleRows(self, x_min, y_min, x_max, y_max):
+
+        """
+        :return: the row numbers (positions) of the points in the rectangle (borders included), in ascending order
+        """
+
+        c = self.Candidates(x_min, y_min, x_max, y_max)
+        x, y = self.x[c], self.y[c]
+        inside = (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+        return np.sort(self.rows[c[inside]])
+
+    def CircleRows(self, x_centre, y_centre, radius):
+
+        """
+        :return: the row numbers (positions) of the points in the circle (border included), in ascending order
+        """
+
+        c = self.Candidates(x_centre - radius, y_centre - radius, x_centre + radius, y_centre + radius)
+        inside = np.square(self.x[c] - x_centre) + np.square(self.y[c] - y_centre) <= radius * radius
+        return np.sort(self.rows[c[inside]])
+
+    def PolygonRows(self, vertices):
+
+        """
+        :param vertices: a sequence of (x, y) corner points, the polygon is closed automatically
+        :return: the row numbers (positions) of the points in the polygon, in ascending order.
+                 Points exactly on the border may or may not be included.
+        """
+
+        vertices = np.asarray(vertices, dtype=np.float64)
+        (x_min, y_min), (x_max, y_max) = vertices.min(axis=0), vertices.max(axis=0)
+        c = self.Candidates(x_min, y_min, x_max, y_max)
+        from matplotlib.path import Path
+        inside = Path(vertices).contains_points(np.column_stack((self.x[c], self.y[c])))
+        return np.sort(self.rows[c[inside]])
+
+    def Select(self, rows, whole_tracks):
+
+        """
+        :param rows: row numbers (positions) in the data
+        :param whole_tracks: if True, all spots of the tracks that have a spot in rows are returned
+        :return: the selected part of the data
+        """
+
+        if not whole_tracks:
+            return self.data.iloc[rows]
+        track_ids = pd.unique(self.data['TRACK_ID'].iloc[rows].dropna().to_numpy())
+        if self.track_index is not None:
+            return self.track_index.SpotsForTracks(track_ids)
+        return self.data.loc[self.data['TRACK_ID'].isin(track_ids)]
+
+    def Rectangle(self, x_min, y_min, x_max, y_max, whole_tracks=False):
+
+        """
+        The points in a rectangle (borders included), the same as RestrictTracksSquare
+        :param whole_tracks: if True, the complete tracks that have at least one spot in the rectangle
+        :return: the selected part of the data
+        """
+
+        return self.Select(self.RectangleRows(x_min, y_min, x_max, y_max), whole_tracks)
+
+    def Circle(self, x_centre, y_centre, radius, whole_tracks=False):
+
+        """
+        The points in a circle (border included)
+        :param whole_tracks: if True, the complete tracks that have at least one spot in the circle
+        :return: the selected part of the data
+        """
+
+        return self.Select(self.CircleRows(x_centre, y_centre, radius), whole_tracks)
+
+    def Polygon(self, vertices, whole_tracks=False):
+
+        """
+        The points in a polygon
+        :param vertices: a sequence of (x, y) corner points
+        :param whole_tracks: if True, the complete tracks that have at least one spot in the polygon
+        :return: the selected part of the data
+        """
+
+        return self.Select(self.PolygonRows(vertices), whole_tracks)
+
+
+######################################################################################
+# A compact store of the tracks and spots: only the columns the analyses use, as numpy
+# arrays with the smallest dtype, and the spots grouped per track. The spots of a whole
+# cover slip then fit in memory where the complete dataframe does not.
+######################################################################################
+
+# The columns kept, with their dtype. The integer dtypes are made smaller still when the values allow it.
+TRACK_ARRAY_COLUMNS = {'TRACK_ID': np.int32, 'NUMBER_SPOTS': np.int32, 'TRACK_START': np.float32,
+                       'TRACK_STOP': np.float32, 'TRACK_DURATION': np.float32,
+                       'TRACK_X_LOCATION': np.float32, 'TRACK_Y_LOCATION': np.float32}
+SPOT_ARRAY_COLUMNS = {'POSITION_X': np.float32, 'POSITION_Y': np.float32, 'FRAME': np.int32}
+
+
+def CompactArray(values, dtype):
+
+    """
+    :param values: a numpy array or a Pandas series without missing values
+    :param dtype: the dtype of the column, an integer dtype is made smaller if the values allow it
+    :return: the numpy array
+    """
+
+    if isinstance(values, pd.Series):
+        values = values.to_numpy(dtype=dtype)
+    else:
+        values = np.asarray(values, dtype=dtype)
+    if np.issubdtype(dtype, np.integer):
+        return pd.to_numeric(values, downcast='integer')
+    return values
+
+
+def ExpandRanges(starts, lengths):
+
+    """
+    :return: the numbers starts[i] up to starts[i] + lengths[i] for all i, in one array
+    """
+
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+class TrackArrays:
+
+    """
+    The tracks as a numpy array per column, for the columns of TRACK_ARRAY_COLUMNS.
+    tracks['TRACK_X_LOCATION'] gives the numpy array, so TrackFilter, RestrictTracksLength, CompileDuration,
+    CalculateDensityMap and FindSpotsForTracks accept TrackArrays in place of the tracks dataframe.
+    """
+
+    def __init__(self, data):
+
+        """
+        :param data: the tracks dataframe, or a dictionary with a numpy array per column. Columns that are not in
+                     TRACK_ARRAY_COLUMNS are left out.
+        """
+
+        self.arrays = {name: CompactArray(data[name], dtype) for name, dtype in TRACK_ARRAY_COLUMNS.items()
+                       if name in data}
+        self.columns = list(self.arrays)
+
+    def __len__(self):
+        return len(next(iter(self.arrays.values()))) if self.arrays else 0
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def Select(self, rows):
+
+        """
+        :param rows: a boolean mask or an array of positions
+        :return: the selected tracks, as TrackArrays
+        """
+
+        return TrackArrays({name: values[rows] for name, values in self.arrays.items()})
+
+    def NrBytes(self):
+        return sum(values.nbytes for values in self.arrays.values())
+
+    def ToDataFrame(self):
+        return pd.DataFrame(self.arrays)
+
+
+class SpotArrays:
+
+    """
+    The spots, sorted on TRACK_ID and FRAME, as a numpy array per column of SPOT_ARRAY_COLUMNS.
+    As in a TrackIndex, the spots of track track_ids[i] are spots offsets[i] up to offsets[i + 1], but TRACK_ID
+    is not stored per spot. Spots without TRACK_ID are left out.
+    spots['POSITION_X'] gives the numpy array (spots['TRACK_ID'] is expanded from the offsets), so
+    FindSpotsForTracks, CalculateBoundingRectangles and PlotTracks accept SpotArrays in place of the spots dataframe.
+    """
+
+    def __init__(self, data, track_ids=None, offsets=None):
+
+        """
+        :param data: the spots dataframe or a TrackIndex, or a dictionary with an array per column that is
+                     already sorted, with track_ids and offsets
+        :param track_ids: only with a dictionary, the TRACK_ID of every track
+        :param offsets: only with a dictionary, where the spots of every track start, and the number of spots
+        """
+
+        if offsets is None:
+            if not isinstance(data, TrackIndex):
+                # Only the columns that are kept are sorted
+                data = data[[name for name in ['TRACK_ID'] + list(SPOT_ARRAY_COLUMNS) if name in data]]
+            index = data if isinstance(data, TrackIndex) else TrackIndex(data)
+            data, track_ids, offsets = index.spots, index.track_ids, index.offsets
+
+        self.track_ids = CompactArray(track_ids, np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.arrays = {name: CompactArray(data[name], dtype) for name, dtype in SPOT_ARRAY_COLUMNS.items()
+                       if name in data}
+        self.columns = ['TRACK_ID'] + list(self.arrays)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def NrSpots(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, name):
+        if name == 'TRACK_ID':
+            return np.repeat(self.track_ids, np.diff(self.offsets))
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def SpotsForTracks(self, track_ids):
+
+        """
+        :param track_ids: a collection of TRACK_IDs, unknown ones are ignored
+        :return: the spots of these tracks, as SpotArrays
+        """
+
+        track_ids = np.asarray(track_ids, dtype=np.float64)
+        track_ids = np.unique(track_ids[~np.isnan(track_ids)])
+        i = np.searchsorted(self.track_ids, track_ids)
+        found = i < len(self.track_ids)
+        found[found] = self.track_ids[i[found]] == track_ids[found]
+        i = i[found]
+
+        lengths = self.offsets[i + 1] - self.offsets[i]
+        rows = ExpandRanges(self.offsets[i], lengths)
+        return SpotArrays({name: values[rows] for name, values in self.arrays.items()},
+                          self.track_ids[i], np.concatenate(([0], np.cumsum(lengths))))
+
+    def NrBytes(self):
+        return self.track_ids.nbytes + self.offsets.nbytes + sum(values.nbytes for values in self.arrays.values())
+
+    def ToDataFrame(self):
+        spots = pd.DataFrame(self.arrays)
+        spots.insert(0, 'TRACK_ID', self['TRACK_ID'])
+        return spots
+
+
+def ReadTrackMateColumns(csvfilename, istrack, names, use_cache=True):
+
+    """
+    Read only some columns of the data file, from the binary cache when it is valid, otherwise from the csv file.
+    The cache is not written, as it holds all columns: read the file once with ReadTracksData or ReadSpotsData to
+    make it.
+    :param csvfilename:
+    :param istrack: A boolean value indicating whether it is tracks data (True) or spots data (False)
+    :param names: the names of the columns, the ones the file does not have are left out
+    :param use_cache: A boolean value indicating whether the binary cache is used
+    :return: the dataframe with these columns
+    """
+
+    tmd = ReadTrackMateCache(csvfilename, istrack, columns=names) if use_cache else None
+    if tmd is None:
+        header = ReadTrackMateHeader(csvfilename)
+        usecols, dtype = TrackMateSchema(csvfilename, istrack)
+        usecols = [i for i in usecols if header[i] in names]
+        tmd = ParseTrackMateCsv(csvfilename, usecols, dtype, PARSER_ENGINE)
+        if tmd is None and PARSER_ENGINE == 'pyarrow':
+            tmd = ParseTrackMateCsv(csvfilename, usecols, dtype, 'c')
+        if tmd is None:
+            print(f'Problem parsing {csvfilename}')
+            sys.exit()
+        SetIntegerDtypes(tmd)
+    return tmd
+
+
+def ReadTrackArrays(csvfilename, use_cache=True):
+    return TrackArrays(ReadTrackMateColumns(csvfilename, True, list(TRACK_ARRAY_COLUMNS), use_cache))
+
+
+def ReadSpotArrays(csvfilename, use_cache=True):
+    return SpotArrays(ReadTrackMateColumns(csvfilename, False, ['TRACK_ID'] + list(SPOT_ARRAY_COLUMNS), use_cache))
+
+
+######################################################################################
+# Where the plots go: on screen (the default) or to files
+######################################################################################
+
+# With an output directory set, plots are saved there with the Agg backend and no window is opened
+plot_output = {'directory': None, 'format': 'png', 'count': 0}
+
+
+def SetPlotOutput(directory=None, file_format='png'):
+
+    """
+    Choose where all following plots go. With a directory the plots are saved as files in that directory
+    and no window is opened, which is what is needed on a machine without display or in worker processes.
+    Without a directory, the plots are shown on screen again.
+    :param directory: the directory for the plot files, or None to show plots on screen
+    :param file_format: 'png', 'svg' or 'pdf'
+    :return: nothing
+    """
+
+    plot_output['directory'] = directory
+    plot_output['format'] = file_format
+    if directory is not None:
+        import matplotlib.pyplot as plt
+        os.makedirs(directory, exist_ok=True)
+        plt.switch_backend('Agg')
+
+
+def ShowPlot(fig, save_as=None, title=''):
+
+    """
+    Show the figure, or save it to a file and close it, so that no memory leaks when many plots are made.
+    :param fig: the figure
+    :param save_as: the file to save to, the extension determines the format. A relative name is placed in the
+                    directory set with SetPlotOutput. If not specified and SetPlotOutput set a directory,
+                    a numbered name is made from the title.
+    :param title: used to make a file name
+    :return: the name of the file, or None if the figure is shown on screen
+    """
+
+    import matplotlib.pyplot as plt
+
+    if save_as is None and plot_output['directory'] is None:
+        plt.show()
+        return None
+
+    save_as = PlotFilename(save_as, title, plot_output['format'])
+    fig.savefig(save_as)
+    plt.close(fig)
+    return save_as
+
+
+def PlotFilename(save_as, title, file_format):
+
+    """
+    Determine the file a plot is saved to, see ShowPlot
+    :param save_as: the file name, or None to make a numbered name from the title
+    :param title:
+    :param file_format: the extension of a numbered name
+    :return: the file name, in the directory set with SetPlotOutput unless save_as is an absolute path
+    """
+
+    if save_as is None:
+        plot_output['count'] += 1
+        name = re.sub(r'[^A-Za-z0-9]+', '_', title).strip('_') or 'plot'
+        save_as = f"{plot_output['count']:03d}_{name}.{file_format}"
+    if plot_output['directory'] is not None and not os.path.isabs(save_as):
+        save_as = os.path.join(plot_output['directory'], save_as)
+    return save_as
+
+
 ######################################################################################
 # Then a set of functions to create histograms and curve fit
 ######################################################################################
@@ -213,11 +1398,15 @@ def CompileDuration(tracks):
 
     """
     The function produces a histogram
-    :param tracks: a dataframe containing the histogram data
+    :param tracks: a dataframe containing the histogram data, or TrackArrays
     :return: a dataframe containing the histogram
     """
 
-    duration_data = tracks.groupby('TRACK_DURATION')['TRACK_DURATION'].size()
+    if isinstance(tracks, TrackArrays):
+        durations, counts = np.unique(tracks['TRACK_DURATION'], return_counts=True)
+        duration_data = pd.Series(counts, index=pd.Index(durations, name='TRACK_DURATION'), name='TRACK_DURATION')
+    else:
+        duration_data = tracks.groupby('TRACK_DURATION')['TRACK_DURATION'].size()
 
     # histdata is returned as a Pandas Series, make histdata into a dataframe
     # The index values are the duration and the first (and only) column is 'Frequency'
@@ -226,16 +1415,19 @@ def CompileDuration(tracks):
     return histdata
 
 
-def PlotDuration(plot_data, plot_max_x, plot_title='Duration Histogram'):
+def PlotDuration(plot_data, plot_max_x, plot_title='Duration Histogram', save_as=None):
 
     """
     The function simply plots a histogram
     :param plot_data: the histogram data as a Pandas dataframe
     :param plot_max_x: the maximum x value visible in the plot
     :plot_title: optional title for histogram plot
+    :param save_as: optional file to save the plot to, see ShowPlot
     :return: nothing
     """
 
+    import matplotlib.pyplot as plt
+
     # Extract the x and y data from the dataframe and convert them into Numpy arrays
     x = list(plot_data.index)
     x = np.asarray(x)
@@ -257,56 +1449,38 @@ def PlotDuration(plot_data, plot_max_x, plot_title='Duration Histogram'):
     else:
         ax.plot(x, y, linewidth=1.0)
 
-    plt.show()
+    ShowPlot(fig, save_as, plot_title)
     return()
 
 
-def monoExp(x, m, t, b):
-    # Define the exponential decay function that will be used for fitting
-    return m * np.exp(-t * x) + b
-
-
-def CurveFitAndPlot(plot_data, nr_tracks, plot_max_x, plot_title='Duration Histogram'):
+def CurveFitAndPlot(plot_data, nr_tracks, plot_max_x, plot_title='Duration Histogram', save_as=None,
+                    nr_replicates=0, seed=None):
 
     """
     :param plot_data:
     :param nr_tracks
     :param plot_max_x: the maximum x value visible in the plot
     :plot_title: optional title for histogram plot
-    :return: nothing
+    :param save_as: optional file to save the plot to, see ShowPlot
+    :param nr_replicates: if not 0, a 95% bootstrap confidence interval for Tau is determined with this many replicates
+    :param seed: the seed for the bootstrap, see BootstrapDuration
+    :return: the FitResult, or None if the fit fails
     """
 
-    # Convert the pd dataframe to Numpy arrays fur further curve fitting
-
-    x = list(plot_data.index)
-    x = np.asarray(x)
-
-    y = list(plot_data["Frequency"])
-    y = np.asarray(y)
-
-    # Perform the fit
-    p0 = (200, .1, 50)  # start with values near those we expect - original values
-    p0 = (2000, 4, 10)  # this is more whar we see
+    import matplotlib.pyplot as plt
+    from tmFitting import monoExp, FitDuration, BootstrapDuration
 
-    try:
-        params, cv = scipy.optimize.curve_fit(monoExp, x, y, p0)
-        m, t, b = params
-    except ValueError:
-        print('CurveFitAndPlot: ydata or xdata contain NaNs, or incompatible options are used')
-        return
-    except RuntimeError:
-        print('CurveFitAndPlot: The least-squares optimisation fails')
-        return
-    except OptimizeWarning:
-        print('CurveFitAndPlot: Covariance of the parameters can not be estimated')
-        return
+    fit = FitDuration(plot_data)
+    if fit is None:
+        return None
+    bootstrap = None
+    if nr_replicates > 0:
+        bootstrap = BootstrapDuration(plot_data, nr_replicates, seed=seed)
+    m, t, b, rSquared = fit.m, fit.t, fit.b, fit.r_squared
 
+    x = np.asarray(plot_data.index, dtype=np.float64)
+    y = np.asarray(plot_data["Frequency"], dtype=np.float64)
     tauSec = (1 / t)
-
-    # Determine quality of the fit
-    squaredDiffs = np.square(y - monoExp(x, m, t, b))
-    squaredDiffsFromMean = np.square(y - np.mean(y))
-    rSquared = 1 - np.sum(squaredDiffs) / np.sum(squaredDiffsFromMean)
     print(f'R² = {rSquared:.4f}')
 
     fig, ax = plt.subplots()
@@ -315,7 +1489,11 @@ def CurveFitAndPlot(plot_data, nr_tracks, plot_max_x, plot_title='Duration Histo
 
     x_middle = plot_max_x/2 - plot_max_x * 0.1
     y_middle = y.max()/2
-    plt.text(x_middle, y_middle, f"Tau = {tauSec * 1e3:.0f} ms")
+    if bootstrap is not None:
+        plt.text(x_middle, y_middle,
+                 f"Tau = {tauSec * 1e3:.0f} ms ({bootstrap.tau_low * 1e3:.0f} - {bootstrap.tau_high * 1e3:.0f})")
+    else:
+        plt.text(x_middle, y_middle, f"Tau = {tauSec * 1e3:.0f} ms")
     plt.text(x_middle, 0.8 * y_middle, f"R2 = {rSquared:.4f} ms")
     plt.text(x_middle, 0.6 * y_middle, f"Number or tracks is {nr_tracks}")
     plt.text(x_middle, 0.4 * y_middle, f"Zoomed in from 0 to {plot_max_x:.0f} s")
@@ -327,53 +1505,36 @@ def CurveFitAndPlot(plot_data, nr_tracks, plot_max_x, plot_title='Duration Histo
     ax.set_ylabel('Number of tracks')
     ax.set_title(plot_title)
     ax.legend()
-    plt.show()
+    ShowPlot(fig, save_as, plot_title)
 
     # Inspect the parameters
     print(f'Y = {m:.3f} * e^(-{t:.3f} * x) + {b:.3f}')
     print(f'Tau = {tauSec * 1e3:.0f} ms')
+    if bootstrap is not None:
+        print(f'{bootstrap.confidence:.0%} confidence interval of Tau is {bootstrap.tau_low * 1e3:.0f} - '
+              f'{bootstrap.tau_high * 1e3:.0f} ms ({nr_replicates} bootstrap replicates)')
+    return fit
 
 
-def CurveFitAndPlot_Exp(histdata, title='Duration Histogram'):
+def CurveFitAndPlot_Exp(histdata, title='Duration Histogram', save_as=None):
     """
     :param histdata: the histogram data as a Pandas dataframe
     :title: optional title for histogram plot
-    :return: nothing
+    :param save_as: optional file to save the plot to, see ShowPlot
+    :return: the FitResult, or None if the fit fails
     """
 
-    # Convert the pd dataframe to Numpy arrays fur further curve fitting
-
-    x = list(histdata.index)
-    x = np.asarray(x)
-
-    y = list(histdata["Frequency"])
-    y = np.asarray(y)
+    import matplotlib.pyplot as plt
+    from tmFitting import monoExp, FitDuration
 
-    # Perform the fit
-    p0 = (200, .1, 50)  # start with values near those we expect - original values
-    p0 = (2000, 4, 10)  # this is more whar we see
-
-    try:
-        params, cv = scipy.optimize.curve_fit(monoExp, x, y, p0)
-        m, t, b = params
-        print (p0)
-        print (params)
-    except ValueError:
-        print('CurveFitAndPlot: ydata or xdata contain NaNs, or incompatible options are used')
-        return
-    except RuntimeError:
-        print('CurveFitAndPlot: The least-squares optimisation fails')
-        return
-    except OptimizeWarning:
-        print('CurveFitAndPlot: Covariance of the parameters can not be estimated')
-        return
+    fit = FitDuration(histdata)
+    if fit is None:
+        return None
+    m, t, b, rSquared = fit.m, fit.t, fit.b, fit.r_squared
 
+    x = np.asarray(histdata.index, dtype=np.float64)
+    y = np.asarray(histdata["Frequency"], dtype=np.float64)
     tauSec = (1 / t)
-
-    # Determine quality of the fit
-    squaredDiffs = np.square(y - monoExp(x, m, t, b))
-    squaredDiffsFromMean = np.square(y - np.mean(y))
-    rSquared = 1 - np.sum(squaredDiffs) / np.sum(squaredDiffsFromMean)
     print(f'R² = {rSquared}')
 
     fig, ax = plt.subplots()
@@ -381,8 +1542,6 @@ def CurveFitAndPlot_Exp(histdata, title='Duration Histogram'):
 
     x_for_f = np.linspace(0, x.max(), 100)
     y_for_f = monoExp(x_for_f, m, t, b)
-    print(x_for_f)
-    print(y_for_f)
 
     ax.plot(x_for_f, y_for_f, linewidth=1.0, label="Fitted")
 
@@ -398,11 +1557,272 @@ def CurveFitAndPlot_Exp(histdata, title='Duration Histogram'):
 
     ax.set_yscale('log')
 
-    plt.show()
+    ShowPlot(fig, save_as, title)
 
     # Inspect the parameters
     print(f'Y = {m} * e^(-{t} * x) + {b}')
     print(f'Tau = {tauSec * 1e3} ms')
+    return fit
+
+
+######################################################################################
+# Then functions to calculate density maps
+######################################################################################
+
+
+def CalculateDensityMap(tracks, magnification=1, x_size=81, y_size=81):
+
+    """
+    Count the number of tracks that have their location in each square of a grid.
+    With magnification 1 every square is 1 x 1 micrometer, with magnification 5 it is 0.2 x 0.2 micrometer.
+    Tracks with a location outside the grid are not counted, but reported.
+    :param tracks: the tracks dataframe or TrackArrays, with TRACK_X_LOCATION and TRACK_Y_LOCATION in micrometer
+    :param magnification: the number of squares per micrometer
+    :param x_size: the width of the image in micrometer
+    :param y_size: the height of the image in micrometer
+    :return: an integer array of (x_size * magnification + 1) by (y_size * magnification + 1), indexed [x][y]
+    """
+
+    # Every track counts once, also if it would occur more than once
+    if isinstance(tracks, TrackArrays):
+        tracks = tracks.Select(np.unique(tracks['TRACK_ID'], return_index=True)[1])
+    else:
+        tracks = tracks.drop_duplicates('TRACK_ID')
+    x = np.floor(np.asarray(tracks['TRACK_X_LOCATION'], dtype=np.float64) * magnification).astype(np.int64)
+    y = np.floor(np.asarray(tracks['TRACK_Y_LOCATION'], dtype=np.float64) * magnification).astype(np.int64)
+
+    nx = x_size * magnification + 1
+    ny = y_size * magnification + 1
+    inside = (x >= 0) & (x < nx) & (y >= 0) & (y < ny)
+    if not inside.all():
+        print(f'{np.count_nonzero(~inside)} tracks are outside the {x_size} by {y_size} micrometer image and not counted')
+
+    # Count all squares in one go on the flattened grid
+    count_array = np.bincount(x[inside] * ny + y[inside], minlength=nx * ny)
+    return count_array.reshape(nx, ny)
+
+
+def CalculateOccurrences(count_array):
+
+    """
+    Count how many times every value occurs in a density map
+    :param count_array: the density map from CalculateDensityMap
+    :return: an integer array where element i is the number of squares that contain exactly i tracks
+    """
+
+    return np.bincount(count_array.ravel())
+
+
+def PlotDensityMap(count_array, cutoff=1, title='', save_as=None):
+
+    """
+    Plot a density map, with the origin top left as in the image
+    :param count_array: the density map from CalculateDensityMap
+    :param cutoff: the highest value displayed, as fraction of the maximum, so that low values remain visible
+    :param title: optional title for the plot
+    :param save_as: optional file to save the plot to, see ShowPlot
+    :return: nothing
+    """
+
+    import matplotlib.pyplot as plt
+
+    xmax = count_array.shape[0] - 1
+    ymax = count_array.shape[1] - 1
+    x = np.arange(0, xmax + 1, 1)
+    y = np.arange(ymax, -1, -1)
+    X, Y = np.meshgrid(x, y)
+    Z = np.transpose(count_array)
+
+    fig, ax = plt.subplots()
+    ax.set_aspect('equal')
+    cm = ax.pcolormesh(X, Y, Z, vmin=np.amin(Z), vmax=np.amax(Z) * cutoff, cmap=DensityColormap())
+    plt.colorbar(cm)
+    if title != '':
+        ax.set_title(title)
+    ShowPlot(fig, save_as, title or 'Density map')
+
+
+def DensityColormap():
+    from matplotlib.colors import LinearSegmentedColormap
+    colors = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (1, 1, 1)]
+    return LinearSegmentedColormap.from_list("colormap", colors, N=50)
+
+
+# The most memory a density movie may take when it is made in memory, in bytes. A longer movie is written to a
+# file with CalculateDensityMovie(filename=...), which is memory mapped.
+density_movie_memory = 1024 ** 3
+
+
+class DensityCube:
+
+    """
+    The number of tracks per square of the grid of CalculateDensityMap and per time bin, stored as the squares of
+    the tracks sorted on their time bin. It takes memory for the tracks only, however many time bins and squares
+    there are. cube.Counts(begin, end) gives the density map of the time bins begin up to end.
+    """
+
+    def __init__(self, bins, squares, shape):
+
+        """
+        :param bins: the time bin of every track
+        :param squares: the square of every track, as x * ny + y
+        :param shape: (nt, nx, ny), the number of time bins and squares
+        """
+
+        order = np.argsort(bins, kind='stable')
+        self.squares = squares[order]
+        self.shape = shape
+        # The tracks of time bin t are self.squares[self.offsets[t]:self.offsets[t + 1]]
+        self.offsets = np.searchsorted(bins[order], np.arange(shape[0] + 1))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def Counts(self, begin, end):
+
+        """
+        :return: the number of tracks per square in the time bins begin up to end, as an int64 array [x][y]
+        """
+
+        nx, ny = self.shape[1:]
+        squares = self.squares[self.offsets[begin]:self.offsets[end]]
+        return np.bincount(squares, minlength=nx * ny).reshape(nx, ny)
+
+    def Dense(self):
+
+        """
+        :return: the cube as an int32 array indexed [t][x][y], only for small cubes
+        """
+
+        cube = np.zeros(self.shape, dtype=np.int32)
+        for t in range(len(self)):
+            cube[t] = self.Counts(t, t + 1)
+        return cube
+
+
+def CalculateDensityCube(tracks, magnification=1, x_size=81, y_size=81, time_bin=1.0):
+
+    """
+    Count the number of tracks per square of the grid of CalculateDensityMap and per time bin, in one pass.
+    A track is counted in the time bin in which it starts.
+    :param tracks: the tracks dataframe, with TRACK_X_LOCATION, TRACK_Y_LOCATION and TRACK_START
+    :param magnification: the number of squares per micrometer
+    :param x_size: the width of the image in micrometer
+    :param y_size: the height of the image in micrometer
+    :param time_bin: the duration of a time bin in seconds, the first bin starts at 0
+    :return: a DensityCube. cube.Counts(0, len(cube)) is the density map of CalculateDensityMap.
+    """
+
+    tracks = tracks.drop_duplicates('TRACK_ID')
+    x = np.floor(tracks['TRACK_X_LOCATION'].to_numpy(dtype=np.float64) * magnification).astype(np.int64)
+    y = np.floor(tracks['TRACK_Y_LOCATION'].to_numpy(dtype=np.float64) * magnification).astype(np.int64)
+    t = np.floor(tracks['TRACK_START'].to_numpy(dtype=np.float64) / time_bin).astype(np.int64)
+
+    nx = x_size * magnification + 1
+    ny = y_size * magnification + 1
+    in_image = (x >= 0) & (x < nx) & (y >= 0) & (y < ny)
+    in_time = t >= 0
+    if not in_image.all():
+        print(f'{np.count_nonzero(~in_image)} tracks are outside the {x_size} by {y_size} micrometer image '
+              f'and not counted')
+    if not (in_time | ~in_image).all():
+        print(f'{np.count_nonzero(in_image & ~in_time)} tracks start before 0 s, outside the time range, '
+              f'and are not counted')
+
+    inside = in_image & in_time
+    nt = int(t[inside].max()) + 1 if inside.any() else 0
+    return DensityCube(t[inside], x[inside] * ny + y[inside], (nt, nx, ny))
+
+
+def CalculateDensityMovie(cube, window, step=1, filename=None):
+
+    """
+    Make density maps over a window that slides through the acquisition.
+    Every map is made from the previous one by adding the tracks of the time bins that enter the window and
+    subtracting the ones of the time bins that leave it, so a map costs the same however long the window is.
+    The maps are uint16 when no square can hold more tracks than that, otherwise int32.
+    :param cube: the DensityCube from CalculateDensityCube
+    :param window: the length of the window in time bins
+    :param step: the number of time bins the window moves between maps
+    :param filename: if specified, the maps are written to this .npy file, which is opened memory mapped, so
+                     that the movie does not have to fit in memory. It can be opened with np.load(mmap_mode='r').
+                     Without a file the movie may take no more than density_movie_memory bytes.
+    :return: an array indexed [map][x][y]. Map i covers the time bins i * step up to i * step + window.
+    """
+
+    nt, nx, ny = cube.shape
+    nr_maps = max((nt - window) // step + 1, 0)
+    # No window holds more tracks in a square than the whole acquisition
+    most = int(cube.Counts(0, nt).max()) if nt > 0 else 0
+    dtype = np.uint16 if most <= np.iinfo(np.uint16).max else np.int32
+    if filename is None:
+        nr_bytes = nr_maps * nx * ny * np.dtype(dtype).itemsize
+        if nr_bytes > density_movie_memory:
+            print(f'The movie of {nr_maps} maps of {nx} by {ny} squares takes {nr_bytes / 1024 ** 2:.0f} MB, more '
+                  f'than the {density_movie_memory / 1024 ** 2:.0f} MB allowed. Write it to a file, or choose a '
+                  f'lower magnification or a larger step.')
+            sys.exit()
+        movie = np.empty((nr_maps, nx, ny), dtype=dtype)
+    else:
+        movie = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=(nr_maps, nx, ny))
+    if nr_maps == 0:
+        return movie
+
+    running = cube.Counts(0, window)
+    movie[0] = running
+    for i in range(1, nr_maps):
+        begin = i * step
+        if step < window:
+            running += cube.Counts(begin + window - step, begin + window)
+            running -= cube.Counts(begin - step, begin)
+        else:
+            running = cube.Counts(begin, begin + window)
+        movie[i] = running
+
+    if filename is not None:
+        movie.flush()
+    return movie
+
+
+def AnimateDensityMovie(movie, time_bin, window, step=1, cutoff=1, title='', save_as=None, fps=10):
+
+    """
+    Show the density maps of CalculateDensityMovie as an animation, or save it to a file
+    :param movie: the maps from CalculateDensityMovie
+    :param time_bin: the duration of a time bin in seconds
+    :param window: the window of the maps in time bins
+    :param step: the step between the maps in time bins
+    :param cutoff: the highest value displayed, as fraction of the maximum over all maps
+    :param title: optional title for the animation
+    :param save_as: optional file to save to (i.e. 'movie.gif'), the directory is as in ShowPlot
+    :param fps: the number of maps per second
+    :return: the name of the file, or None if the animation is shown on screen
+    """
+
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    vmax = max(int(movie.max()) * cutoff, 1) if len(movie) else 1
+    fig, ax = plt.subplots()
+    image = ax.imshow(np.transpose(movie[0]), vmin=0, vmax=vmax, cmap=DensityColormap(), origin='upper')
+    plt.colorbar(image)
+
+    def Update(i):
+        image.set_data(np.transpose(movie[i]))
+        begin = i * step * time_bin
+        ax.set_title(f'{title} {begin:.1f} - {begin + window * time_bin:.1f} s'.strip())
+        return image,
+
+    animation = FuncAnimation(fig, Update, frames=len(movie), interval=1000 / fps, blit=False)
+    if save_as is None and plot_output['directory'] is None:
+        plt.show()
+        return None
+
+    save_as = PlotFilename(save_as, title or 'Density movie', 'gif')
+    # A gif needs nothing but Pillow, other formats (i.e. mp4) need ffmpeg
+    animation.save(save_as, fps=fps, writer='pillow' if save_as.lower().endswith('.gif') else None)
+    plt.close(fig)
+    return save_as
 
 
 ######################################################################################
@@ -410,25 +1830,63 @@ def CurveFitAndPlot_Exp(histdata, title='Duration Histogram'):
 ######################################################################################
 
 
-def PlotTracks(spots, line_width=0.5, xlim=99999, ylim=99999, title=""):
+def TracksLineCollection(spots, line_width=0.5):
+
+    '''
+    Turn the spots into one line per track, in a single LineCollection.
+    The spots are sorted once on TRACK_ID (and FRAME when present) and then split at every new track.
+    The lines get the colours of the default colour cycle, as separate ax.plot calls would.
+    :param spots: The spots dataframe, a TrackIndex or SpotArrays, spots without TRACK_ID are ignored
+    :param line_width:
+    :return: the LineCollection
+    '''
+
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    if isinstance(spots, TrackIndex):
+        # The index is already sorted
+        positions = spots.spots[['POSITION_X', 'POSITION_Y']].to_numpy(dtype=np.float64)
+        lines = np.split(positions, spots.offsets[1:-1])
+        return LineCollection(lines, linewidths=line_width, colors=colors)
+    if isinstance(spots, SpotArrays):
+        positions = np.column_stack((spots['POSITION_X'], spots['POSITION_Y'])).astype(np.float64)
+        lines = np.split(positions, spots.offsets[1:-1])
+        return LineCollection(lines, linewidths=line_width, colors=colors)
+
+    spots = spots.loc[spots['TRACK_ID'].notna()]
+    track_ids = spots['TRACK_ID'].to_numpy(dtype=np.int64)
+    frames = spots['FRAME'].to_numpy() if 'FRAME' in spots.columns else np.arange(len(track_ids))
+    order = np.lexsort((frames, track_ids))
+
+    track_ids = track_ids[order]
+    positions = np.column_stack((spots['POSITION_X'].to_numpy(dtype=np.float64)[order],
+                                 spots['POSITION_Y'].to_numpy(dtype=np.float64)[order]))
+    boundaries = np.flatnonzero(track_ids[1:] != track_ids[:-1]) + 1
+    lines = np.split(positions, boundaries) if len(positions) > 0 else []
+    return LineCollection(lines, linewidths=line_width, colors=colors)
+
+
+def PlotTracks(spots, line_width=0.5, xlim=99999, ylim=99999, title="", save_as=None):
 
     '''
     Plot the tracks in a rectangle
-    :param spots: The spots files containing the spots for the selected tracks
+    All tracks are drawn as one LineCollection, which is much faster than a line per track
+    :param spots: The spots files containing the spots for the selected tracks, a TrackIndex or SpotArrays
     :param line_width:
     :param xlim: Plot parameter will only be applied when a value is specified
     :param ylim: Plot parameter will only be applied when a value is specified
-    :return:
+    :param save_as: optional file to save the plot to, see ShowPlot
+    :return: the name of the file the plot is saved to, or None if it is shown on screen
     '''
 
-    track_names = list(spots["TRACK_ID"].unique())
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
     ax.invert_yaxis()
-    for track_name in track_names:
-        df = spots[spots['TRACK_ID'] == track_name]
-        x = np.asarray(df['POSITION_X'])
-        y = np.asarray(df['POSITION_Y'])
-        ax.plot(x, y, linewidth=line_width)
+    ax.add_collection(TracksLineCollection(spots, line_width))
+    ax.autoscale_view()
 
     ax.set_xlabel('X [micrometer]')  # Add an x-label to the axes.
     ax.set_ylabel('Y [micrometer]')  # Add a y-label to the axes.
@@ -445,4 +1903,4 @@ def PlotTracks(spots, line_width=0.5, xlim=99999, ylim=99999, title=""):
         ax.set_ylim([ylim, 0])
         #ax.invert_yaxis()
     ax.set_aspect('equal', adjustable='box')
-    plt.show()
+    return ShowPlot(fig, save_as, ax.get_title())
@@ -0,0 +1,299 @@
+'''
+Watch an experiment directory and analyse every TrackMate export as soon as it has landed, instead of in a batch
+at the end of the day.
+
+The directory is scanned every few seconds for tracks.csv files (also 'xxx-tracks.csv') with their spots.csv, as
+tmBatchAnalysis.py finds them. A recording is taken up when its files are complete: they have not changed for
+settle_time seconds and end with a full line. A tracks file without spots file is taken up after spots_wait
+seconds. The recording is then handled in a pool of worker processes: the spots file is converted to the binary
+cache (the tracks file is converted when it is read) and the duration, density and busiest spot analyses of
+tmBatchAnalysis.py are run.
+
+What has been done is kept in 'watch_state.json' in the experiment directory, with a content hash of the files.
+Files that are touched or copied again, but have the same content, are not analysed again, also not after a
+restart. The results of all recordings are in the summary table, 'batch_summary.csv', which is rewritten every
+time a recording is finished.
+
+Usage: python tmWatch.py <experiment directory> [--workers N] [--plots png|svg|pdf] [--bootstrap N]
+       [--store DIRECTORY] [--once]
+
+With --once the files present are handled (the files are assumed to be complete) and the program stops, otherwise
+it runs until it is interrupted with Ctrl-C.
+'''
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from tmUtility import ReadSpotsData, SetPlotOutput
+from tmBatchAnalysis import FindRecordings, RecordingName, AnalyseRecording, summary_filename, plots_directory
+
+
+state_filename = 'watch_state.json'
+poll_interval = 10          # seconds between two scans of the experiment directory
+settle_time = 30            # seconds a file has to be unchanged before it is considered complete
+spots_wait = 600            # seconds to wait for the spots file before a tracks file is analysed without it
+hash_block_size = 4 * 1024 * 1024
+
+
+def FileStat(filename):
+
+    """
+    :return: [size, modification time] of the file, or None if it does not exist (a list, so that it compares
+             equal to what is read back from the state file)
+    """
+
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def EndsWithNewline(filename):
+
+    """
+    A file that is still being written usually ends halfway a line
+    """
+
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+    except OSError:
+        return False
+
+
+def ContentHash(filename):
+    if filename is None:
+        return None
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(hash_block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def IngestRecording(tracks_file, spots_file, hashes, plot_prefix, plot_format, nr_replicates, store_directory,
+                    recording):
+
+    """
+    Convert and analyse one recording, unless its content is the same as when it was analysed before.
+    This runs in a worker process.
+    :param tracks_file:
+    :param spots_file: the spots file, or None
+    :param hashes: the content hashes of the files when they were analysed before, or None
+    :return: (result, hashes), the result is the row of the summary table, its STATUS is 'UNCHANGED' when the
+             content of the files did not change
+    """
+
+    new_hashes = {'tracks': ContentHash(tracks_file), 'spots': ContentHash(spots_file)}
+    if new_hashes == hashes:
+        return {'TRACKS_FILE': tracks_file, 'STATUS': 'UNCHANGED'}, new_hashes
+
+    # Reading the spots once writes the binary cache, so that later work on the spots starts fast
+    if spots_file is not None:
+        log = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(log):
+                ReadSpotsData(spots_file)
+        except SystemExit:
+            lines = log.getvalue().strip().splitlines()
+            return {'TRACKS_FILE': tracks_file, 'SPOTS_FILE': spots_file, 'STATUS': 'FAILED',
+                    'ERROR': lines[-1] if lines else 'Stopped'}, new_hashes
+
+    result = AnalyseRecording(tracks_file, spots_file, plot_prefix, plot_format, nr_replicates, store_directory,
+                              recording)
+    return result, new_hashes
+
+
+def InitialiseWorker(plot_directory, plot_format):
+
+    """
+    Ctrl-C stops the watcher, the workers finish the recording they are busy with
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    SetPlotOutput(plot_directory, plot_format)
+
+
+def JsonValue(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+
+class Watcher:
+
+    """
+    Keeps track of the recordings of an experiment directory, see the description of the module
+    """
+
+    def __init__(self, experiment_directory, plot_format=None, nr_replicates=0, store_directory=None):
+        self.experiment_directory = experiment_directory
+        self.plot_format = plot_format
+        self.nr_replicates = nr_replicates
+        self.store_directory = store_directory
+        self.state_file = os.path.join(experiment_directory, state_filename)
+        self.state = self.LoadState()
+
+        # The recordings that changed, with their file stats and since when they are unchanged
+        self.candidates = {}
+        # The recordings being analysed, with their file stats, per future
+        self.running = {}
+
+    def LoadState(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def SaveState(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f, indent=1, default=JsonValue)
+        os.replace(tmp_file, self.state_file)
+
+    def Scan(self, now, assume_complete=False):
+
+        """
+        :param now: the current time.monotonic()
+        :param assume_complete: if True, files do not have to be unchanged for some time to be complete
+        :return: the list of (tracks file, spots file, file stats) of the recordings that are ready to be handled
+        """
+
+        recordings = FindRecordings(self.experiment_directory)
+        present = {tracks_file for tracks_file, _ in recordings}
+        for tracks_file in list(self.state):
+            if tracks_file not in present:
+                del self.state[tracks_file]
+        for tracks_file in list(self.candidates):
+            if tracks_file not in present:
+                del self.candidates[tracks_file]
+
+        running = {tracks_file for tracks_file, _ in self.running.values()}
+        ready = []
+        for tracks_file, spots_file in recordings:
+            if tracks_file in running:
+                continue
+            stats = {'tracks': FileStat(tracks_file), 'spots': FileStat(spots_file) if spots_file else None}
+            if tracks_file in self.state and self.state[tracks_file]['stats'] == stats:
+                continue
+
+            if not assume_complete:
+                previous = self.candidates.get(tracks_file)
+                if previous is None or previous[0] != stats:
+                    self.candidates[tracks_file] = (stats, now)
+                    continue
+                unchanged = now - previous[1]
+                if unchanged < settle_time or (spots_file is None and unchanged < spots_wait):
+                    continue
+            if not EndsWithNewline(tracks_file) or (spots_file is not None and not EndsWithNewline(spots_file)):
+                continue
+
+            self.candidates.pop(tracks_file, None)
+            ready.append((tracks_file, spots_file, stats))
+        return ready
+
+    def Submit(self, executor, tracks_file, spots_file, stats):
+        recording = RecordingName(self.experiment_directory, tracks_file)
+        plot_prefix = recording if self.plot_format is not None else None
+        hashes = self.state.get(tracks_file, {}).get('hashes')
+        future = executor.submit(IngestRecording, tracks_file, spots_file, hashes, plot_prefix,
+                                 self.plot_format or 'png', self.nr_replicates, self.store_directory, recording)
+        self.running[future] = (tracks_file, stats)
+        print(f'Queued    {tracks_file}')
+
+    def Collect(self):
+
+        """
+        Process the results of the recordings that are finished
+        :return: the number of recordings that are finished
+        """
+
+        finished = [future for future in self.running if future.done()]
+        for future in finished:
+            tracks_file, stats = self.running.pop(future)
+            try:
+                result, hashes = future.result()
+            except Exception as e:
+                # The worker itself failed, i.e. a file could not be hashed, it is tried again when it changes
+                result, hashes = {'TRACKS_FILE': tracks_file, 'STATUS': 'FAILED', 'ERROR': str(e)}, None
+
+            entry = self.state.get(tracks_file)
+            if result['STATUS'] == 'UNCHANGED' and entry is None:
+                # The earlier result went away while this one ran, i.e. the files were briefly gone. The recording
+                # is left out, so that the next scan analyses it as a new one.
+                print(f'Lost      {tracks_file}  analysed again')
+            elif result['STATUS'] == 'UNCHANGED':
+                entry['stats'] = stats
+                print(f'Unchanged {tracks_file}')
+            else:
+                self.state[tracks_file] = {'stats': stats, 'hashes': hashes, 'result': result}
+                report = result['ERROR'] if result['STATUS'] != 'OK' else f"{result['ELAPSED']:.2f} s"
+                print(f"{result['STATUS']:9s} {tracks_file}  {report}")
+
+        if finished:
+            self.SaveState()
+            self.WriteSummary()
+        return len(finished)
+
+    def WriteSummary(self):
+        results = [entry['result'] for entry in self.state.values()]
+        if results:
+            summary = pd.DataFrame(results).sort_values('TRACKS_FILE').reset_index(drop=True)
+            summary.to_csv(os.path.join(self.experiment_directory, summary_filename), index=False)
+
+    def Run(self, workers=None, once=False):
+
+        """
+        Scan and analyse until interrupted, or with once, until the recordings present are done
+        :param workers: the number of worker processes, by default the number of cores
+        :param once: if True, handle the recordings that are present and stop
+        :return: nothing
+        """
+
+        plot_directory = None
+        if self.plot_format is not None:
+            plot_directory = os.path.join(self.experiment_directory, plots_directory)
+
+        print(f'Watching {self.experiment_directory}, {len(self.state)} recordings were analysed before')
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=InitialiseWorker,
+                                       initargs=(plot_directory, self.plot_format or 'png'))
+        try:
+            for tracks_file, spots_file, stats in self.Scan(time.monotonic(), assume_complete=once):
+                self.Submit(executor, tracks_file, spots_file, stats)
+            while not once or self.running:
+                time.sleep(min(poll_interval, 1) if self.running else poll_interval)
+                self.Collect()
+                if not once:
+                    for tracks_file, spots_file, stats in self.Scan(time.monotonic()):
+                        self.Submit(executor, tracks_file, spots_file, stats)
+        except KeyboardInterrupt:
+            print('Stopped, the recordings that were not finished are analysed at the next start')
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyse the TrackMate exports of an experiment as they land')
+    parser.add_argument('experiment_directory')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--plots', choices=['png', 'svg', 'pdf'], default=None,
+                        help='save the duration fit and density map of every recording in this format')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help='determine a 95%% confidence interval for tau with N bootstrap replicates')
+    parser.add_argument('--store', default=None, metavar='DIRECTORY',
+                        help='keep the density map and duration histogram of every recording in this result store')
+    parser.add_argument('--once', action='store_true', help='handle the files present and stop')
+    args = parser.parse_args()
+    Watcher(args.experiment_directory, args.plots, args.bootstrap, args.store).Run(args.workers, args.once)